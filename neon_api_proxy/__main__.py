@@ -25,30 +25,69 @@
 # LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+import asyncio
+import signal
 
+from argparse import ArgumentParser
+from typing import List, Optional
 from ovos_utils import wait_for_exit_signal
 from ovos_utils.log import init_service_logger
 
 from neon_api_proxy.api_connector import NeonAPIMQConnector
+from neon_api_proxy.async_connector import NeonAPIAsyncConnector
 from neon_api_proxy.controller import NeonAPIProxyController
+from neon_api_proxy.metrics import start_metrics_server
 
 init_service_logger("neon-api-proxy")
 
 
-def run_mq_handler():
+def run_mq_handler(use_asyncio: bool = False,
+                   services: Optional[List[str]] = None):
     """
     Start the ProxyController and MQConnector services
+    @param use_asyncio: if True, consume requests and query services on an
+        asyncio event loop instead of worker threads (requires `aiohttp`)
+    @param services: names of services to provide (defaults to all)
     """
-    proxy = NeonAPIProxyController()
+    proxy = NeonAPIProxyController(services=services)
+    if use_asyncio:
+        connector = NeonAPIAsyncConnector(config=None,
+                                          service_name='neon_api_connector',
+                                          proxy=proxy)
+        if connector.metrics_port is not None:
+            start_metrics_server(proxy.get_metrics,
+                                 int(connector.metrics_port))
+        # Runs in this thread, so a failure stops the process
+        asyncio.run(_run_until_exit_signal(connector))
+        return
     connector = NeonAPIMQConnector(config=None,
                                    service_name='neon_api_connector',
                                    proxy=proxy)
     connector.run()
+    if connector.metrics_port is not None:
+        start_metrics_server(proxy.get_metrics, int(connector.metrics_port))
     wait_for_exit_signal()
 
 
+async def _run_until_exit_signal(connector: NeonAPIAsyncConnector):
+    """
+    Runs an asyncio connector until SIGINT or SIGTERM is received
+    @param connector: connector to run on the current event loop
+    """
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, connector.stop)
+    await connector.run_async()
+
+
 def main():
-    run_mq_handler()
+    parser = ArgumentParser(description="Neon API Proxy")
+    parser.add_argument("--asyncio", action="store_true",
+                        help="Handle requests on an asyncio event loop")
+    parser.add_argument("--services", nargs="+", metavar="SERVICE",
+                        help="Names of services to provide (default all)")
+    args = parser.parse_args()
+    run_mq_handler(use_asyncio=args.asyncio, services=args.services)
 
 
 if __name__ == "__main__":
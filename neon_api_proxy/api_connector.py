@@ -28,16 +28,105 @@
 
 import pika.channel
 
-from typing import Optional
+from collections import OrderedDict
+from functools import partial
+from threading import Event, Thread
+from time import sleep, time
+from typing import Any, Callable, Dict, Optional, Tuple
+from weakref import WeakKeyDictionary
 from ovos_utils.log import LOG
-from neon_mq_connector.utils.network_utils import b64_to_dict, dict_to_b64
 from neon_mq_connector.connector import MQConnector
+from neon_mq_connector.consumers import BlockingConsumerThread, \
+    SelectConsumerThread
 
+from neon_api_proxy.client.mq_client import REPLY_QUEUE_PREFIX
 from neon_api_proxy.controller import NeonAPIProxyController
+from neon_api_proxy.worker_pool import PriorityWorkerPool
+from neon_api_proxy.wire_format import MSGPACK_CONTENT_TYPE, \
+    binary_format_available, decode_message, encode_message
+
+# Worker pool priority of each request lane (lower values are handled first)
+PRIORITIES = {"interactive": 0, "background": 1}
+
+# Consistent-hash exchange requests are routed through by cache key
+AFFINITY_EXCHANGE = "neon_api_affinity"
+
+
+class _ReplyChannel:
+    """
+    State of a channel that requests are received and replies are published on
+    """
+    # Max reply queues remembered as declared per channel
+    max_declared_queues = 1024
+
+    def __init__(self, publisher_confirms: bool = False):
+        self.declared_queues = OrderedDict()
+        self.publisher_confirms = publisher_confirms
+        self.publish_count = 0
+        # Publish sequence number to delivery tag of the request it answers
+        self.pending_confirms = OrderedDict()
+
+    def is_declared(self, queue: str) -> bool:
+        if queue in self.declared_queues:
+            self.declared_queues.move_to_end(queue)
+            return True
+        return False
+
+    def add_declared(self, queue: str):
+        self.declared_queues[queue] = True
+        while len(self.declared_queues) > self.max_declared_queues:
+            self.declared_queues.popitem(last=False)
+
+
+class _BlockingAPIConsumer(BlockingConsumerThread):
+    """
+    Blocking consumer that limits unacknowledged requests before it starts
+    consuming, since a prefetch limit only applies to consumers started after
+    it is set
+    """
+    def __init__(self, *args, prefetch_count: int = 50,
+                 queue_arguments: Optional[dict] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefetch_count = prefetch_count
+        self.queue_arguments = queue_arguments
+
+    def _create_connection(self):
+        self.connection = pika.BlockingConnection(self.connection_params)
+        self.channel = self.connection.channel()
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.channel.queue_declare(queue=self.queue, auto_delete=False,
+                                   exclusive=self.queue_exclusive,
+                                   arguments=self.queue_arguments)
+        self.channel.basic_consume(on_message_callback=self.callback_func,
+                                   queue=self.queue, auto_ack=self.auto_ack)
+
+
+class _SelectAPIConsumer(SelectConsumerThread):
+    """
+    Asynchronous consumer that limits unacknowledged requests before it
+    starts consuming
+    """
+    def __init__(self, *args, prefetch_count: int = 50,
+                 queue_arguments: Optional[dict] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefetch_count = prefetch_count
+        self.queue_arguments = queue_arguments
+
+    def declare_queue(self, _unused_frame: Optional[pika.frame.Method] = None):
+        return self.channel.queue_declare(queue=self.queue, auto_delete=False,
+                                          exclusive=self.queue_exclusive,
+                                          arguments=self.queue_arguments,
+                                          callback=self.on_queue_declared)
+
+    def set_qos(self, _unused_frame: Optional[pika.frame.Method] = None):
+        self.channel.basic_qos(prefetch_count=self.prefetch_count,
+                               callback=self.start_consuming)
 
 
 class NeonAPIMQConnector(MQConnector):
     """Adapter for establishing connection between Neon API and MQ broker"""
+    # Milliseconds an unused targeted queue is kept with affinity routing
+    targeted_queue_expires = 10000
 
     def __init__(self, config: Optional[dict], service_name: str,
                  proxy: NeonAPIProxyController):
@@ -51,59 +140,471 @@ class NeonAPIMQConnector(MQConnector):
 
         self.vhost = '/neon_api'
         self.proxy = proxy
+        self._executor = PriorityWorkerPool(
+            max_workers=self.max_workers,
+            thread_name_prefix="neon_api_worker")
+        self._reply_channels = WeakKeyDictionary()
+        # Set once this instance's queue is bound to the affinity exchange
+        self._affinity_bound = Event()
+        self._affinity_routing = False
+
+    @property
+    def targeted_queue(self) -> str:
+        """
+        Queue of requests handled by this instance only
+        """
+        return f'neon_api_input_{self.service_id}'
+
+    @property
+    def targeted_queue_arguments(self) -> Optional[dict]:
+        """
+        Arguments to declare the targeted queue with. With affinity routing,
+        the queue expires once it is unused, which removes it from the
+        affinity exchange if this instance stops. Unlike an exclusive queue,
+        it can be declared again by a reconnecting consumer.
+        """
+        if self._affinity_routing:
+            return {"x-expires": self.targeted_queue_expires}
+        return None
+
+    @property
+    def prefetch_count(self) -> int:
+        """
+        Max unacknowledged requests per consumer, so each consumer only
+        receives as many requests as the worker pool can handle
+        """
+        return self.max_workers
+
+    @property
+    def background_prefetch_count(self) -> int:
+        """
+        Max unacknowledged requests for the background consumer, which limits
+        how many workers background requests can occupy
+        """
+        return self.max_background_workers or max(1, self.max_workers // 4)
 
     def handle_api_input(self,
                          channel: pika.channel.Channel,
                          method: pika.spec.Basic.Deliver,
-                         _: pika.spec.BasicProperties,
+                         properties: pika.spec.BasicProperties,
                          body: bytes):
         """
-            Handles input requests from MQ to Neon API
+            Handles input requests from MQ to Neon API. Requests are resolved
+            in a worker pool so slow APIs do not block the consumer. With
+            affinity routing enabled, requests are forwarded to the instance
+            that caches their response.
 
             :param channel: MQ channel object (pika.channel.Channel)
             :param method: MQ return method (pika.spec.Basic.Deliver)
-            :param _: MQ properties (pika.spec.BasicProperties)
+            :param properties: MQ properties (pika.spec.BasicProperties)
             :param body: request body (bytes)
         """
-        message_id = None
+        if channel not in self._reply_channels:
+            self._init_reply_channel(channel)
+        self._handle_input(channel, method, properties, body, "interactive",
+                           forward=bool(self.affinity_routing))
+
+    def handle_targeted_input(self,
+                              channel: pika.channel.Channel,
+                              method: pika.spec.Basic.Deliver,
+                              properties: pika.spec.BasicProperties,
+                              body: bytes):
+        """
+            Handles input requests addressed to this instance, including
+            requests forwarded by affinity routing. These are never forwarded.
+
+            :param channel: MQ channel object (pika.channel.Channel)
+            :param method: MQ return method (pika.spec.Basic.Deliver)
+            :param properties: MQ properties (pika.spec.BasicProperties)
+            :param body: request body (bytes)
+        """
+        if channel not in self._reply_channels:
+            self._init_reply_channel(channel)
+        self._handle_input(channel, method, properties, body, "interactive")
+
+    def handle_background_input(self,
+                                channel: pika.channel.Channel,
+                                method: pika.spec.Basic.Deliver,
+                                properties: pika.spec.BasicProperties,
+                                body: bytes):
+        """
+            Handles input requests from the background queue. These are
+            scheduled after interactive requests, and fewer are prefetched so
+            they cannot occupy the whole worker pool.
+
+            :param channel: MQ channel object (pika.channel.Channel)
+            :param method: MQ return method (pika.spec.Basic.Deliver)
+            :param properties: MQ properties (pika.spec.BasicProperties)
+            :param body: request body (bytes)
+        """
+        if channel not in self._reply_channels:
+            self._init_reply_channel(channel)
+        self._handle_input(channel, method, properties, body, "background")
+
+    def _handle_input(self, channel: pika.channel.Channel,
+                      method: pika.spec.Basic.Deliver,
+                      properties: pika.spec.BasicProperties, body: bytes,
+                      default_priority: str, forward: bool = False):
+        """
+            Decodes a request and queues it in the worker pool by priority
+
+            :param channel: MQ channel object (pika.channel.Channel)
+            :param method: MQ return method (pika.spec.Basic.Deliver)
+            :param properties: MQ properties (pika.spec.BasicProperties)
+            :param body: request body (bytes)
+            :param default_priority: priority of requests that do not
+                specify one
+            :param forward: if True, forward the request to the instance
+                its affinity key is routed to
+        """
         try:
-            if body and isinstance(body, bytes):
-                request = b64_to_dict(body)
-                tokens = self.extract_agent_tokens(request)
+            if not body or not isinstance(body, bytes):
+                raise TypeError(f'Invalid body received, expected bytes '
+                                f'string; got: {type(body)}')
+            request = decode_message(body,
+                                     getattr(properties, 'content_type', None))
+        except Exception as e:
+            LOG.error(e)
+            self._reject_request(channel, method.delivery_tag)
+            return
+        if forward and self._affinity_bound.is_set():
+            affinity_key = self.proxy.get_affinity_key(request)
+            if affinity_key and self._forward_request(
+                    channel, method, properties, body, affinity_key):
+                return
+        priority = request.pop('priority', None) or default_priority
+        self._schedule_request(channel, method, request,
+                               self._get_response_content_type(properties),
+                               PRIORITIES.get(priority,
+                                              PRIORITIES[default_priority]))
 
-                message_id = tokens.pop('message_id', request.get("message_id",
-                                                                  None))
-                LOG.info(f"request={request}")
+    def _schedule_request(self, channel: pika.channel.Channel,
+                          method: pika.spec.Basic.Deliver, request: dict,
+                          response_type: Optional[str], priority: int):
+        """
+            Queues a decoded request to be resolved in the worker pool
 
-                respond = self.proxy.resolve_query(request)
-                LOG.debug(f"response message={message_id} "
-                          f"status={respond.get('status_code')}")
-
-                try:
-                    respond['content'] = bytes(respond.get('content', b'')).\
-                        decode(encoding='utf-8')
-                except Exception as e:
-                    LOG.error(e)
-                respond = {**respond, **tokens}
-                LOG.debug(f"respond={respond}")
-                data = dict_to_b64(respond)
+            :param channel: MQ channel the request was received on
+            :param method: MQ return method (pika.spec.Basic.Deliver)
+            :param request: decoded request
+            :param response_type: content type to publish the response with
+            :param priority: worker pool priority of the request
+        """
+        self._executor.submit(self._process_api_input, channel, method,
+                              request, response_type, priority=priority)
+
+    def _forward_request(self, channel: pika.channel.Channel,
+                         method: pika.spec.Basic.Deliver,
+                         properties: pika.spec.BasicProperties, body: bytes,
+                         affinity_key: str) -> bool:
+        """
+            Publishes a request to the affinity exchange and acknowledges it.
+            Must be called on the thread that owns the channel's connection.
+
+            :param channel: MQ channel the request was received on
+            :param method: MQ return method (pika.spec.Basic.Deliver)
+            :param properties: MQ properties of the request
+            :param body: request body (bytes)
+            :param affinity_key: key to route the request by
+            :return: True if the request was forwarded
+        """
+        reply_channel = self._reply_channels.get(channel) or _ReplyChannel()
+        try:
+            channel.basic_publish(exchange=AFFINITY_EXCHANGE,
+                                  routing_key=affinity_key, body=body,
+                                  properties=properties)
+        except Exception as e:
+            LOG.error(f"Failed to forward request {affinity_key}: {e}")
+            return False
+        self._ack_published(channel, reply_channel, method.delivery_tag)
+        return True
 
+    @staticmethod
+    def _get_response_content_type(
+            properties: pika.spec.BasicProperties) -> Optional[str]:
+        """
+            Negotiates the wire format of a response. The binary format is
+            used if the request used it or lists it in an `accept` header.
+
+            :param properties: MQ properties of the request
+            :return: content type of the response (None for base64 JSON)
+        """
+        accepted = (getattr(properties, 'content_type', None),
+                    (getattr(properties, 'headers', None) or {}).get('accept'))
+        if MSGPACK_CONTENT_TYPE in accepted and binary_format_available():
+            return MSGPACK_CONTENT_TYPE
+        return None
+
+    def _init_reply_channel(self, channel: pika.channel.Channel):
+        """
+            Configures a channel when its first request is received
+
+            :param channel: MQ channel object
+        """
+        publisher_confirms = False
+        if self.publisher_confirms:
+            if isinstance(channel, pika.channel.Channel):
+                channel.confirm_delivery(partial(self._on_publish_confirm,
+                                                 channel))
+                publisher_confirms = True
+            else:
+                # Blocking channels wait for each confirm when publishing
+                LOG.warning("Publisher confirms require asynchronous "
+                            "consumers; replies will not be confirmed")
+        self._reply_channels[channel] = _ReplyChannel(publisher_confirms)
+
+    @staticmethod
+    def _run_threadsafe(channel: pika.channel.Channel, callback: Callable):
+        """
+            Schedules a callback on the thread that owns the channel's
+            connection, since pika channels are not thread-safe
+
+            :param channel: MQ channel object
+            :param callback: method to call on the connection's thread
+        """
+        connection = channel.connection
+        if hasattr(connection, 'add_callback_threadsafe'):
+            # BlockingConnection
+            connection.add_callback_threadsafe(callback)
+        else:
+            # SelectConnection
+            connection.ioloop.add_callback_threadsafe(callback)
+
+    def _process_api_input(self, channel: pika.channel.Channel,
+                           method: pika.spec.Basic.Deliver, request: dict,
+                           response_type: Optional[str] = None):
+        """
+            Resolves a request and schedules publishing its response
+
+            :param channel: MQ channel the request was received on
+            :param method: MQ return method (pika.spec.Basic.Deliver)
+            :param request: decoded request
+            :param response_type: content type to publish the response with
+        """
+        message_id = None
+        try:
+            if request:
+                tokens, message_id = self._prepare_request(request)
+                deadline = request.get('deadline')
+                if self._drop_expired(request, message_id):
+                    self._run_threadsafe(channel, partial(
+                        channel.basic_ack, method.delivery_tag))
+                    return
+
+                respond = self.proxy.resolve_query(request)
+                data = self._encode_response(respond, tokens, response_type,
+                                             message_id)
                 routing_key = request.get('routing_key', 'neon_api_output')
-                # queue declare is idempotent, just making sure queue exists
-                channel.queue_declare(queue=routing_key)
-                channel.basic_publish(
-                    exchange='',
-                    routing_key=routing_key,
-                    body=data,
-                    properties=pika.BasicProperties(expiration='1000')
-                )
-                channel.basic_ack(method.delivery_tag)
+                self._run_threadsafe(channel, partial(
+                    self._publish_response, channel, method.delivery_tag,
+                    routing_key, data, response_type,
+                    self._get_reply_expiration(deadline)))
             else:
-                raise TypeError(f'Invalid body received, expected bytes string;'
-                                f' got: {type(body)}')
+                raise ValueError('Empty request received')
         except Exception as e:
             LOG.error(f"message_id={message_id}")
             LOG.error(e)
+            self._run_threadsafe(channel, partial(
+                self._reject_request, channel, method.delivery_tag))
+
+    def _prepare_request(self, request: dict) -> Tuple[dict, Any]:
+        """
+            Removes agent tokens from a request
+
+            :param request: decoded request
+            :return: agent tokens and message_id of the request
+        """
+        tokens = self.extract_agent_tokens(request)
+        message_id = tokens.pop('message_id', request.get("message_id", None))
+        LOG.info(f"request={request}")
+        return tokens, message_id
+
+    def _drop_expired(self, request: dict, message_id: Any) -> bool:
+        """
+            Checks if the requester already stopped waiting for a response,
+            so the upstream work can be skipped
+
+            :param request: decoded request
+            :param message_id: message_id of the request
+            :return: True if the request should be acknowledged and dropped
+        """
+        deadline = request.get('deadline')
+        if deadline is not None and float(deadline) <= time():
+            LOG.info(f"Dropping expired request: {message_id}")
+            self.proxy.record_expired(request.get('service'))
+            return True
+        return False
+
+    @staticmethod
+    def _encode_response(respond: dict, tokens: dict,
+                         response_type: Optional[str],
+                         message_id: Any = None) -> bytes:
+        """
+            Serializes a response to publish
+
+            :param respond: response from the proxy
+            :param tokens: agent tokens of the request
+            :param response_type: content type to serialize with
+            :param message_id: message_id of the request
+            :return: serialized response
+        """
+        LOG.debug(f"response message={message_id} "
+                  f"status={respond.get('status_code')}")
+        if response_type != MSGPACK_CONTENT_TYPE:
+            # Binary responses keep content as bytes
+            if 'responses' in respond:
+                for item in respond['responses']:
+                    if 'content' in item:
+                        NeonAPIMQConnector._decode_content(item)
+            else:
+                NeonAPIMQConnector._decode_content(respond)
+        respond = {**respond, **tokens}
+        LOG.debug(f"respond={respond}")
+        return encode_message(respond, response_type)
+
+    @staticmethod
+    def _decode_content(respond: dict):
+        """
+            Decodes response content to a string in place
+
+            :param respond: response with bytes content
+        """
+        try:
+            respond['content'] = \
+                bytes(respond.get('content', b'')).decode(encoding='utf-8')
+        except Exception as e:
+            LOG.error(e)
+
+    @staticmethod
+    def _get_reply_expiration(deadline: Optional[float] = None) -> str:
+        """
+            Gets the time a response stays queued for the requester
+
+            :param deadline: epoch seconds the requester stops waiting at
+            :return: message expiration in milliseconds
+        """
+        if deadline is None:
+            return '1000'
+        return str(max(1000, int((float(deadline) - time()) * 1000)))
+
+    def _publish_response(self, channel: pika.channel.Channel,
+                          delivery_tag: int, routing_key: str, data: bytes,
+                          content_type: Optional[str] = None,
+                          expiration: str = '1000'):
+        """
+            Publishes a response and acknowledges its request, or waits for
+            the broker to confirm the response if publisher confirms are
+            enabled. Must be called on the thread that owns the channel's
+            connection.
+
+            :param channel: MQ channel the request was received on
+            :param delivery_tag: delivery tag of the request to acknowledge
+            :param routing_key: queue to publish the response to
+            :param data: serialized response
+            :param content_type: content type of the serialized response
+            :param expiration: time in milliseconds the response stays queued
+        """
+        reply_channel = self._reply_channels.get(channel) or _ReplyChannel()
+        try:
+            if not routing_key.startswith(REPLY_QUEUE_PREFIX) and \
+                    not reply_channel.is_declared(routing_key):
+                # Make sure the queue exists once per channel. Client reply
+                # queues are declared by the client with an expiration.
+                channel.queue_declare(queue=routing_key)
+                reply_channel.add_declared(routing_key)
+            channel.basic_publish(
+                exchange='',
+                routing_key=routing_key,
+                body=data,
+                properties=pika.BasicProperties(expiration=expiration,
+                                                content_type=content_type)
+            )
+            self._ack_published(channel, reply_channel, delivery_tag)
+        except Exception as e:
+            LOG.error(f"Failed to publish response to {routing_key}: {e}")
+            self._reject_request(channel, delivery_tag)
+
+    @staticmethod
+    def _reject_request(channel: pika.channel.Channel, delivery_tag: int):
+        """
+            Rejects a request that could not be handled without requeueing
+            it, so it does not hold a prefetch slot. Must be called on the
+            thread that owns the channel's connection.
+
+            :param channel: MQ channel the request was received on
+            :param delivery_tag: delivery tag of the request to reject
+        """
+        try:
+            channel.basic_nack(delivery_tag, requeue=False)
+        except Exception as e:
+            LOG.error(f"Failed to reject request {delivery_tag}: {e}")
+
+    @staticmethod
+    def _ack_published(channel: pika.channel.Channel,
+                       reply_channel: _ReplyChannel, delivery_tag: int):
+        """
+            Acknowledges a request after publishing on its channel, or waits
+            for the broker to confirm the publish if confirms are enabled
+
+            :param channel: MQ channel the request was received on
+            :param reply_channel: state of the channel
+            :param delivery_tag: delivery tag of the request to acknowledge
+        """
+        if reply_channel.publisher_confirms:
+            reply_channel.publish_count += 1
+            reply_channel.pending_confirms[reply_channel.publish_count] = \
+                delivery_tag
+        else:
+            channel.basic_ack(delivery_tag)
+
+    def _on_publish_confirm(self, channel: pika.channel.Channel,
+                            frame: pika.frame.Method):
+        """
+            Acknowledges requests whose responses the broker confirmed, or
+            requeues requests whose responses were rejected. One confirm may
+            cover multiple responses.
+
+            :param channel: MQ channel the responses were published on
+            :param frame: Basic.Ack or Basic.Nack from the broker
+        """
+        reply_channel = self._reply_channels.get(channel)
+        if not reply_channel:
+            return
+        pending = reply_channel.pending_confirms
+        confirmed_tag = frame.method.delivery_tag
+        if frame.method.multiple:
+            confirmed = [tag for tag in pending if tag <= confirmed_tag]
+        else:
+            confirmed = [confirmed_tag]
+        is_ack = isinstance(frame.method, pika.spec.Basic.Ack)
+        for publish_tag in confirmed:
+            delivery_tag = pending.pop(publish_tag, None)
+            if delivery_tag is None:
+                continue
+            if is_ack:
+                channel.basic_ack(delivery_tag)
+            else:
+                LOG.warning(f"Response rejected by broker; requeueing "
+                            f"request {delivery_tag}")
+                channel.basic_nack(delivery_tag, requeue=True)
+
+    @property
+    def service_configurable_properties(self) -> Dict[str, Any]:
+        return {
+            # Port to serve Prometheus metrics on (None to disable)
+            'metrics_port': None,
+            # Max requests resolved concurrently
+            'max_workers': 32,
+            # Acknowledge requests after the broker confirms their responses
+            'publisher_confirms': False,
+            # Max background requests handled concurrently (None for 1/4 of
+            # `max_workers`)
+            'max_background_workers': None,
+            # Route requests to the instance caching their response through
+            # a consistent-hash exchange (requires the
+            # `rabbitmq_consistent_hash_exchange` plugin)
+            'affinity_routing': False,
+        }
 
     @staticmethod
     def extract_agent_tokens(msg_data: dict) -> dict:
@@ -124,6 +625,19 @@ class NeonAPIMQConnector(MQConnector):
             LOG.debug('No valid agent specified in the message data')
         return tokens
 
+    @property
+    def consumer_thread_cls(self):
+        if self.async_consumers_enabled:
+            return _SelectAPIConsumer
+        return _BlockingAPIConsumer
+
+    def run(self, run_consumers: bool = True, run_sync: bool = True,
+            run_observer: Optional[bool] = None, **kwargs):
+        if run_observer is None:
+            # MQConnector only observes its own blocking consumer class
+            run_observer = self.consumer_thread_cls is _BlockingAPIConsumer
+        super().run(run_consumers, run_sync, run_observer, **kwargs)
+
     def handle_error(self, thread, exception):
         LOG.error(f"{exception} occurred in {thread}")
         LOG.info(f"Restarting Consumers")
@@ -131,10 +645,110 @@ class NeonAPIMQConnector(MQConnector):
         self.run()
 
     def pre_run(self, **kwargs):
-        self.register_consumer("neon_api_consumer", self.vhost,
-                               'neon_api_input', self.handle_api_input,
+        self._affinity_bound.clear()
+        self._affinity_routing = bool(self.affinity_routing) and \
+            self._declare_affinity_exchange()
+        self._register_request_consumer("neon_api_consumer",
+                                        'neon_api_input',
+                                        self.handle_api_input,
+                                        self.prefetch_count)
+        self._register_request_consumer(
+            "neon_api_consumer_targeted", self.targeted_queue,
+            self.handle_targeted_input, self.prefetch_count,
+            queue_arguments=self.targeted_queue_arguments)
+        self._register_request_consumer("neon_api_consumer_background",
+                                        'neon_api_input_background',
+                                        self.handle_background_input,
+                                        self.background_prefetch_count)
+
+    def _register_request_consumer(self, name: str, queue: str,
+                                   callback: Callable, prefetch_count: int,
+                                   queue_arguments: Optional[dict] = None):
+        """
+            Registers a consumer of requests that limits how many requests it
+            receives before they are acknowledged
+
+            :param name: name of the consumer
+            :param queue: queue to consume requests from
+            :param callback: method to handle requests with
+            :param prefetch_count: max unacknowledged requests
+            :param queue_arguments: optional arguments to declare the queue
+                with
+        """
+        self.register_consumer(name, self.vhost, queue, callback,
                                auto_ack=False)
-        self.register_consumer("neon_api_consumer_targeted",
-                               self.vhost,
-                               f'neon_api_input_{self.service_id}',
-                               self.handle_api_input, auto_ack=False)
+        properties = self.consumer_properties[name]['properties']
+        # Kept with the properties so restarted consumers use them too
+        properties['prefetch_count'] = prefetch_count
+        properties['queue_arguments'] = queue_arguments
+        self.consumers[name] = self.consumer_thread_cls(**properties)
+
+    def post_run(self, **kwargs):
+        if self._affinity_routing:
+            Thread(target=self._bind_affinity_queue, daemon=True).start()
+
+    def _declare_affinity_exchange(self) -> bool:
+        """
+            Declares the consistent-hash exchange used for affinity routing
+
+            :return: True if the exchange is available
+        """
+        try:
+            connection = self.create_mq_connection(self.vhost)
+            try:
+                connection.channel().exchange_declare(
+                    exchange=AFFINITY_EXCHANGE,
+                    exchange_type="x-consistent-hash")
+            finally:
+                if connection.is_open:
+                    connection.close()
+            return True
+        except Exception as e:
+            LOG.error(f"Affinity routing disabled; failed to declare "
+                      f"{AFFINITY_EXCHANGE}: {e}")
+            return False
+
+    def _bind_affinity_queue(self, timeout: float = 30):
+        """
+            Binds the targeted queue to the affinity exchange once its
+            consumer is running, on the consumer's own connection.
+
+            :param timeout: max seconds to wait for the consumer
+        """
+        end = time() + timeout
+        while time() < end:
+            consumer = self.consumers.get("neon_api_consumer_targeted")
+            if consumer and consumer.is_consuming and consumer.channel:
+                break
+            sleep(0.1)
+        else:
+            LOG.error("Targeted consumer not running; requests will not be "
+                      "routed to this instance")
+            return
+        self._run_threadsafe(consumer.channel,
+                             partial(self._on_affinity_channel,
+                                     consumer.channel))
+
+    def _on_affinity_channel(self, channel: pika.channel.Channel):
+        """
+            Binds the targeted queue to the affinity exchange. Must be called
+            on the thread that owns the channel's connection.
+
+            :param channel: MQ channel of the targeted consumer
+        """
+        # Binding weight; each instance is assigned an equal share of keys
+        weight = "1"
+        try:
+            if isinstance(channel, pika.channel.Channel):
+                channel.queue_bind(
+                    queue=self.targeted_queue, exchange=AFFINITY_EXCHANGE,
+                    routing_key=weight,
+                    callback=lambda _: self._affinity_bound.set())
+            else:
+                channel.queue_bind(queue=self.targeted_queue,
+                                   exchange=AFFINITY_EXCHANGE,
+                                   routing_key=weight)
+                self._affinity_bound.set()
+        except Exception as e:
+            LOG.error(f"Failed to bind {self.targeted_queue} to "
+                      f"{AFFINITY_EXCHANGE}: {e}")
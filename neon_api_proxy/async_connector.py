@@ -0,0 +1,276 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import asyncio
+import pika.channel
+
+from typing import Any, Dict, Optional
+from ovos_utils.log import LOG
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+from neon_api_proxy.api_connector import AFFINITY_EXCHANGE, \
+    NeonAPIMQConnector
+
+
+class NeonAPIAsyncConnector(NeonAPIMQConnector):
+    """
+    Adapter between Neon API and MQ broker running on an asyncio event loop.
+    Requests are resolved as tasks on the loop with asynchronous HTTP
+    requests, so many slow upstream requests do not each need a thread.
+    """
+    # Seconds to wait for the broker to reply while setting up consumers
+    setup_timeout = 30
+    # Seconds to wait before reconnecting after the connection is lost
+    reconnect_seconds = 5
+
+    def __init__(self, config: Optional[dict], service_name: str, proxy):
+        """
+            :param config: dictionary containing MQ configuration data
+            :param service_name: name of the service instance
+            :param proxy: NeonAPIProxyController to resolve requests with
+        """
+        super().__init__(config, service_name, proxy)
+        self._loop = None
+        self._connection = None
+        self._stopping = False
+        self._tasks = set()
+
+    @property
+    def prefetch_count(self) -> int:
+        """
+        Max unacknowledged requests per consumer, which limits how many
+        requests are resolved concurrently
+        """
+        return self.max_async_requests
+
+    @property
+    def background_prefetch_count(self) -> int:
+        """
+        Max unacknowledged requests for the background consumer
+        """
+        return self.max_background_workers or \
+            max(1, self.max_async_requests // 4)
+
+    @property
+    def service_configurable_properties(self) -> Dict[str, Any]:
+        return {
+            **super().service_configurable_properties,
+            # Max requests resolved concurrently on the event loop
+            'max_async_requests': 256,
+        }
+
+    async def run_async(self):
+        """
+            Consumes requests until `stop` is called, reconnecting if the
+            connection to MQ is lost
+        """
+        self._loop = asyncio.get_event_loop()
+        self._stopping = False
+        self._affinity_routing = bool(self.affinity_routing)
+        while not self._stopping:
+            try:
+                await self._consume()
+            except Exception as e:
+                LOG.error(f"MQ connection failed: {e}")
+            if not self._stopping:
+                await asyncio.sleep(self.reconnect_seconds)
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=self.setup_timeout)
+        for service in self.proxy.service_instance_mapping.loaded().values():
+            if hasattr(service, "close_async"):
+                await service.close_async()
+
+    def stop(self):
+        """
+            Stops consuming requests. May be called from any thread.
+        """
+        self._stopping = True
+        if self._loop and self._connection:
+            self._loop.call_soon_threadsafe(self._close_connection)
+        LOG.info(f"Stopped Connector {self.service_name}")
+
+    def _close_connection(self):
+        if self._connection and \
+                not (self._connection.is_closing or self._connection.is_closed):
+            self._connection.close()
+
+    async def _consume(self):
+        """
+            Connects to MQ and consumes requests until the connection closes
+        """
+        closed = self._loop.create_future()
+        opened = self._loop.create_future()
+
+        def _on_open(connection):
+            if not opened.done():
+                opened.set_result(connection)
+
+        def _on_open_error(_, error):
+            if not opened.done():
+                opened.set_exception(ConnectionError(error))
+
+        def _on_close(_, reason):
+            LOG.info(f"MQ connection closed: {reason}")
+            if not closed.done():
+                closed.set_result(reason)
+            _on_open_error(_, reason)
+
+        self._connection = AsyncioConnection(
+            self.get_connection_params(self.vhost),
+            on_open_callback=_on_open,
+            on_open_error_callback=_on_open_error,
+            on_close_callback=_on_close, custom_ioloop=self._loop)
+        try:
+            await asyncio.wait_for(opened, self.setup_timeout)
+            await self._declare_consumers(self._connection)
+            LOG.info(f"Consuming requests on {self.vhost}")
+            await closed
+        finally:
+            self._affinity_bound.clear()
+            self._close_connection()
+
+    async def _declare_consumers(self, connection: AsyncioConnection):
+        """
+            Declares request queues and starts consuming them, each on its
+            own channel
+
+            :param connection: open MQ connection
+        """
+        if self._affinity_routing:
+            channel = await self._open_channel(connection)
+            try:
+                await self._call(channel.exchange_declare,
+                                 exchange=AFFINITY_EXCHANGE,
+                                 exchange_type="x-consistent-hash")
+                channel.close()
+            except Exception as e:
+                # Declaring an unsupported exchange type closes the connection
+                LOG.error(f"Affinity routing disabled; failed to declare "
+                          f"{AFFINITY_EXCHANGE}: {e}")
+                self._affinity_routing = False
+                raise
+        consumers = (
+            ('neon_api_input', self.handle_api_input, self.prefetch_count,
+             None),
+            (self.targeted_queue, self.handle_targeted_input,
+             self.prefetch_count, self.targeted_queue_arguments),
+            ('neon_api_input_background', self.handle_background_input,
+             self.background_prefetch_count, None))
+        for queue, callback, prefetch_count, arguments in consumers:
+            channel = await self._open_channel(connection)
+            # Applies to the consumer started on this channel below
+            channel.basic_qos(prefetch_count=prefetch_count)
+            self._init_reply_channel(channel)
+            await self._call(channel.queue_declare, queue=queue,
+                             arguments=arguments)
+            if queue == self.targeted_queue and self._affinity_routing:
+                # Binding weight; each instance is assigned an equal share
+                await self._call(channel.queue_bind, queue=queue,
+                                 exchange=AFFINITY_EXCHANGE, routing_key="1")
+                self._affinity_bound.set()
+            channel.basic_consume(queue=queue, on_message_callback=callback)
+
+    async def _open_channel(self, connection: AsyncioConnection) -> \
+            pika.channel.Channel:
+        """
+            Opens a channel on a connection
+
+            :param connection: open MQ connection
+            :return: open channel
+        """
+        future = self._loop.create_future()
+        connection.channel(on_open_callback=future.set_result)
+        return await asyncio.wait_for(future, self.setup_timeout)
+
+    async def _call(self, method, **kwargs):
+        """
+            Calls an asynchronous pika channel method and waits for the
+            broker's reply
+
+            :param method: channel method accepting a `callback`
+            :param kwargs: arguments to the method
+            :return: reply frame from the broker
+        """
+        future = self._loop.create_future()
+        method(callback=lambda frame: future.done() or
+               future.set_result(frame), **kwargs)
+        return await asyncio.wait_for(future, self.setup_timeout)
+
+    def _schedule_request(self, channel: pika.channel.Channel,
+                          method: pika.spec.Basic.Deliver, request: dict,
+                          response_type: Optional[str], priority: int):
+        """
+            Resolves a decoded request in a task on the event loop. Background
+            requests are limited by their consumer's prefetch count instead
+            of being prioritized.
+
+            :param channel: MQ channel the request was received on
+            :param method: MQ return method (pika.spec.Basic.Deliver)
+            :param request: decoded request
+            :param response_type: content type to publish the response with
+            :param priority: worker pool priority of the request (unused)
+        """
+        task = self._loop.create_task(self._process_api_input_async(
+            channel, method, request, response_type))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process_api_input_async(self, channel: pika.channel.Channel,
+                                       method: pika.spec.Basic.Deliver,
+                                       request: dict,
+                                       response_type: Optional[str] = None):
+        """
+            Resolves a request and publishes its response
+
+            :param channel: MQ channel the request was received on
+            :param method: MQ return method (pika.spec.Basic.Deliver)
+            :param request: decoded request
+            :param response_type: content type to publish the response with
+        """
+        message_id = None
+        try:
+            if not request:
+                raise ValueError('Empty request received')
+            tokens, message_id = self._prepare_request(request)
+            deadline = request.get('deadline')
+            if self._drop_expired(request, message_id):
+                channel.basic_ack(method.delivery_tag)
+                return
+
+            respond = await self.proxy.resolve_query_async(request)
+            data = self._encode_response(respond, tokens, response_type,
+                                         message_id)
+            self._publish_response(channel, method.delivery_tag,
+                                   request.get('routing_key',
+                                               'neon_api_output'),
+                                   data, response_type,
+                                   self._get_reply_expiration(deadline))
+        except Exception as e:
+            LOG.error(f"message_id={message_id}")
+            LOG.error(e)
+            self._reject_request(channel, method.delivery_tag)
@@ -0,0 +1,85 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from threading import BoundedSemaphore, Lock
+from typing import Optional
+
+
+class Bulkhead:
+    """
+    Limits concurrent requests to a service. Requests over the limit wait in a
+    bounded queue and are rejected when the queue is full, so one slow service
+    cannot occupy every worker.
+    """
+    def __init__(self, max_concurrent: int, max_queued: Optional[int] = None,
+                 queue_timeout: float = 10):
+        """
+        @param max_concurrent: max requests handled at once
+        @param max_queued: max requests waiting to be handled
+            (defaults to `max_concurrent`)
+        @param queue_timeout: max seconds a request waits to be handled
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_concurrent if max_queued is None else max_queued
+        self.queue_timeout = queue_timeout
+        self.queued = 0
+        self._semaphore = BoundedSemaphore(max_concurrent)
+        self._lock = Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a slot to handle a request
+        @param timeout: max seconds to wait, if less than `queue_timeout`
+        @return: True if the request may be handled, False if it is rejected
+        """
+        if self.try_acquire():
+            return True
+        with self._lock:
+            if self.queued >= self.max_queued:
+                return False
+            self.queued += 1
+        try:
+            queue_timeout = self.queue_timeout if timeout is None else \
+                max(min(timeout, self.queue_timeout), 0)
+            return self._semaphore.acquire(timeout=queue_timeout)
+        finally:
+            with self._lock:
+                self.queued -= 1
+
+    def try_acquire(self) -> bool:
+        """
+        Take a slot to handle a request only if one is free
+        @return: True if the request may be handled now
+        """
+        return self._semaphore.acquire(blocking=False)
+
+    def release(self):
+        """
+        Release a slot acquired with `acquire`
+        """
+        self._semaphore.release()
@@ -0,0 +1,332 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import bz2
+import gzip
+import lzma
+import sqlite3
+import zlib
+
+from collections import OrderedDict
+from copy import copy
+from datetime import datetime, timezone
+from threading import RLock
+from typing import Optional
+from attr import define, field
+from requests_cache import CachedResponse
+from requests_cache.backends import BaseCache, BaseStorage, SQLiteCache
+from requests_cache.backends.sqlite import SQLitePickleDict
+
+# Mapping of algorithm name to (compress, decompress) methods
+COMPRESSION_ALGORITHMS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "gzip": (gzip.compress, gzip.decompress),
+    "bz2": (bz2.compress, bz2.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+@define(auto_attribs=False, slots=False)
+class CompressedCachedResponse(CachedResponse):
+    """
+    Cached response with a compressed body that is only decompressed when
+    `content` is accessed
+    """
+    compressed_content: Optional[bytes] = field(default=None)
+    compression: Optional[str] = field(default=None)
+
+    @classmethod
+    def compress(cls, response: CachedResponse,
+                 algorithm: str) -> CachedResponse:
+        """
+        Compress the body of a cached response
+        @param response: response to compress
+        @param algorithm: key in `COMPRESSION_ALGORITHMS`
+        @return: compressed response, or the original response if
+            compression does not reduce its size
+        """
+        content = response.content or b''
+        compressed = COMPRESSION_ALGORITHMS[algorithm][0](content)
+        if len(compressed) >= len(content):
+            return response
+        compressed_response = cls.__new__(cls)
+        compressed_response.__dict__.update(response.__dict__)
+        compressed_response.compressed_content = compressed
+        compressed_response.compression = algorithm
+        return compressed_response.copy()
+
+    def copy(self) -> 'CompressedCachedResponse':
+        """
+        Get a copy of this response without any decompressed content, so
+        reading the copy does not change the size of this response
+        """
+        response = copy(self)
+        response._content = None
+        response.raw = copy(self.raw)
+        response.raw.set_content(b'')
+        return response
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None and self.compressed_content is not None:
+            decompress = COMPRESSION_ALGORITHMS[self.compression][1]
+            self._content = decompress(self.compressed_content)
+            self.raw.set_content(self._content)
+        return self._content
+
+
+class LRUDict(BaseStorage):
+    """
+    In-memory response storage bounded by entry count and/or size in bytes.
+    The least recently used responses are evicted first. Response bodies may
+    optionally be stored compressed.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 compression: Optional[str] = None,
+                 compress_min_bytes: int = 1024, **kwargs):
+        """
+        @param max_entries: maximum number of responses to keep
+        @param max_bytes: maximum approximate size of stored responses
+        @param compression: algorithm to compress response bodies with
+        @param compress_min_bytes: minimum size of a body to compress
+        """
+        super().__init__(**kwargs)
+        if compression and compression not in COMPRESSION_ALGORITHMS:
+            raise ValueError(f"Unsupported compression: {compression}")
+        self._serializer = None
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.compress_min_bytes = compress_min_bytes
+        self._data = OrderedDict()
+        self._sizes = dict()
+        self._lock = RLock()
+        self.size_bytes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _get_size(value) -> int:
+        """
+        Estimate the memory used by a stored response
+        @param value: object to be stored
+        @return: approximate size in bytes
+        """
+        if isinstance(value, CompressedCachedResponse):
+            return len(value.compressed_content) + len(value.url or '') + \
+                sum(len(k) + len(v) for k, v in value.headers.items())
+        if isinstance(value, CachedResponse):
+            return value.size + len(value.url or '') + \
+                sum(len(k) + len(v) for k, v in value.headers.items())
+        if isinstance(value, (bytes, str)):
+            return len(value)
+        return 0
+
+    def touch(self, key: str):
+        """
+        Mark the specified key as most recently used
+        @param key: key to move to the end of the eviction order
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+
+    def _evict(self):
+        while self._data and \
+                ((self.max_entries and len(self._data) > self.max_entries) or
+                 (self.max_bytes and self.size_bytes > self.max_bytes)):
+            key, _ = self._data.popitem(last=False)
+            self.size_bytes -= self._sizes.pop(key, 0)
+            self.evictions += 1
+
+    def __getitem__(self, key):
+        item = self._data[key]
+        if getattr(item, 'raw', None):
+            # Content was already read from the in-memory response
+            item.raw.reset()
+        return item
+
+    def _compress(self, value):
+        """
+        Get the representation of a response to store
+        @param value: object to be stored
+        @return: object to store, with its body compressed if configured
+        """
+        if isinstance(value, CompressedCachedResponse):
+            # Drop any content decompressed from an existing entry
+            return value.copy() if value._content is not None else value
+        if self.compression and isinstance(value, CachedResponse) and \
+                value.size >= self.compress_min_bytes:
+            return CompressedCachedResponse.compress(value, self.compression)
+        return value
+
+    def __setitem__(self, key, value):
+        value = self._compress(value)
+        size = self._get_size(value)
+        with self._lock:
+            if key in self._data:
+                self.size_bytes -= self._sizes.pop(key, 0)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._sizes[key] = size
+            self.size_bytes += size
+            self._evict()
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+            self.size_bytes -= self._sizes.pop(key, 0)
+
+    def __iter__(self):
+        with self._lock:
+            keys = list(self._data.keys())
+        return iter(keys)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.size_bytes = 0
+
+
+class LRUMemoryCache(BaseCache):
+    """
+    Non-persistent cache backend with bounded memory usage
+    """
+
+    def __init__(self, cache_name: str = 'http_cache',
+                 max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 compression: Optional[str] = None,
+                 compress_min_bytes: int = 1024, **kwargs):
+        super().__init__(cache_name=cache_name, **kwargs)
+        self.responses: LRUDict = LRUDict(max_entries, max_bytes,
+                                          compression, compress_min_bytes)
+
+    def get_response(self, key: str, default=None) -> \
+            Optional[CachedResponse]:
+        response = super().get_response(key, default)
+        if response is not default:
+            self.responses.touch(key)
+            if isinstance(response, CompressedCachedResponse):
+                # Decompress into a copy so the stored entry stays small
+                response = response.copy()
+        return response
+
+    def save_response(self, response, cache_key: str = None, expires=None):
+        super().save_response(response, cache_key, expires)
+        if self.redirects and len(self.redirects) > len(self.responses):
+            # Drop redirects pointing at evicted responses
+            self._prune_redirects()
+
+
+def _to_timestamp(expires: Optional[datetime]) -> Optional[float]:
+    """
+    Convert a naive UTC expiration time to a POSIX timestamp
+    @param expires: expiration time of a response
+    @return: seconds since the epoch, or None if the response never expires
+    """
+    if expires is None:
+        return None
+    return expires.replace(tzinfo=timezone.utc).timestamp()
+
+
+class ExpiringSQLiteDict(SQLitePickleDict):
+    """
+    SQLite response storage that also records when each response expires in
+    an indexed column, so expired responses can be removed without reading
+    every stored response
+    """
+
+    def init_db(self):
+        super().init_db()
+        with self._lock, self.connection(commit=True) as con:
+            columns = [row[1] for row in con.execute(
+                f'PRAGMA table_info({self.table_name})')]
+            if 'expires' not in columns:
+                try:
+                    con.execute(f'ALTER TABLE {self.table_name} '
+                                f'ADD COLUMN expires REAL')
+                except sqlite3.OperationalError:
+                    # Another process sharing the database added it first
+                    pass
+            con.execute(f'CREATE INDEX IF NOT EXISTS '
+                        f'{self.table_name}_expires '
+                        f'ON {self.table_name} (expires)')
+
+    def __setitem__(self, key, value):
+        expires = _to_timestamp(getattr(value, 'expires', None))
+        serialized_value = self.serializer.dumps(value)
+        if isinstance(serialized_value, bytes):
+            serialized_value = sqlite3.Binary(serialized_value)
+        with self.connection(commit=True) as con:
+            con.execute(f'INSERT OR REPLACE INTO {self.table_name} '
+                        f'(key,value,expires) VALUES (?,?,?)',
+                        (key, serialized_value, expires))
+
+    def delete_expired(self, cutoff: datetime) -> int:
+        """
+        Remove responses that expired before the specified time. Responses
+        saved without an expiration time are kept.
+        @param cutoff: naive UTC time to remove responses expired before
+        @return: number of responses removed
+        """
+        with self.connection(commit=True) as con:
+            cur = con.execute(f'DELETE FROM {self.table_name} '
+                              f'WHERE expires <= ?', (_to_timestamp(cutoff),))
+        return cur.rowcount
+
+
+class ExpiringSQLiteCache(SQLiteCache):
+    """
+    SQLite cache backend that can remove expired responses with an indexed
+    query
+    """
+
+    def __init__(self, db_path: str = 'http_cache', **kwargs):
+        super().__init__(db_path, **kwargs)
+        self.responses: ExpiringSQLiteDict = ExpiringSQLiteDict(
+            db_path, table_name='responses', **kwargs)
+
+    def delete_expired_responses(self, cutoff: datetime) -> int:
+        """
+        Remove responses that expired before the specified time
+        @param cutoff: naive UTC time to remove responses expired before
+        @return: number of responses removed
+        """
+        removed = self.responses.delete_expired(cutoff)
+        if removed:
+            self._prune_redirects()
+        return removed
@@ -26,20 +26,193 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from typing import Union
+import asyncio
+import hashlib
+import json
+from contextvars import ContextVar, copy_context
+from copy import copy
+from datetime import datetime, timedelta
+from functools import partial
+from io import BytesIO
+from os import makedirs
+from os.path import join, expanduser
+from threading import Event, Lock, Thread
+from time import time
+from typing import Callable, List, Optional, Tuple, Union
 from requests_cache import CachedSession, ExpirationTime, CachedResponse
+from requests_cache.backends import BaseCache, FileCache
+from requests_cache.cache_keys import create_key
+from requests_cache.policy import get_expiration_datetime
 from abc import abstractmethod
-from requests import Response
+from requests import Request, Response
+from requests.exceptions import ConnectionError as RequestsConnectionError, \
+    RequestException, Timeout
 from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3 import HTTPResponse
+from urllib3.util.retry import Retry
+from ovos_config.locations import get_xdg_cache_save_path
+from ovos_utils.log import LOG
+
+from neon_api_proxy.cache_backends import LRUMemoryCache, \
+    ExpiringSQLiteCache, CompressedCachedResponse
+from neon_api_proxy.metrics import ServiceMetrics, update_request_info
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Absolute time (epoch seconds) the request being handled must be answered by
+_request_deadline = ContextVar("request_deadline", default=None)
+
+# Request parameters that do not change the upstream request
+AFFINITY_IGNORED_PARAMS = frozenset({"service", "routing_key", "message_id",
+                                     "deadline", "priority",
+                                     "include_metadata", "accept_encoding"})
+
+
+def set_request_deadline(deadline: Optional[float]):
+    """
+    Set the deadline of the request being handled in the current context
+    @param deadline: epoch seconds the caller stops waiting at (None for none)
+    """
+    _request_deadline.set(deadline)
+
+
+def get_request_deadline() -> Optional[float]:
+    """
+    Get the deadline of the request being handled in the current context
+    @return: epoch seconds the caller stops waiting at, if any
+    """
+    return _request_deadline.get()
+
+
+class _InFlightRequest:
+    """
+    Result of an upstream request shared between concurrent callers
+    """
+    def __init__(self):
+        self.done = Event()
+        self.response: Optional[Response] = None
+        self.exception: Optional[Exception] = None
 
 
 class CachedAPI:
-    def __init__(self, cache_name):
-        # TODO: Setup a database for this
-        self.session = CachedSession(backend='memory', cache_name=cache_name,
-                                     expire_after=-1)
-        self.session.mount('http://', HTTPAdapter(max_retries=3))
-        self.session.mount('https://', HTTPAdapter(max_retries=3))
+    # Seconds to cache error responses, by status code or class (i.e. "4xx")
+    default_negative_cache_seconds = {"429": 30, "4xx": 60, "5xx": 5}
+
+    def __init__(self, cache_name: str, cache_backend: str = "memory",
+                 cache_path: Optional[str] = None,
+                 cache_max_entries: Optional[int] = 10000,
+                 cache_max_bytes: Optional[int] = 64 * 1024 * 1024,
+                 cache_purge_seconds: int = 600,
+                 stale_while_revalidate: int = 0, stale_if_error: int = 0,
+                 negative_cache_seconds: Optional[dict] = None,
+                 cache_compression: Optional[str] = None,
+                 cache_compress_min_bytes: int = 1024,
+                 request_timeout: float = 10, http_pool_size: int = 100,
+                 **_):
+        """
+        @param cache_name: name of the cache (database name for persistent
+            backends)
+        @param cache_backend: one of "memory", "sqlite", or "filesystem"
+        @param cache_path: directory to store persistent caches in
+        @param cache_max_entries: max number of responses in a memory cache
+        @param cache_max_bytes: max approximate size of a memory cache
+        @param cache_purge_seconds: interval between removing expired
+            responses from the cache (0 to disable)
+        @param stale_while_revalidate: seconds after expiration that a cached
+            response is returned while it is refreshed in the background
+        @param stale_if_error: seconds after expiration that a cached response
+            is returned if the upstream request fails
+        @param negative_cache_seconds: dict of status code or class (i.e.
+            "4xx") to seconds to cache error responses; overrides
+            `default_negative_cache_seconds`
+        @param cache_compression: algorithm to compress response bodies in a
+            memory cache with ("zlib", "gzip", "bz2", or "lzma")
+        @param cache_compress_min_bytes: minimum size of a response body to
+            compress
+        @param request_timeout: max seconds to wait for the upstream API
+        @param http_pool_size: max open connections to the upstream API for
+            asynchronous requests
+        """
+        backend = self._init_cache_backend(cache_name, cache_backend,
+                                           cache_path, cache_max_entries,
+                                           cache_max_bytes, cache_compression,
+                                           cache_compress_min_bytes)
+        self.session = CachedSession(backend=backend, cache_name=cache_name,
+                                     expire_after=-1,
+                                     key_fn=self._create_cache_key)
+        # Read timeouts are not retried so requests stay within their timeout
+        retries = Retry(total=3, read=False)
+        self.session.mount('http://', HTTPAdapter(max_retries=retries))
+        self.session.mount('https://', HTTPAdapter(max_retries=retries))
+        self._negative_cache_seconds = {
+            **self.default_negative_cache_seconds,
+            **{str(k): v for k, v in (negative_cache_seconds or {}).items()}}
+        self.session.allowable_codes = (200,) + tuple(
+            code for code in range(400, 600)
+            if self.get_negative_cache_seconds(code))
+        self._purge_seconds = cache_purge_seconds
+        self._last_purge = time()
+        self._purge_lock = Lock()
+        self._stale_while_revalidate = stale_while_revalidate
+        self._stale_if_error = stale_if_error
+        self._refreshing = set()
+        self._refresh_lock = Lock()
+        self._in_flight = dict()
+        self._in_flight_lock = Lock()
+        self.metrics = ServiceMetrics()
+        self.request_timeout = request_timeout
+        self.http_pool_size = http_pool_size
+        self._http_session = None
+        self._http_session_loop = None
+        self._async_in_flight = dict()
+
+    @staticmethod
+    def _init_cache_backend(cache_name: str, cache_backend: str,
+                            cache_path: Optional[str] = None,
+                            max_entries: Optional[int] = None,
+                            max_bytes: Optional[int] = None,
+                            compression: Optional[str] = None,
+                            compress_min_bytes: int = 1024) -> \
+            Union[str, BaseCache]:
+        """
+        Build the requests_cache backend for the specified configuration
+        @param cache_name: name of the cache
+        @param cache_backend: one of "memory", "sqlite", or "filesystem"
+        @param cache_path: directory to store persistent caches in
+        @param max_entries: max number of responses in a memory cache
+        @param max_bytes: max approximate size of a memory cache
+        @param compression: algorithm to compress memory cache bodies with
+        @param compress_min_bytes: minimum size of a body to compress
+        @return: backend name or instance to pass to `CachedSession`
+        """
+        if cache_backend == "memory":
+            return LRUMemoryCache(cache_name, max_entries, max_bytes,
+                                  compression, compress_min_bytes)
+        if compression:
+            LOG.warning(f"Compression is not supported for {cache_backend} "
+                        f"caches")
+        cache_path = expanduser(cache_path or
+                                join(get_xdg_cache_save_path(),
+                                     "neon_api_proxy"))
+        makedirs(cache_path, exist_ok=True)
+        if cache_backend == "sqlite":
+            db_path = join(cache_path, f"{cache_name}.sqlite")
+            LOG.info(f"Using SQLite cache at: {db_path}")
+            # Wait on locks held by other processes sharing this database
+            backend = ExpiringSQLiteCache(db_path, timeout=30)
+            with backend.responses.connection(commit=True) as con:
+                # WAL allows readers to continue while another process writes
+                con.execute("PRAGMA journal_mode=WAL")
+            return backend
+        if cache_backend == "filesystem":
+            LOG.info(f"Using filesystem cache at: {cache_path}")
+            return FileCache(join(cache_path, cache_name))
+        raise ValueError(f"Unsupported cache backend: {cache_backend}")
 
     def get_with_cache_timeout(self, url: str,
                                timeout: ExpirationTime = -1) -> \
@@ -52,10 +225,593 @@ class CachedAPI:
         """
         if timeout == 0:
             return self.get_bypass_cache(url)
-        return self.session.request("get", url, expire_after=timeout,
-                                    timeout=10)
-        # with self.session.request_expire_after(timeout):
-        #     return self.session.get(url)
+        response = self._get_response(url, timeout)
+        self._record_cache_result(response, timeout)
+        return response
+
+    async def get_with_cache_timeout_async(self, url: str,
+                                           timeout: ExpirationTime = -1) -> \
+            Union[Response, CachedResponse]:
+        """
+        Make a request with a specified time to cache the response without
+        blocking the event loop. Responses share a cache with
+        `get_with_cache_timeout`.
+        :param url: URL to request
+        :param timeout: Time to remain cached
+        :return: Response or CachedResponse
+        """
+        if timeout == 0:
+            return await self.get_bypass_cache_async(url)
+        response = await self._get_response_async(url, timeout)
+        self._record_cache_result(response, timeout)
+        return response
+
+    def _record_cache_result(self, response: Union[Response, CachedResponse],
+                             timeout: ExpirationTime = -1):
+        """
+        Record whether a response was a cache hit, stale hit, shared with a
+        concurrent request, or miss, and how long it remains cached
+        :param response: response returned to the service
+        :param timeout: Time the response was requested to remain cached
+        """
+        if not getattr(response, "from_cache", False):
+            result = "coalesced" if getattr(response, "coalesced", False) \
+                else "miss"
+            expires = self._get_expiration(timeout, response.status_code)
+        elif getattr(response, "is_expired", False):
+            result = "stale"
+            expires = None
+        else:
+            result = "hit"
+            expires = getattr(response, "expires", None)
+        self.metrics.record_cache_result(result)
+        ttl = None if expires is None else \
+            round((expires - datetime.utcnow()).total_seconds(), 3)
+        if ttl and ttl > 0:
+            update_request_info(cache=result, cache_ttl=ttl)
+        else:
+            # Expired or uncached responses have no time to live
+            update_request_info(cache=result)
+
+    @staticmethod
+    def get_response_content(response: Union[Response, CachedResponse],
+                             accept_encoding: Union[str, List[str]] = None) \
+            -> Tuple[bytes, Optional[str]]:
+        """
+        Get the body of a response. If the response was cached compressed with
+        an algorithm the requester accepts, the compressed body is returned.
+        :param response: response to get the body of
+        :param accept_encoding: list or comma-separated string of accepted
+            compression algorithms
+        :return: body and the algorithm it is compressed with (None if the
+            body is not compressed)
+        """
+        if isinstance(accept_encoding, str):
+            accept_encoding = [a.strip() for a in accept_encoding.split(',')]
+        if isinstance(response, CompressedCachedResponse) and \
+                response.compression in (accept_encoding or []):
+            return response.compressed_content, response.compression
+        return response.content, None
+
+    @property
+    def cache_hits(self) -> int:
+        """
+        Number of cacheable requests answered without their own upstream
+        request (including stale and coalesced)
+        """
+        results = self.metrics.cache_results
+        return results["hit"] + results["stale"] + results["coalesced"]
+
+    @property
+    def cache_misses(self) -> int:
+        """
+        Number of cacheable requests sent to the upstream API
+        """
+        return self.metrics.cache_results["miss"]
+
+    @property
+    def cache_hit_rate(self) -> float:
+        """
+        Fraction of cacheable requests answered from the cache
+        """
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
+    def _get_response(self, url: str, timeout: ExpirationTime) -> \
+            Union[Response, CachedResponse]:
+        """
+        Get a cached response, applying any configured stale response handling
+        :param url: URL to request
+        :param timeout: Time to remain cached
+        :return: Response or CachedResponse
+        """
+        self._check_purge()
+        if not (self._stale_while_revalidate or self._stale_if_error):
+            return self._fetch(url, timeout)
+
+        cache_key = self.get_cache_key(url)
+        cached = self.session.cache.get_response(cache_key)
+        if cached is None or not cached.is_expired or \
+                cached.status_code != 200:
+            stale = None
+        elif self._is_usable_stale(cached, self._stale_while_revalidate):
+            LOG.debug(f"Refreshing stale response in background: {url}")
+            self._refresh_in_background(url, timeout, cache_key, cached)
+            return cached
+        elif self._is_usable_stale(cached, self._stale_if_error):
+            stale = cached
+        else:
+            stale = None
+
+        try:
+            response = self._fetch(url, timeout, cache_key)
+        except RequestException as e:
+            if not stale:
+                raise
+            LOG.warning(f"Request failed, returning stale response: {e}")
+            self._restore_stale(cache_key, stale)
+            return stale
+        if stale and self._is_upstream_error(response):
+            LOG.warning(f"Got {response.status_code}, returning stale "
+                        f"response")
+            self._restore_stale(cache_key, stale)
+            return stale
+        return response
+
+    async def _get_response_async(self, url: str, timeout: ExpirationTime) \
+            -> Union[Response, CachedResponse]:
+        """
+        Get a cached response without blocking the event loop, applying any
+        configured stale response handling
+        :param url: URL to request
+        :param timeout: Time to remain cached
+        :return: Response or CachedResponse
+        """
+        self._check_purge()
+        cache_key = self.get_cache_key(url)
+        cached = await self._run_cache_io(self.session.cache.get_response,
+                                          cache_key)
+        if cached is not None and not cached.is_expired:
+            return cached
+        if cached is None or cached.status_code != 200:
+            stale = None
+        elif self._is_usable_stale(cached, self._stale_while_revalidate):
+            LOG.debug(f"Refreshing stale response in background: {url}")
+            self._refresh_in_background_async(url, timeout, cache_key, cached)
+            return cached
+        elif self._is_usable_stale(cached, self._stale_if_error):
+            stale = cached
+        else:
+            stale = None
+
+        try:
+            response = await self._fetch_async(url, timeout, cache_key)
+        except RequestException as e:
+            if not stale:
+                raise
+            LOG.warning(f"Request failed, returning stale response: {e}")
+            await self._run_cache_io(self._restore_stale, cache_key, stale)
+            return stale
+        if stale and self._is_upstream_error(response):
+            LOG.warning(f"Got {response.status_code}, returning stale "
+                        f"response")
+            await self._run_cache_io(self._restore_stale, cache_key, stale)
+            return stale
+        return response
+
+    async def _run_cache_io(self, func: Callable, *args):
+        """
+        Call a synchronous cache backend method from the event loop.
+        Persistent backends do blocking disk I/O, so they are accessed in the
+        default executor; the memory backend is called directly.
+        :param func: cache method to call
+        :param args: positional arguments to pass to `func`
+        :return: value returned by `func`
+        """
+        if isinstance(self.session.cache, LRUMemoryCache):
+            return func(*args)
+        return await asyncio.get_event_loop().run_in_executor(None, func,
+                                                              *args)
+
+    def normalize_cache_url(self, url: str) -> str:
+        """
+        Normalize a request URL for cache lookups. Services may override this
+        so equivalent requests share a cache entry; the original URL is still
+        used for the upstream request.
+        :param url: request URL
+        :return: URL to generate a cache key from
+        """
+        return url
+
+    def _create_cache_key(self, request=None, ignored_parameters=None,
+                          match_headers=False, **_) -> str:
+        """
+        Create a cache key from the normalized request only, ignoring any
+        `send` kwargs so keys may be computed before a request is sent
+        """
+        if isinstance(request, Request):
+            request = request.prepare()
+        request = request.copy()
+        request.url = self.normalize_cache_url(request.url)
+        return create_key(request, ignored_parameters, match_headers)
+
+    def get_cache_key(self, url: str) -> str:
+        """
+        Get the key used to cache a GET request for the specified URL
+        :param url: URL to request
+        :return: cache key
+        """
+        request = self.session.prepare_request(Request("GET", url))
+        return self.session.cache.create_key(request)
+
+    def get_affinity_key(self, **kwargs) -> Optional[str]:
+        """
+        Get a key identifying the cache entry a query resolves to, so
+        equivalent queries may be routed to the same proxy instance. Services
+        should override this to return the cache key of the upstream request.
+        :param kwargs: query parameters as passed to `handle_query`
+        :return: string key, or None if the query should not be routed by key
+        """
+        params = {k: v for k, v in kwargs.items()
+                  if k not in AFFINITY_IGNORED_PARAMS}
+        canonical = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+    def _fetch(self, url: str, timeout: ExpirationTime,
+               cache_key: Optional[str] = None) -> \
+            Union[Response, CachedResponse]:
+        """
+        Make a cached request for the specified URL. Concurrent calls for the
+        same cache key wait for and share the result of a single request.
+        :param url: URL to request
+        :param timeout: Time to remain cached
+        :param cache_key: cache key of the request, if already known
+        :return: Response or CachedResponse
+        """
+        cache_key = cache_key or self.get_cache_key(url)
+        upstream_timeout = self._get_upstream_timeout()
+        with self._in_flight_lock:
+            in_flight = self._in_flight.get(cache_key)
+            is_leader = in_flight is None
+            if is_leader:
+                in_flight = _InFlightRequest()
+                self._in_flight[cache_key] = in_flight
+        if not is_leader:
+            LOG.debug(f"Waiting for in-flight request: {cache_key}")
+            wait_timeout = None if get_request_deadline() is None \
+                else upstream_timeout
+            if not in_flight.done.wait(wait_timeout):
+                raise Timeout("Request deadline exceeded")
+            self.metrics.record_coalesced()
+            if in_flight.exception:
+                raise in_flight.exception
+            return self._as_coalesced(in_flight.response)
+
+        start = time()
+        try:
+            response = self.session.request("get", url, expire_after=timeout,
+                                             timeout=upstream_timeout)
+            if not response.from_cache:
+                self._record_upstream(response.status_code, time() - start)
+            if not response.from_cache and \
+                    response.status_code in self.session.allowable_codes and \
+                    response.status_code != 200:
+                self._set_negative_expiration(cache_key, response.status_code)
+            in_flight.response = response
+            return response
+        except Exception as e:
+            if isinstance(e, RequestException):
+                self._record_upstream("error", time() - start)
+            in_flight.exception = e
+            raise
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(cache_key, None)
+            in_flight.done.set()
+
+    @staticmethod
+    def _as_coalesced(response: Union[Response, CachedResponse]) -> \
+            Union[Response, CachedResponse]:
+        """
+        Copy a response shared with an in-flight request, marked so it is not
+        counted as another cache miss
+        :param response: response to the in-flight request
+        :return: marked copy of the response
+        """
+        response = copy(response)
+        response.coalesced = True
+        return response
+
+    async def _fetch_async(self, url: str, timeout: ExpirationTime,
+                           cache_key: str) -> Response:
+        """
+        Request the specified URL and cache the response. Concurrent calls
+        for the same cache key wait for and share the result of a single
+        request.
+        :param url: URL to request
+        :param timeout: Time to remain cached
+        :param cache_key: cache key of the request
+        :return: Response
+        """
+        upstream_timeout = self._get_upstream_timeout()
+        in_flight = self._async_in_flight.get(cache_key)
+        if in_flight is not None:
+            LOG.debug(f"Waiting for in-flight request: {cache_key}")
+            wait_timeout = None if get_request_deadline() is None \
+                else upstream_timeout
+            try:
+                response = await asyncio.wait_for(asyncio.shield(in_flight),
+                                                  wait_timeout)
+            except asyncio.TimeoutError:
+                raise Timeout("Request deadline exceeded")
+            self.metrics.record_coalesced()
+            return self._as_coalesced(response)
+
+        in_flight = asyncio.get_event_loop().create_future()
+        self._async_in_flight[cache_key] = in_flight
+        start = time()
+        try:
+            response = await self._request_async(url, upstream_timeout)
+            self._record_upstream(response.status_code, time() - start)
+            if response.status_code in self.session.allowable_codes:
+                await self._run_cache_io(
+                    self.session.cache.save_response, response, cache_key,
+                    self._get_expiration(timeout, response.status_code))
+            in_flight.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            # Waiting requests fail like any other request error instead of
+            # being cancelled along with this one
+            in_flight.set_exception(
+                RequestException(f"In-flight request cancelled: {url}"))
+            in_flight.exception()
+            raise
+        except Exception as e:
+            if isinstance(e, RequestException):
+                self._record_upstream("error", time() - start)
+            in_flight.set_exception(e)
+            # Waiting requests re-raise the exception; none may be waiting
+            in_flight.exception()
+            raise
+        finally:
+            self._async_in_flight.pop(cache_key, None)
+
+    def _get_http_session(self) -> "aiohttp.ClientSession":
+        """
+        Get the connection pool for asynchronous requests on the running
+        event loop
+        :return: aiohttp ClientSession
+        """
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for asynchronous requests")
+        loop = asyncio.get_event_loop()
+        if self._http_session is None or self._http_session.closed or \
+                self._http_session_loop is not loop:
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.http_pool_size))
+            self._http_session_loop = loop
+        return self._http_session
+
+    async def close_async(self):
+        """
+        Close the connection pool used for asynchronous requests
+        """
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        self._http_session = None
+
+    async def _request_async(self, url: str, upstream_timeout: float) -> \
+            Response:
+        """
+        Send a GET request to the upstream API without using the cache
+        :param url: URL to request
+        :param upstream_timeout: max seconds to wait for the response
+        :return: Response
+        """
+        session = self._get_http_session()
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(
+                    total=upstream_timeout)) as resp:
+                content = await resp.read()
+                return self._build_response(url, resp.status, resp.reason,
+                                            resp.headers, content)
+        except asyncio.TimeoutError as e:
+            raise Timeout(f"Request timed out: {url}") from e
+        except aiohttp.ClientError as e:
+            raise RequestsConnectionError(e) from e
+
+    def _build_response(self, url: str, status_code: int, reason: str,
+                        headers, content: bytes) -> Response:
+        """
+        Build a `requests` Response, so responses to asynchronous requests
+        are handled and cached like any other response
+        :param url: requested URL
+        :param status_code: HTTP status code
+        :param reason: HTTP reason phrase
+        :param headers: response headers
+        :param content: decoded response body
+        :return: Response
+        """
+        # The body was already decoded
+        headers = CaseInsensitiveDict({
+            k: v for k, v in headers.items()
+            if k.lower() not in ("content-encoding", "content-length")})
+        response = Response()
+        response.url = url
+        response.status_code = status_code
+        response.reason = reason
+        response.headers = headers
+        response.encoding = get_encoding_from_headers(headers)
+        response.request = self.session.prepare_request(Request("GET", url))
+        response.raw = HTTPResponse(body=BytesIO(content),
+                                    headers=dict(headers),
+                                    status=status_code, reason=reason,
+                                    preload_content=False)
+        response._content = content
+        response.from_cache = False
+        response.is_expired = False
+        return response
+
+    def _get_expiration(self, timeout: ExpirationTime,
+                        status_code: int) -> Optional[datetime]:
+        """
+        Get the time a new response expires from the cache
+        :param timeout: Time to remain cached
+        :param status_code: HTTP status code of the response
+        :return: expiration datetime (None to never expire)
+        """
+        expires = get_expiration_datetime(timeout)
+        if status_code != 200:
+            negative_expires = datetime.utcnow() + timedelta(
+                seconds=self.get_negative_cache_seconds(status_code))
+            if expires is None or expires > negative_expires:
+                expires = negative_expires
+        return expires
+
+    def _get_upstream_timeout(self) -> float:
+        """
+        Get the timeout for an upstream request, limited by the time left
+        until the deadline of the request being handled
+        :return: seconds to wait for the upstream API
+        """
+        deadline = get_request_deadline()
+        if deadline is None:
+            return self.request_timeout
+        remaining = deadline - time()
+        if remaining <= 0:
+            raise Timeout("Request deadline exceeded")
+        return min(self.request_timeout, remaining)
+
+    def _record_upstream(self, status: Union[int, str], latency: float):
+        """
+        Record the result of a request to the upstream API
+        :param status: HTTP status code or "error" if the request failed
+        :param latency: seconds the request took
+        """
+        self.metrics.record_upstream(status, latency)
+        update_request_info(upstream_status=status,
+                            upstream_latency=round(latency, 6))
+
+    def get_negative_cache_seconds(self, status_code: int) -> int:
+        """
+        Get the time to cache an error response with the specified status
+        :param status_code: HTTP status code of the response
+        :return: seconds to cache the response (0 if it is not cached)
+        """
+        status = str(status_code)
+        seconds = self._negative_cache_seconds.get(
+            status, self._negative_cache_seconds.get(f"{status[0]}xx"))
+        return int(seconds or 0)
+
+    def _set_negative_expiration(self, cache_key: str, status_code: int):
+        """
+        Shorten the expiration of a newly cached error response
+        :param cache_key: cache key of the response
+        :param status_code: HTTP status code of the response
+        """
+        cached = self.session.cache.responses.get(cache_key)
+        if cached is None:
+            return
+        expires = datetime.utcnow() + \
+            timedelta(seconds=self.get_negative_cache_seconds(status_code))
+        if cached.expires is None or cached.expires > expires:
+            LOG.debug(f"Caching {status_code} response until {expires}")
+            cached.expires = expires
+            self.session.cache.responses[cache_key] = cached
+
+    @staticmethod
+    def _is_upstream_error(response: Response) -> bool:
+        """
+        Check if a response indicates a transient upstream failure
+        :param response: response to check
+        :return: True if the response is a server error or rate limit
+        """
+        return response.status_code >= 500 or response.status_code == 429
+
+    @staticmethod
+    def _is_usable_stale(response: CachedResponse, grace_seconds: int) -> bool:
+        """
+        Check if an expired response is within the specified grace period
+        :param response: expired cached response
+        :param grace_seconds: seconds after expiration the response is usable
+        :return: True if the response may be returned
+        """
+        return bool(grace_seconds) and response.expires is not None and \
+            response.expires + timedelta(seconds=grace_seconds) > \
+            datetime.utcnow()
+
+    def _restore_stale(self, cache_key: str, stale: CachedResponse):
+        """
+        Put a stale response back in the cache after a failed refresh removed
+        or replaced it
+        :param cache_key: cache key of the response
+        :param stale: expired response to keep
+        """
+        self.session.cache.save_response(stale, cache_key, stale.expires)
+
+    def _refresh_in_background(self, url: str, timeout: ExpirationTime,
+                               cache_key: str, stale: CachedResponse):
+        """
+        Refresh an expired response without blocking the caller. Only one
+        refresh per cache key runs at a time.
+        :param url: URL to request
+        :param timeout: Time to remain cached
+        :param cache_key: cache key of the response
+        :param stale: expired response to keep if the refresh fails
+        """
+        with self._refresh_lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+
+        def _refresh():
+            try:
+                response = self._fetch(url, timeout, cache_key)
+                if self._is_upstream_error(response):
+                    LOG.warning(f"Background refresh got "
+                                f"{response.status_code}")
+                    self._restore_stale(cache_key, stale)
+            except Exception as e:
+                LOG.warning(f"Background refresh failed: {e}")
+                self._restore_stale(cache_key, stale)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(cache_key)
+        Thread(target=_refresh, daemon=True).start()
+
+    def _refresh_in_background_async(self, url: str, timeout: ExpirationTime,
+                                     cache_key: str, stale: CachedResponse):
+        """
+        Refresh an expired response in a separate task on the running event
+        loop. Only one refresh per cache key runs at a time.
+        :param url: URL to request
+        :param timeout: Time to remain cached
+        :param cache_key: cache key of the response
+        :param stale: expired response to keep if the refresh fails
+        """
+        with self._refresh_lock:
+            if cache_key in self._refreshing:
+                return
+            self._refreshing.add(cache_key)
+
+        async def _refresh():
+            # The refresh is not bound by the deadline of the request
+            set_request_deadline(None)
+            try:
+                response = await self._fetch_async(url, timeout, cache_key)
+                if self._is_upstream_error(response):
+                    LOG.warning(f"Background refresh got "
+                                f"{response.status_code}")
+                    await self._run_cache_io(self._restore_stale, cache_key,
+                                             stale)
+            except Exception as e:
+                LOG.warning(f"Background refresh failed: {e}")
+                await self._run_cache_io(self._restore_stale, cache_key,
+                                         stale)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(cache_key)
+        asyncio.ensure_future(_refresh())
 
     def get_bypass_cache(self, url: str) -> Response:
         """
@@ -63,8 +819,75 @@ class CachedAPI:
         :param url: URL to request
         :return: Response
         """
-        with self.session.cache_disabled():
-            return self.session.get(url, timeout=10)
+        upstream_timeout = self._get_upstream_timeout()
+        start = time()
+        try:
+            with self.session.cache_disabled():
+                response = self.session.get(url, timeout=upstream_timeout)
+        except RequestException:
+            self._record_upstream("error", time() - start)
+            raise
+        self._record_upstream(response.status_code, time() - start)
+        update_request_info(cache="bypass")
+        return response
+
+    async def get_bypass_cache_async(self, url: str) -> Response:
+        """
+        Make a request without using any cached responses and without
+        blocking the event loop
+        :param url: URL to request
+        :return: Response
+        """
+        upstream_timeout = self._get_upstream_timeout()
+        start = time()
+        try:
+            response = await self._request_async(url, upstream_timeout)
+        except RequestException:
+            self._record_upstream("error", time() - start)
+            raise
+        self._record_upstream(response.status_code, time() - start)
+        update_request_info(cache="bypass")
+        return response
+
+    def purge_expired_responses(self):
+        """
+        Remove all expired responses from the cache. Memory caches are
+        scanned and SQLite caches are purged with an indexed query; filesystem
+        caches would need every response read, so they are not purged and
+        keep responses until they are replaced.
+        """
+        if not self._purge_lock.acquire(blocking=False):
+            LOG.debug("Purge already in progress")
+            return
+        try:
+            # Keep expired responses that may still be returned as stale
+            cutoff = datetime.utcnow() - timedelta(
+                seconds=max(self._stale_while_revalidate,
+                            self._stale_if_error))
+            cache = self.session.cache
+            if isinstance(cache, ExpiringSQLiteCache):
+                removed = cache.delete_expired_responses(cutoff)
+                LOG.debug(f"Removed {removed} expired responses")
+            elif isinstance(cache, LRUMemoryCache):
+                expired = [key for key, response in cache.responses.items()
+                           if response.expires and response.expires <= cutoff]
+                if expired:
+                    LOG.debug(f"Removing {len(expired)} expired responses")
+                    cache.delete(*expired)
+        except Exception as e:
+            LOG.error(f"Failed to purge expired responses: {e}")
+        finally:
+            self._last_purge = time()
+            self._purge_lock.release()
+
+    def _check_purge(self):
+        """
+        Start a background purge of expired responses if one is due
+        """
+        if self._purge_seconds and \
+                time() - self._last_purge > self._purge_seconds:
+            self._last_purge = time()
+            Thread(target=self.purge_expired_responses, daemon=True).start()
 
     @abstractmethod
     def handle_query(self, **kwargs) -> dict:
@@ -73,3 +896,15 @@ class CachedAPI:
         :param kwargs: keyword arguments as required by APIs
         :return: dict response data
         """
+
+    async def handle_query_async(self, **kwargs) -> dict:
+        """
+        Handles an incoming query without blocking the event loop. Services
+        without an asynchronous implementation handle the query in the
+        default executor.
+        :param kwargs: keyword arguments as required by APIs
+        :return: dict response data
+        """
+        # Executor threads do not inherit the request context by default
+        return await asyncio.get_event_loop().run_in_executor(
+            None, partial(copy_context().run, self.handle_query, **kwargs))
@@ -26,12 +26,14 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+from os import environ
+from time import time
 from typing import Optional
 from enum import Enum
 from ovos_utils.log import LOG
-from neon_mq_connector.utils.client_utils import send_mq_request
 
-from neon_api_proxy.controller import NeonAPIProxyController
+from neon_api_proxy.client.cache import ResponseCache
+from neon_api_proxy.client.mq_client import get_mq_client
 
 
 class NeonAPI(Enum):
@@ -47,18 +49,70 @@ class NeonAPI(Enum):
     TEST_API = "api_test_endpoint"
 
 
-class NeonAPIProxyClient(NeonAPIProxyController):
-    def __init__(self, auth_config: dict = None):
-        super().__init__(auth_config)
+class NeonAPIRemoteClient:
+    """
+    Forwards API requests to the Neon API Proxy without reading service
+    configuration or loading any services
+    """
+    # True if requests may be handled in this process
+    local = False
+    # Cache of forwarded responses, if enabled
+    response_cache: Optional[ResponseCache] = None
+
+    def resolve_query(self, query: dict, timeout: int = 30,
+                      bypass_cache: bool = False) -> dict:
+        LOG.debug(f"Forwarding API request to remote")
+        return self._forward_query(query, timeout, bypass_cache)
 
-    def resolve_query(self, query: dict, timeout: int = 30) -> dict:
-        target_service = query.get('service')
-        if target_service and target_service in \
-                list(self.service_instance_mapping):
-            LOG.debug(f"Handling API request locally")
-            return super().resolve_query(query)
+    async def resolve_query_async(self, query: dict, timeout: int = 30,
+                                  bypass_cache: bool = False) -> dict:
         LOG.debug(f"Forwarding API request to remote")
-        return self._request_mq_api(query, timeout)
+        return await self._forward_query_async(query, timeout, bypass_cache)
+
+    def _forward_query(self, query: dict, timeout: int = 30,
+                       bypass_cache: bool = False) -> dict:
+        """
+        Forwards a query to the proxy, unless the response is cached
+        @param query: query to forward
+        @param timeout: Request timeout in seconds
+        @param bypass_cache: if True, don't use a cached response
+        @return: dict response from API
+        """
+        response = self._get_cached_response(query, bypass_cache)
+        if response is None:
+            response = self._request_mq_api(query, timeout)
+            self._cache_response(query, response)
+        return response
+
+    async def _forward_query_async(self, query: dict, timeout: int = 30,
+                                   bypass_cache: bool = False) -> dict:
+        """
+        Forwards a query to the proxy without blocking the event loop, unless
+        the response is cached
+        @param query: query to forward
+        @param timeout: Request timeout in seconds
+        @param bypass_cache: if True, don't use a cached response
+        @return: dict response from API
+        """
+        response = self._get_cached_response(query, bypass_cache)
+        if response is None:
+            response = await self._request_mq_api_async(query, timeout)
+            self._cache_response(query, response)
+        return response
+
+    def _get_cached_response(self, query: dict,
+                             bypass_cache: bool = False) -> Optional[dict]:
+        if self.response_cache is None or bypass_cache:
+            return None
+        response = self.response_cache.get(query)
+        if response is not None:
+            LOG.debug(f"Using cached response")
+        return response
+
+    def _cache_response(self, query: dict, response: dict):
+        # Responses requested with `bypass_cache` still refresh the cache
+        if self.response_cache is not None:
+            self.response_cache.put(query, response)
 
     @staticmethod
     def _request_mq_api(query_params: dict,
@@ -70,50 +124,138 @@ class NeonAPIProxyClient(NeonAPIProxyController):
         @return: dict response from API with:
             `status_code`, `content`, and `encoding`
         """
+        query_params = NeonAPIRemoteClient._get_mq_request(query_params,
+                                                           timeout)
+        response = get_mq_client().request(query_params, timeout)
+        return response or NeonAPIRemoteClient._no_response(timeout)
 
+    @staticmethod
+    async def _request_mq_api_async(query_params: dict,
+                                    timeout: int = 30) -> dict:
+        """
+        Handle a request for information from the Neon API Proxy Server
+        without blocking the event loop
+        @param query_params: Data parameters to pass to remote API
+        @param timeout: Request timeout in seconds
+        @return: dict response from API with:
+            `status_code`, `content`, and `encoding`
+        """
+        query_params = NeonAPIRemoteClient._get_mq_request(query_params,
+                                                           timeout)
+        response = await get_mq_client().request_async(query_params, timeout)
+        return response or NeonAPIRemoteClient._no_response(timeout)
+
+    @staticmethod
+    def _get_mq_request(query_params: dict, timeout: int) -> dict:
+        """
+        Validates a request to forward to the Neon API Proxy Server
+        @param query_params: Data parameters to pass to remote API
+        @param timeout: Request timeout in seconds
+        @return: request to send
+        """
         if not query_params:
             raise ValueError("Got empty query params")
         if not isinstance(query_params, dict):
             raise TypeError(f"Expected dict, got: {query_params}")
 
-        response = send_mq_request("/neon_api", query_params,
-                                   "neon_api_input", "neon_api_output", timeout)
-        return response or {"status_code": 401,
-                            "content": f"Neon API failed to give a response "
-                                       f"within {timeout} seconds",
-                            "encoding": None}
+        # Let the proxy skip requests this client has stopped waiting for
+        return {**query_params, "deadline": time() + timeout}
+
+    @staticmethod
+    def _no_response(timeout: int) -> dict:
+        return {"status_code": 401,
+                "content": f"Neon API failed to give a response "
+                           f"within {timeout} seconds",
+                "encoding": None}
 
 
-_CLIENT: Optional[NeonAPIProxyClient] = None
+_CLIENT: Optional[NeonAPIRemoteClient] = None
 
 
-def init_client():
+def __getattr__(name: str):
+    # The local client imports the proxy and its services, so it is only
+    # loaded when used
+    if name == "NeonAPIProxyClient":
+        from neon_api_proxy.client.local import NeonAPIProxyClient
+        return NeonAPIProxyClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def init_client(local: Optional[bool] = None, cache: Optional[bool] = None):
     """
     Lazily initializes the local client object
+    :param local: if True, handle requests for locally configured services in
+        this process. If False, forward all requests to the proxy. By default,
+        requests are handled locally only if any service has an `api_key`
+        configured.
+    :param cache: if True, keep forwarded responses in this process for as
+        long as the proxy caches them. If False, stop caching responses. By
+        default, responses are cached only if the
+        `NEON_API_PROXY_CLIENT_CACHE` envvar is `true`.
     """
     global _CLIENT
-    if not _CLIENT:
-        _CLIENT = NeonAPIProxyClient()
+    if not _CLIENT or (local is not None and local != _CLIENT.local):
+        if local is None:
+            from neon_api_proxy.config import has_local_api_keys
+            local = has_local_api_keys()
+        response_cache = _CLIENT.response_cache if _CLIENT else None
+        if cache is None and not _CLIENT:
+            cache = environ.get('NEON_API_PROXY_CLIENT_CACHE',
+                                '').lower() == 'true'
+        if local:
+            from neon_api_proxy.client.local import NeonAPIProxyClient
+            _CLIENT = NeonAPIProxyClient()
+        else:
+            _CLIENT = NeonAPIRemoteClient()
+        _CLIENT.response_cache = response_cache
+    if cache is not None and cache != (_CLIENT.response_cache is not None):
+        _CLIENT.response_cache = ResponseCache() if cache else None
 
 
-def request_api(api: NeonAPI, query_params: dict, timeout: int = 30) -> dict:
+def request_api(api: NeonAPI, query_params: dict, timeout: int = 30,
+                bypass_cache: bool = False) -> dict:
     """
     Handle an arbitrary API request
     :param api: Service API to target
     :param query_params: Data parameters to pass to service API
     :param timeout: Request timeout in seconds
+    :param bypass_cache: if True, don't use a response cached in this process
     :return: dict response from API with:
     `status_code`, `content`, and `encoding`
     """
+    query = _get_api_query(api, query_params)
+    init_client()
+    return _CLIENT.resolve_query(query, timeout, bypass_cache)
 
+
+async def request_api_async(api: NeonAPI, query_params: dict,
+                            timeout: int = 30,
+                            bypass_cache: bool = False) -> dict:
+    """
+    Handle an arbitrary API request without blocking the event loop
+    :param api: Service API to target
+    :param query_params: Data parameters to pass to service API
+    :param timeout: Request timeout in seconds
+    :param bypass_cache: if True, don't use a response cached in this process
+    :return: dict response from API with:
+    `status_code`, `content`, and `encoding`
+    """
+    query = _get_api_query(api, query_params)
+    init_client()
+    return await _CLIENT.resolve_query_async(query, timeout, bypass_cache)
+
+
+def _get_api_query(api: NeonAPI, query_params: dict) -> dict:
+    """
+    Validates an API request
+    :param api: Service API to target
+    :param query_params: Data parameters to pass to service API
+    :return: query for the client to resolve
+    """
     if not isinstance(api, NeonAPI):
         raise TypeError(f"Expected a NeonAPI, got: {api}")
     if not query_params:
         raise ValueError("Got empty query params")
     if not isinstance(query_params, dict):
         raise TypeError(f"Expected dict, got: {query_params}")
-
-    global _CLIENT
-    init_client()
-    query = {**query_params, **{"service": str(api)}}
-    return _CLIENT.resolve_query(query, timeout)
+    return {**query_params, **{"service": str(api)}}
@@ -30,7 +30,7 @@ import json
 
 from json import JSONDecodeError
 from ovos_utils.log import LOG
-from neon_api_proxy.client import NeonAPI, request_api
+from neon_api_proxy.client import NeonAPI, request_api, request_api_async
 
 
 def _get_response_data(resp: dict) -> dict:
@@ -62,9 +62,33 @@ def search_stock_by_name(company: str, **kwargs) -> list:
       'region' - optional preferred region (default `United States`)
     :return: list of dict matched stock data
     """
-    region = kwargs.get("region") or "United States"
     query_params = {**kwargs, **{"api": "symbol", "company": company}}
     resp = request_api(NeonAPI.ALPHA_VANTAGE, query_params)
+    return _get_matches(resp, company, kwargs.get("region"))
+
+
+async def search_stock_by_name_async(company: str, **kwargs) -> list:
+    """
+    Queries Alpha Vantage like `search_stock_by_name` without blocking the
+    event loop
+    :param company: Company name/stock search term
+    :param kwargs: optional params, see `search_stock_by_name`
+    :return: list of dict matched stock data
+    """
+    query_params = {**kwargs, **{"api": "symbol", "company": company}}
+    resp = await request_api_async(NeonAPI.ALPHA_VANTAGE, query_params)
+    return _get_matches(resp, company, kwargs.get("region"))
+
+
+def _get_matches(resp: dict, company: str, region: str = None) -> list:
+    """
+    Parses stocks matching a search from an Alpha Vantage response
+    :param resp: dict HTTP response from the API
+    :param company: Company name/stock search term
+    :param region: preferred region (default `United States`)
+    :return: list of dict matched stock data
+    """
+    region = region or "United States"
     data = _get_response_data(resp)
 
     if not data.get("bestMatches"):
@@ -91,6 +115,29 @@ def get_stock_quote(symbol: str, **kwargs) -> dict:
     """
     query_params = {**kwargs, **{"api": "quote", "symbol": symbol}}
     resp = request_api(NeonAPI.ALPHA_VANTAGE, query_params)
+    return _get_quote(resp, symbol)
+
+
+async def get_stock_quote_async(symbol: str, **kwargs) -> dict:
+    """
+    Queries Alpha Vantage like `get_stock_quote` without blocking the event
+    loop
+    :param symbol: Stock ticker symbol
+    :param kwargs: optional params, see `get_stock_quote`
+    :return: dict stock data
+    """
+    query_params = {**kwargs, **{"api": "quote", "symbol": symbol}}
+    resp = await request_api_async(NeonAPI.ALPHA_VANTAGE, query_params)
+    return _get_quote(resp, symbol)
+
+
+def _get_quote(resp: dict, symbol: str) -> dict:
+    """
+    Parses stock information from an Alpha Vantage response
+    :param resp: dict HTTP response from the API
+    :param symbol: Stock ticker symbol
+    :return: dict stock data
+    """
     data = _get_response_data(resp)
 
     if not data.get("Global Quote"):
@@ -0,0 +1,136 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Optional
+
+# Request params that don't change the response
+IGNORED_PARAMS = frozenset({"deadline", "message_id", "routing_key"})
+# Response fields that only apply to the request the response was sent for
+REQUEST_FIELDS = frozenset({"message_id", "routing_key"})
+
+
+class ResponseCache:
+    """
+    Bounded in-process cache of proxy responses. Responses are kept for the
+    `cache_ttl` the proxy advertises with them, so a cached response is the
+    same one the proxy would return from its own cache.
+    """
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16777216):
+        """
+        :param max_entries: max number of responses to keep
+        :param max_bytes: max approximate size of response content to keep
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        # Key to (expiration, size, response), least recently used first
+        self._responses = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+    @staticmethod
+    def get_key(query: dict) -> Optional[str]:
+        """
+        Get a key identifying equivalent queries
+        :param query: query dict
+        :return: string key, or None if the query can't be cached
+        """
+        try:
+            return json.dumps({k: v for k, v in query.items()
+                               if k not in IGNORED_PARAMS}, sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, query: dict) -> Optional[dict]:
+        """
+        Get an unexpired response to an equivalent query
+        :param query: query dict
+        :return: copy of the cached response with its remaining `cache_ttl`,
+            or None
+        """
+        key = self.get_key(query)
+        with self._lock:
+            entry = self._responses.get(key)
+            if entry is None:
+                return None
+            remaining = entry[0] - monotonic()
+            if remaining <= 0:
+                self._remove(key)
+                return None
+            self._responses.move_to_end(key)
+            return {**entry[2], 'cache_ttl': round(remaining, 3)}
+
+    def put(self, query: dict, response: dict):
+        """
+        Cache a response, if the proxy advertised how long it is cached for
+        :param query: query dict the response is for
+        :param response: response from the proxy
+        """
+        key = self.get_key(query)
+        ttl = response.get('cache_ttl') if isinstance(response, dict) \
+            else None
+        if key is None or not isinstance(ttl, (int, float)) or ttl <= 0:
+            return
+        size = len(key) + self._get_size(response.get('content'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._responses:
+                self._remove(key)
+            self._responses[key] = (monotonic() + ttl, size,
+                                    {k: v for k, v in response.items()
+                                     if k not in REQUEST_FIELDS})
+            self.size += size
+            while len(self._responses) > self.max_entries or \
+                    self.size > self.max_bytes:
+                self._remove(next(iter(self._responses)))
+
+    def clear(self):
+        """
+        Remove all cached responses
+        """
+        with self._lock:
+            self._responses.clear()
+            self.size = 0
+
+    def _remove(self, key: str):
+        _, size, _ = self._responses.pop(key)
+        self.size -= size
+
+    @staticmethod
+    def _get_size(content) -> int:
+        if isinstance(content, (str, bytes, bytearray)):
+            return len(content)
+        return 0
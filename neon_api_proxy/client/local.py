@@ -0,0 +1,61 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from ovos_utils.log import LOG
+
+from neon_api_proxy.client import NeonAPIRemoteClient
+from neon_api_proxy.controller import NeonAPIProxyController
+
+
+class NeonAPIProxyClient(NeonAPIProxyController, NeonAPIRemoteClient):
+    """
+    Handles requests for locally configured services in this process and
+    forwards other requests to the Neon API Proxy
+    """
+    local = True
+
+    def __init__(self, auth_config: dict = None):
+        super().__init__(auth_config)
+
+    def resolve_query(self, query: dict, timeout: int = 30,
+                      bypass_cache: bool = False) -> dict:
+        target_service = query.get('service')
+        if self.service_instance_mapping.get(target_service) is not None:
+            LOG.debug(f"Handling API request locally")
+            return super().resolve_query(query)
+        LOG.debug(f"Forwarding API request to remote")
+        return self._forward_query(query, timeout, bypass_cache)
+
+    async def resolve_query_async(self, query: dict, timeout: int = 30,
+                                  bypass_cache: bool = False) -> dict:
+        target_service = query.get('service')
+        if self.service_instance_mapping.get(target_service) is not None:
+            LOG.debug(f"Handling API request locally")
+            return await super().resolve_query_async(query)
+        LOG.debug(f"Forwarding API request to remote")
+        return await self._forward_query_async(query, timeout, bypass_cache)
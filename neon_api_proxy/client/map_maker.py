@@ -29,7 +29,7 @@
 import json
 
 from ovos_utils.log import LOG
-from neon_api_proxy.client import NeonAPI, request_api
+from neon_api_proxy.client import NeonAPI, request_api, request_api_async
 
 
 def get_coordinates(location: str) -> (float, float):
@@ -38,7 +38,20 @@ def get_coordinates(location: str) -> (float, float):
     @param location: Search term, i.e. City, Address, Landmark
     @returns: coordinate latitude, longitude
     """
-    resp = _make_api_call({'address': location})
+    return _get_coordinates(_make_api_call({'address': location}))
+
+
+async def get_coordinates_async(location: str) -> (float, float):
+    """
+    Get coordinates like `get_coordinates` without blocking the event loop
+    @param location: Search term, i.e. City, Address, Landmark
+    @returns: coordinate latitude, longitude
+    """
+    return _get_coordinates(
+        await _make_api_call_async({'address': location}))
+
+
+def _get_coordinates(resp: dict) -> (float, float):
     if resp['status_code'] != 200:
         raise RuntimeError(f"API Request failed: {resp['content']}")
     coords = resp['content'][0]['lat'], resp['content'][0]['lon']
@@ -53,7 +66,20 @@ def get_address(lat: float, lon: float) -> dict:
     @param lon: longitude of point to look up
     @returns: dict location (equivalent to Geopy Location.raw)
     """
-    resp = _make_api_call({'lat': lat, "lon": lon})
+    return _get_address(_make_api_call({'lat': lat, "lon": lon}))
+
+
+async def get_address_async(lat: float, lon: float) -> dict:
+    """
+    Get a dict location like `get_address` without blocking the event loop
+    @param lat: latitude of point to look up
+    @param lon: longitude of point to look up
+    @returns: dict location (equivalent to Geopy Location.raw)
+    """
+    return _get_address(await _make_api_call_async({'lat': lat, "lon": lon}))
+
+
+def _get_address(resp: dict) -> dict:
     if resp['status_code'] != 200:
         raise RuntimeError(f"API Request failed: {resp['content']}")
     address = resp['content']['address']
@@ -67,6 +93,15 @@ def get_address(lat: float, lon: float) -> dict:
 
 def _make_api_call(request_data: dict) -> dict:
     resp = request_api(NeonAPI.MAP_MAKER, request_data)
+    return _parse_content(resp)
+
+
+async def _make_api_call_async(request_data: dict) -> dict:
+    resp = await request_api_async(NeonAPI.MAP_MAKER, request_data)
+    return _parse_content(resp)
+
+
+def _parse_content(resp: dict) -> dict:
     if resp['status_code'] == 200:
         resp['content'] = json.loads(resp['content'])
     return resp
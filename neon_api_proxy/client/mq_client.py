@@ -0,0 +1,337 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import asyncio
+import atexit
+
+from os import environ
+from functools import partial
+from threading import Event, Lock, Thread
+from typing import Optional, Tuple
+from uuid import uuid4
+
+import pika
+
+from ovos_utils.log import LOG
+from neon_mq_connector.utils.client_utils import _default_mq_config
+
+from neon_api_proxy.wire_format import decode_message, encode_message
+
+# Prefix of client reply queues. The proxy does not declare these, since they
+# are declared with arguments it does not know.
+REPLY_QUEUE_PREFIX = "neon_api_reply_"
+
+
+class _PendingRequest:
+    """
+    A request waiting for its response
+    """
+    def __init__(self, body: bytes, expiration: str,
+                 future: Optional[asyncio.Future] = None):
+        self.body = body
+        self.expiration = expiration
+        self.published = False
+        self.event = Event()
+        self.future = future
+        self.response = None
+
+    def resolve(self, response: Optional[dict]):
+        """
+        Passes a response to the caller waiting for it. May be called from
+        any thread.
+        :param response: response, or None if the request failed
+        """
+        self.response = response
+        self.event.set()
+        if self.future is not None:
+            try:
+                self.future.get_loop().call_soon_threadsafe(self._set_result)
+            except RuntimeError:
+                # The caller's event loop is closed
+                pass
+
+    def _set_result(self):
+        if not self.future.done():
+            self.future.set_result(self.response)
+
+
+class NeonAPIMQClient:
+    """
+    Sends requests to the Neon API Proxy over one long-lived MQ connection.
+    Responses are all received on one reply queue and matched to their
+    request by `message_id`, so any number of threads or coroutines may send
+    requests concurrently.
+    """
+    # Seconds to wait between connection attempts
+    reconnect_seconds = 5
+
+    def __init__(self, config: dict, vhost: str = "/neon_api",
+                 request_queue: str = "neon_api_input",
+                 reply_queue_expires: Optional[int] = None):
+        """
+        :param config: MQ configuration with `server`, `port`, and an
+            `mq_handler` user
+        :param vhost: MQ vhost the proxy is connected to
+        :param request_queue: queue the proxy receives requests on
+        :param reply_queue_expires: if set, milliseconds the reply queue is
+            kept without a consumer. Proxies from before this option declare
+            reply queues with default arguments, which the broker rejects for
+            a queue declared with an expiration, so all proxies must be
+            upgraded before this is set.
+        """
+        self.config = config
+        self.vhost = vhost
+        self.request_queue = request_queue
+        self.reply_queue_expires = reply_queue_expires
+        # Kept across reconnects and deleted on shutdown. Queues left by
+        # processes that did not shut down should be expired by a broker
+        # policy unless `reply_queue_expires` is set.
+        self.reply_queue = f"{REPLY_QUEUE_PREFIX}{uuid4().hex}"
+        self._pending = dict()
+        self._connection = None
+        self._channel = None
+        self._ready = Event()
+        # True while the last connection attempt failed
+        self._unreachable = False
+        self._stopped = Event()
+        self._thread = None
+        self._lock = Lock()
+
+    def request(self, query: dict, timeout: float = 30) -> Optional[dict]:
+        """
+        Sends a request to the proxy and waits for its response
+        :param query: request to send
+        :param timeout: seconds to wait for a response
+        :return: response, or None if none was received in time or the proxy
+            could not be reached
+        """
+        message_id, pending = self._send(query, timeout)
+        try:
+            if not pending.event.wait(timeout):
+                LOG.error(f"Timeout waiting for response to: {message_id}")
+            return pending.response
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def request_async(self, query: dict,
+                            timeout: float = 30) -> Optional[dict]:
+        """
+        Sends a request to the proxy and waits for its response without
+        blocking the event loop
+        :param query: request to send
+        :param timeout: seconds to wait for a response
+        :return: response, or None if none was received in time or the proxy
+            could not be reached
+        """
+        message_id, pending = self._send(
+            query, timeout, asyncio.get_event_loop().create_future())
+        try:
+            return await asyncio.wait_for(pending.future, timeout)
+        except asyncio.TimeoutError:
+            LOG.error(f"Timeout waiting for response to: {message_id}")
+            return None
+        finally:
+            self._pending.pop(message_id, None)
+
+    def shutdown(self, timeout: float = 5):
+        """
+        Closes the connection and deletes the reply queue
+        :param timeout: seconds to wait for the connection to close
+        """
+        self._stopped.set()
+        if self._ready.is_set():
+            try:
+                self._connection.add_callback_threadsafe(
+                    self._channel.stop_consuming)
+            except Exception as e:
+                LOG.debug(e)
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _send(self, query: dict, timeout: float,
+              future: Optional[asyncio.Future] = None) -> \
+            Tuple[str, _PendingRequest]:
+        """
+        Registers a request and schedules it to be published
+        :param query: request to send
+        :param timeout: seconds to wait for a response
+        :param future: future to set with the response
+        :return: message_id and pending request
+        """
+        message_id = uuid4().hex
+        pending = _PendingRequest(
+            encode_message({**query, "message_id": message_id,
+                            "routing_key": self.reply_queue}),
+            str(int(timeout * 1000)), future)
+        self._pending[message_id] = pending
+        self._start()
+        # Requests made while connecting are sent once connected
+        if self._unreachable and not self._ready.is_set():
+            LOG.error(f"MQ unreachable, not sending: {message_id}")
+            pending.resolve(None)
+        elif self._ready.is_set():
+            try:
+                self._connection.add_callback_threadsafe(
+                    partial(self._publish, message_id))
+            except Exception as e:
+                LOG.warning(f"Connection lost sending {message_id}: {e}")
+        return message_id, pending
+
+    def _start(self):
+        """
+        Starts the thread that owns the connection, if it isn't running
+        """
+        with self._lock:
+            if self._thread is None and not self._stopped.is_set():
+                self._thread = Thread(target=self._run, daemon=True,
+                                      name="neon_api_mq_client")
+                self._thread.start()
+
+    def _run(self):
+        """
+        Keeps a connection open until shutdown, reconnecting if it is lost
+        """
+        while not self._stopped.is_set():
+            try:
+                self._consume()
+            except Exception as e:
+                LOG.error(f"MQ connection failed: {e}")
+            self._ready.clear()
+            self._stopped.wait(self.reconnect_seconds)
+
+    def _consume(self):
+        """
+        Connects and handles responses and queued publishes until the
+        connection is closed
+        """
+        try:
+            connection = pika.BlockingConnection(
+                self._get_connection_params())
+        except Exception:
+            # Don't leave requests waiting on a proxy that can't be reached
+            self._unreachable = True
+            for pending in list(self._pending.values()):
+                if not pending.published:
+                    pending.resolve(None)
+            raise
+        try:
+            channel = connection.channel()
+            arguments = {"x-expires": int(self.reply_queue_expires)} \
+                if self.reply_queue_expires else None
+            channel.queue_declare(queue=self.reply_queue, arguments=arguments)
+            channel.basic_consume(self.reply_queue, self._on_response,
+                                  auto_ack=True)
+            self._connection, self._channel = connection, channel
+            self._unreachable = False
+            self._ready.set()
+            # Send requests made while connecting
+            for message_id in list(self._pending):
+                self._publish(message_id)
+            LOG.debug(f"Receiving responses on: {self.reply_queue}")
+            channel.start_consuming()
+            if self._stopped.is_set():
+                channel.queue_delete(self.reply_queue)
+        finally:
+            self._ready.clear()
+            if connection.is_open:
+                connection.close()
+
+    def _get_connection_params(self) -> pika.ConnectionParameters:
+        user = self.config['users']['mq_handler']
+        return pika.ConnectionParameters(
+            host=self.config.get('server', 'localhost'),
+            port=int(self.config.get('port', 5672)),
+            virtual_host=self.vhost,
+            credentials=pika.PlainCredentials(user['user'], user['password']))
+
+    def _publish(self, message_id: str):
+        """
+        Publishes a request, if it is still waiting to be sent. Must be called
+        on the connection's thread.
+        :param message_id: message_id of the request
+        """
+        pending = self._pending.get(message_id)
+        if not pending or pending.published:
+            return
+        try:
+            self._channel.basic_publish(
+                exchange='', routing_key=self.request_queue, body=pending.body,
+                properties=pika.BasicProperties(
+                    expiration=pending.expiration))
+            pending.published = True
+        except Exception as e:
+            LOG.error(f"Failed to publish request {message_id}: {e}")
+
+    def _on_response(self, channel, method, properties, body: bytes):
+        """
+        Passes a response to the thread waiting for it
+        """
+        try:
+            response = decode_message(body, properties.content_type)
+        except Exception as e:
+            LOG.error(f"Failed to decode response: {e}")
+            return
+        pending = self._pending.get(response.get('message_id'))
+        if pending:
+            pending.resolve(response)
+        else:
+            LOG.debug(f"Ignoring response to: {response.get('message_id')}")
+
+
+_MQ_CLIENT: Optional[NeonAPIMQClient] = None
+_MQ_CLIENT_LOCK = Lock()
+
+
+def get_mq_config() -> dict:
+    """
+    Get MQ configuration for sending requests to the proxy
+    :return: MQ configuration with an `mq_handler` user
+    """
+    from ovos_config.config import Configuration
+    config = dict(Configuration().get('MQ') or _default_mq_config)
+    users = dict(config.get('users') or dict())
+    if not users.get('mq_handler'):
+        LOG.warning("mq_handler not configured, using default credentials")
+        users['mq_handler'] = _default_mq_config['users']['mq_handler']
+    config['users'] = users
+    return config
+
+
+def get_mq_client() -> NeonAPIMQClient:
+    """
+    Get the MQ client shared by this process, creating it on first use
+    :return: shared NeonAPIMQClient
+    """
+    global _MQ_CLIENT
+    with _MQ_CLIENT_LOCK:
+        if _MQ_CLIENT is None:
+            _MQ_CLIENT = NeonAPIMQClient(
+                get_mq_config(), reply_queue_expires=environ.get(
+                    'NEON_API_PROXY_REPLY_QUEUE_EXPIRES'))
+            atexit.register(_MQ_CLIENT.shutdown)
+    return _MQ_CLIENT
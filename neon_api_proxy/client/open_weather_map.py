@@ -31,7 +31,7 @@ from enum import Enum
 from json import JSONDecodeError
 from typing import Union
 from ovos_utils.log import LOG
-from neon_api_proxy.client import NeonAPI, request_api
+from neon_api_proxy.client import NeonAPI, request_api, request_api_async
 
 
 class OpenWeatherMapApi(Enum):
@@ -55,6 +55,27 @@ def get_current_weather(lat: Union[str, float], lng: Union[str, float],
     """
     forecast = _make_api_call(lat, lng, units,
                               OpenWeatherMapApi.CURRENT, **kwargs)
+    return _get_current_weather(forecast)
+
+
+async def get_current_weather_async(lat: Union[str, float],
+                                    lng: Union[str, float],
+                                    units: str = "metric", **kwargs) -> dict:
+    """
+    Queries Open Weather Map like `get_current_weather` without blocking the
+    event loop
+    :param lat: latitude
+    :param lng: longitude
+    :param units: Units of measure "metric", "imperial", or "standard"
+    :param kwargs: optional params, see `get_current_weather`
+    :return: dict weather data (https://openweathermap.org/current#current_JSON)
+    """
+    forecast = await _make_api_call_async(lat, lng, units,
+                                          OpenWeatherMapApi.CURRENT, **kwargs)
+    return _get_current_weather(forecast)
+
+
+def _get_current_weather(forecast: dict) -> dict:
     if not forecast.get("weather"):
         LOG.warning("Outdated backend API return. Reformatting into current")
         forecast = {"main": forecast["current"],
@@ -78,6 +99,22 @@ def get_forecast(lat: Union[str, float], lng: Union[str, float],
     return _make_api_call(lat, lng, units, OpenWeatherMapApi.ONECALL, **kwargs)
 
 
+async def get_forecast_async(lat: Union[str, float], lng: Union[str, float],
+                             units: str = "metric", **kwargs) -> dict:
+    """
+    Queries Open Weather Map like `get_forecast` without blocking the event
+    loop
+    :param lat: latitude
+    :param lng: longitude
+    :param units: Units of measure "metric", "imperial", or "standard"
+    :param kwargs: optional params, see `get_forecast`
+    :return: dict weather data
+        (https://openweathermap.org/api/one-call-api#hist_example)
+    """
+    return await _make_api_call_async(lat, lng, units,
+                                      OpenWeatherMapApi.ONECALL, **kwargs)
+
+
 def _make_api_call(lat: Union[str, float], lng: Union[str, float],
                    units: str, target_api: OpenWeatherMapApi,
                    **kwargs) -> dict:
@@ -92,13 +129,46 @@ def _make_api_call(lat: Union[str, float], lng: Union[str, float],
       'language' - optional language param (default english)
     :return: dict weather data
     """
-    query_params = {"lat": lat,
-                    "lng": lng,
-                    "units": units,
-                    "api": repr(target_api),
-                    **kwargs}
-    resp = request_api(NeonAPI.OPEN_WEATHER_MAP, query_params)
+    resp = request_api(NeonAPI.OPEN_WEATHER_MAP,
+                       _get_query_params(lat, lng, units, target_api,
+                                         **kwargs))
+    return _get_response_data(resp)
+
 
+async def _make_api_call_async(lat: Union[str, float],
+                               lng: Union[str, float], units: str,
+                               target_api: OpenWeatherMapApi,
+                               **kwargs) -> dict:
+    """
+    Common wrapper for async API calls to OWM
+    :param lat: latitude
+    :param lng: longitude
+    :param units: Temperature and Speed units "metric", "imperial", "standard"
+    :param target_api: API to query
+    :return: dict weather data
+    """
+    resp = await request_api_async(
+        NeonAPI.OPEN_WEATHER_MAP,
+        _get_query_params(lat, lng, units, target_api, **kwargs))
+    return _get_response_data(resp)
+
+
+def _get_query_params(lat: Union[str, float], lng: Union[str, float],
+                      units: str, target_api: OpenWeatherMapApi,
+                      **kwargs) -> dict:
+    return {"lat": lat,
+            "lng": lng,
+            "units": units,
+            "api": repr(target_api),
+            **kwargs}
+
+
+def _get_response_data(resp: dict) -> dict:
+    """
+    Parses weather data from an OWM response
+    :param resp: dict response from the API
+    :return: dict weather data
+    """
     try:
         data = json.loads(resp["content"])
     except JSONDecodeError:
@@ -29,7 +29,7 @@
 from enum import Enum
 from typing import Union
 from ovos_utils.log import LOG
-from neon_api_proxy.client import NeonAPI, request_api
+from neon_api_proxy.client import NeonAPI, request_api, request_api_async
 from neon_utils.net_utils import get_ip_address
 
 
@@ -61,12 +61,47 @@ def get_wolfram_alpha_response(query: str, api: QueryApi,
       'app_id' - optional str app_id to use for query
     :return: str text response or bytes response for 'full'
     """
+    resp = request_api(NeonAPI.WOLFRAM_ALPHA,
+                       _get_query_params(query, api, units, **kwargs))
+    return _get_response_content(resp)
+
+
+async def get_wolfram_alpha_response_async(query: str, api: QueryApi,
+                                           units: str = "metric",
+                                           **kwargs) -> Union[str, bytes]:
+    """
+    Queries Wolfram|Alpha like `get_wolfram_alpha_response` without blocking
+        the event loop
+    :param query: Question to submit to Wolfram|Alpha
+    :param api: API to target
+    :param units: "metric" or "nonmetric" units
+    :param kwargs: optional geolocation params, see
+        `get_wolfram_alpha_response`
+    :return: str text response or bytes response for 'full'
+    """
+    resp = await request_api_async(
+        NeonAPI.WOLFRAM_ALPHA, _get_query_params(query, api, units, **kwargs))
+    return _get_response_content(resp)
+
+
+def _get_query_params(query: str, api: QueryApi, units: str,
+                      **kwargs) -> dict:
+    """
+    Builds the request params for a Wolfram|Alpha query
+    """
     query_params = get_geolocation_params(**kwargs)
     query_params["units"] = units
     query_params["query"] = query
     query_params["api"] = repr(api)
-    resp = request_api(NeonAPI.WOLFRAM_ALPHA, query_params)
+    return query_params
 
+
+def _get_response_content(resp: dict) -> Union[str, bytes]:
+    """
+    Gets the content of a Wolfram|Alpha response
+    :param resp: dict response from the API
+    :return: str text response or bytes response for 'full'
+    """
     if resp["status_code"] != 200:
         LOG.error(f"Non-success response: {resp}")  # TODO: Handle failures
         if resp["status_code"] == 403:
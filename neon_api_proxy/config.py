@@ -29,7 +29,7 @@
 import json
 
 from os import environ, path
-from ovos_utils.log import LOG
+from ovos_utils.log import LOG, log_deprecation
 
 
 def get_proxy_config() -> dict:
@@ -53,3 +53,44 @@ def get_proxy_config() -> dict:
     with open(valid_config_path) as input_file:
         proxy_service_config = json.load(input_file)
     return proxy_service_config
+
+
+def get_api_services_config() -> dict:
+    """
+    Locates proxy service configuration, preferring deprecated config files
+    :return: dict of service name to service configuration
+    """
+    # Configuration modules are imported here so clients that only forward
+    # requests do not load them
+    legacy_config = get_proxy_config()
+    if legacy_config:
+        return legacy_config.get("SERVICES") or legacy_config
+    from ovos_config.locations import get_xdg_config_save_path
+    legacy_config_file = path.join(get_xdg_config_save_path(),
+                                   "ngi_auth_vars.yml")
+    if path.isfile(legacy_config_file):
+        from neon_utils.configuration_utils import NGIConfig
+        log_deprecation(f"Legacy configuration found at: {legacy_config_file}. "
+                        f"This will be ignored in future versions. "
+                        f"Default configuration handling will use "
+                        f"~/.config/neon/diana.yaml.",
+                        "1.0.0")
+        return NGIConfig("ngi_auth_vars").get("api_services") or dict()
+    else:
+        from ovos_config.config import Configuration
+        config = Configuration()
+        return config.get("keys", {}).get("api_services") or \
+            config.get("api_services") or dict()
+
+
+def has_local_api_keys(config: dict = None) -> bool:
+    """
+    Checks if any service is configured with an API key, so requests may be
+    handled without forwarding them to the proxy
+    :param config: dict of service name to service configuration
+    :return: True if any service has an `api_key`
+    """
+    config = get_api_services_config() if config is None else config
+    return any(isinstance(service_config, dict) and
+               service_config.get("api_key")
+               for service_config in config.values())
@@ -26,17 +26,22 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from os.path import join, isfile
-from ovos_utils.log import LOG, log_deprecation
-from ovos_config.config import Configuration
-from neon_utils.configuration_utils import NGIConfig
-from ovos_config.locations import get_xdg_config_save_path
+import asyncio
+import json
 
-from neon_api_proxy.services.map_maker_api import MapMakerAPI
-from neon_api_proxy.services.owm_api import OpenWeatherAPI
-from neon_api_proxy.services.alpha_vantage_api import AlphaVantageAPI
-from neon_api_proxy.services.wolfram_api import WolframAPI
-from neon_api_proxy.services.test_api import TestAPI
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from os import environ
+from time import time
+from typing import Any, Iterable, List, Optional
+from ovos_utils.log import LOG
+
+from neon_api_proxy.bulkhead import Bulkhead
+from neon_api_proxy.cached_api import set_request_deadline
+from neon_api_proxy.config import get_api_services_config
+from neon_api_proxy.metrics import render_prometheus, start_request_info
+from neon_api_proxy.registry import ServiceRegistry
 
 
 class NeonAPIProxyController:
@@ -44,83 +49,451 @@ class NeonAPIProxyController:
     Resolves a service name to an instance to provide external API access
     """
 
-    # Mapping between string service name and actual class
+    # Mapping between string service name and actual class (or its import
+    # path, so it is only imported when the service is used)
     service_class_mapping = {
-        'wolfram_alpha': WolframAPI,
-        'alpha_vantage': AlphaVantageAPI,
-        'open_weather_map': OpenWeatherAPI,
-        'map_maker': MapMakerAPI,
-        'api_test_endpoint': TestAPI
+        'wolfram_alpha':
+            'neon_api_proxy.services.wolfram_api:WolframAPI',
+        'alpha_vantage':
+            'neon_api_proxy.services.alpha_vantage_api:AlphaVantageAPI',
+        'open_weather_map':
+            'neon_api_proxy.services.owm_api:OpenWeatherAPI',
+        'map_maker':
+            'neon_api_proxy.services.map_maker_api:MapMakerAPI',
+        'api_test_endpoint':
+            'neon_api_proxy.services.test_api:TestAPI'
     }
 
-    def __init__(self, config: dict = None):
+    # Max queries in a batch request
+    max_batch_size = 32
+    # Max queries of batch requests resolved concurrently
+    batch_workers = 16
+    # Batch request options applied to each of its queries
+    batch_options = ('deadline', 'include_metadata')
+
+    def __init__(self, config: dict = None,
+                 services: Optional[Iterable[str]] = None):
         """
             @param config: configurations dictionary
+            @param services: names of services to provide. Defaults to the
+                comma-separated `NEON_API_PROXY_SERVICES` envvar, else all
         """
         self.config = config or self._init_config()
+        if services is None and environ.get('NEON_API_PROXY_SERVICES'):
+            services = [s.strip() for s in
+                        environ['NEON_API_PROXY_SERVICES'].split(',')
+                        if s.strip()]
+        self.enabled_services = None if services is None else list(services)
         self.service_instance_mapping = self.init_service_instances(
             self.service_class_mapping)
+        self.bulkheads = self.init_bulkheads()
+        self._batch_executor = ThreadPoolExecutor(
+            max_workers=self.batch_workers,
+            thread_name_prefix="neon_api_batch")
 
     @staticmethod
     def _init_config() -> dict:
-        from neon_api_proxy.config import get_proxy_config
-        legacy_config = get_proxy_config()
-        if legacy_config:
-            return legacy_config.get("SERVICES") or legacy_config
-        legacy_config_file = join(get_xdg_config_save_path(),
-                                  "ngi_auth_vars.yml")
-        if isfile(legacy_config_file):
-            log_deprecation(f"Legacy configuration found at: {legacy_config_file}. "
-                            f"This will be ignored in future versions. "
-                            f"Default configuration handling will use "
-                            f"~/.config/neon/diana.yaml.",
-                            "1.0.0")
-            return NGIConfig("ngi_auth_vars").get("api_services") or dict()
-        else:
-            config = Configuration()
-            return config.get("keys", {}).get("api_services") or \
-                config.get("api_services") or dict()
+        return get_api_services_config()
 
-    def init_service_instances(self, service_class_mapping: dict) -> dict:
+    def init_service_instances(self, service_class_mapping: dict) -> \
+            ServiceRegistry:
         """
-        Maps service classes to their instances
+        Maps service classes to their instances. Services are instantiated
+        when first requested.
         @param service_class_mapping: dictionary containing mapping between
             service string name and python class representing it
 
-        @return dictionary containing mapping between service string name
-                and instance of python class representing it
-        """
-        service_mapping = dict()
-        for item in service_class_mapping:
-            service_config = self.config.get(item) or dict()
-            try:
-                if service_config.get("api_key") is None and item not in \
-                        ('api_test_endpoint', "ip_api"):
-                    LOG.warning(f"No API key for {item} in "
-                                f"{list(self.config.keys())}")
-                service_mapping[item] = \
-                    service_class_mapping[item](**service_config)
-            except Exception as e:
-                LOG.error(e)
-        return service_mapping
+        @return mapping between service string name and instance of python
+                class representing it
+        """
+        return ServiceRegistry(self.config, service_class_mapping,
+                               self.enabled_services)
+
+    def init_bulkheads(self) -> dict:
+        """
+        Creates concurrency limits for services configured with
+        `max_concurrent` (and optionally `max_queued` and `queue_timeout`)
+        @return: dictionary of service string name to Bulkhead
+        """
+        bulkheads = dict()
+        for item, service_config in self.config.items():
+            if not isinstance(service_config, dict) or \
+                    not self.service_instance_mapping.is_enabled(item):
+                continue
+            if service_config.get("max_concurrent"):
+                bulkheads[item] = Bulkhead(
+                    int(service_config["max_concurrent"]),
+                    service_config.get("max_queued"),
+                    service_config.get("queue_timeout", 10))
+        return bulkheads
 
     def resolve_query(self, query: dict) -> dict:
         """
         Generically resolves input query dictionary by mapping its "service"
+        @param query: dictionary with query parameters. If `include_metadata`
+            is True, cache and latency details are added to the response. If
+            `deadline` (epoch seconds) is specified, upstream requests are
+            limited to the time remaining until then. A query with a list of
+            `queries` is resolved as a batch with `resolve_queries`.
+        @return: response from the destination service
+        """
+        if 'queries' in query:
+            return self._resolve_batch(query)
+        target_service = query.get('service')
+        message_id, include_metadata, deadline = \
+            self._pop_request_options(query)
+        if self.service_instance_mapping.get(target_service) is not None:
+            bulkhead = self.bulkheads.get(target_service)
+            if deadline is not None and deadline <= time():
+                resp = self._expire_query(target_service)
+            elif bulkhead and not bulkhead.acquire(
+                    None if deadline is None else deadline - time()):
+                resp = self._reject_query(target_service)
+            else:
+                try:
+                    set_request_deadline(deadline)
+                    resp = self._handle_query(target_service, query,
+                                              include_metadata)
+                finally:
+                    if bulkhead:
+                        bulkhead.release()
+        else:
+            resp = self._unresolved_query(target_service)
+        resp['message_id'] = message_id
+        return resp
+
+    async def resolve_query_async(self, query: dict) -> dict:
+        """
+        Resolves a query like `resolve_query` without blocking the event loop
         @param query: dictionary with query parameters
         @return: response from the destination service
         """
+        if 'queries' in query:
+            return await self._resolve_batch_async(query)
         target_service = query.get('service')
-        message_id = query.pop('message_id', None)
-        if target_service and target_service in \
-                list(self.service_instance_mapping):
-            resp = self.service_instance_mapping[target_service].\
-                handle_query(**query)
+        message_id, include_metadata, deadline = \
+            self._pop_request_options(query)
+        if self.service_instance_mapping.get(target_service) is not None:
+            bulkhead = self.bulkheads.get(target_service)
+            if deadline is not None and deadline <= time():
+                resp = self._expire_query(target_service)
+            elif bulkhead and not (
+                    bulkhead.try_acquire() or
+                    await asyncio.get_event_loop().run_in_executor(
+                        None, bulkhead.acquire,
+                        None if deadline is None else deadline - time())):
+                resp = self._reject_query(target_service)
+            else:
+                try:
+                    set_request_deadline(deadline)
+                    resp = await self._handle_query_async(
+                        target_service, query, include_metadata)
+                finally:
+                    if bulkhead:
+                        bulkhead.release()
         else:
-            resp = {
-                "status_code": 401,
-                "content": f"Unresolved service name: {target_service}",
-                "encoding": "utf-8"
-            }
+            resp = self._unresolved_query(target_service)
         resp['message_id'] = message_id
         return resp
+
+    def resolve_queries(self, queries: List[dict]) -> List[dict]:
+        """
+        Resolves multiple queries concurrently. Identical queries are only
+        resolved once.
+        @param queries: list of query dictionaries
+        @return: list of responses, in the order of `queries`
+        """
+        keys = [self._get_batch_key(query) for query in queries]
+        unique = dict(zip(keys, queries))
+        futures = {key: self._batch_executor.submit(self._resolve_batch_item,
+                                                    query)
+                   for key, query in unique.items()}
+        results = {key: future.result() for key, future in futures.items()}
+        return [dict(results[key]) for key in keys]
+
+    async def resolve_queries_async(self, queries: List[dict]) -> List[dict]:
+        """
+        Resolves multiple queries concurrently without blocking the event
+        loop. Identical queries are only resolved once.
+        @param queries: list of query dictionaries
+        @return: list of responses, in the order of `queries`
+        """
+        keys = [self._get_batch_key(query) for query in queries]
+        unique = dict(zip(keys, queries))
+        responses = await asyncio.gather(
+            *[self._resolve_batch_item_async(query)
+              for query in unique.values()])
+        results = dict(zip(unique.keys(), responses))
+        return [dict(results[key]) for key in keys]
+
+    @staticmethod
+    def _get_batch_key(query: Any) -> str:
+        """
+        Get a key identifying identical queries in a batch
+        @param query: query dictionary
+        @return: string key
+        """
+        try:
+            return json.dumps(query, sort_keys=True, default=str)
+        except TypeError:
+            return repr(query)
+
+    def _resolve_batch_item(self, query: Any) -> dict:
+        """
+        Resolves one query of a batch
+        @param query: query dictionary
+        @return: response from the destination service
+        """
+        try:
+            self._validate_batch_item(query)
+            return self.resolve_query(dict(query))
+        except Exception as e:
+            return {"status_code": -1, "content": repr(e), "encoding": None}
+
+    async def _resolve_batch_item_async(self, query: Any) -> dict:
+        """
+        Resolves one query of a batch without blocking the event loop
+        @param query: query dictionary
+        @return: response from the destination service
+        """
+        try:
+            self._validate_batch_item(query)
+            return await self.resolve_query_async(dict(query))
+        except Exception as e:
+            return {"status_code": -1, "content": repr(e), "encoding": None}
+
+    @staticmethod
+    def _validate_batch_item(query: Any):
+        """
+        Checks that a query in a batch may be resolved
+        @param query: query dictionary
+        """
+        if not isinstance(query, dict):
+            raise TypeError(f"Expected dict, got: {query}")
+        if 'queries' in query:
+            raise ValueError("Batch requests may not be nested")
+
+    def _resolve_batch(self, query: dict) -> dict:
+        """
+        Resolves a batch request
+        @param query: dictionary with a list of `queries` and batch options
+        @return: response with a list of `responses`
+        """
+        try:
+            queries = self._get_batch_queries(query)
+        except ValueError as e:
+            return self._invalid_batch(query, e)
+        return self._batch_response(query, self.resolve_queries(queries))
+
+    async def _resolve_batch_async(self, query: dict) -> dict:
+        """
+        Resolves a batch request without blocking the event loop
+        @param query: dictionary with a list of `queries` and batch options
+        @return: response with a list of `responses`
+        """
+        try:
+            queries = self._get_batch_queries(query)
+        except ValueError as e:
+            return self._invalid_batch(query, e)
+        return self._batch_response(
+            query, await self.resolve_queries_async(queries))
+
+    def _get_batch_queries(self, query: dict) -> List[Any]:
+        """
+        Gets the queries of a batch request with batch options applied
+        @param query: dictionary with a list of `queries` and batch options
+        @return: list of queries
+        """
+        queries = query.get('queries')
+        if not isinstance(queries, list) or not queries or \
+                len(queries) > self.max_batch_size:
+            raise ValueError(f"Expected a list of 1 to {self.max_batch_size} "
+                             f"queries")
+        options = {key: query[key] for key in self.batch_options
+                   if key in query}
+        return [{**options, **item} if isinstance(item, dict) else item
+                for item in queries]
+
+    @staticmethod
+    def _invalid_batch(query: dict, error: Exception) -> dict:
+        """
+        Builds the response to an invalid batch request
+        @param query: batch request
+        @param error: reason the batch is invalid
+        @return: error response
+        """
+        return {"status_code": 400,
+                "content": str(error),
+                "encoding": "utf-8",
+                "message_id": query.get('message_id')}
+
+    @staticmethod
+    def _batch_response(query: dict, responses: List[dict]) -> dict:
+        """
+        Builds the response to a batch request
+        @param query: batch request
+        @param responses: responses to each query in the batch
+        @return: response with a list of `responses`
+        """
+        return {"status_code": 200,
+                "responses": responses,
+                "message_id": query.get('message_id')}
+
+    @staticmethod
+    def _pop_request_options(query: dict) -> tuple:
+        """
+        Removes options handled by the proxy from a query
+        @param query: dictionary with query parameters
+        @return: message_id, include_metadata, and deadline of the query
+        """
+        message_id = query.pop('message_id', None)
+        include_metadata = query.pop('include_metadata', False)
+        deadline = query.pop('deadline', None)
+        deadline = float(deadline) if deadline is not None else None
+        return message_id, include_metadata, deadline
+
+    @staticmethod
+    def _unresolved_query(target_service: str) -> dict:
+        """
+        Builds the response for a query to an unknown service
+        @param target_service: name of the requested service
+        @return: error response
+        """
+        return {
+            "status_code": 401,
+            "content": f"Unresolved service name: {target_service}",
+            "encoding": "utf-8"
+        }
+
+    def get_affinity_key(self, query: dict) -> Optional[str]:
+        """
+        Get a key identifying the cache entry a query resolves to, so requests
+        for the same entry can be routed to the same proxy instance
+        @param query: dictionary with query parameters
+        @return: key prefixed with the service name, or None if the query
+            should be handled by any instance
+        """
+        target_service = query.get('service')
+        service = self.service_instance_mapping.get(target_service)
+        if not hasattr(service, "get_affinity_key"):
+            return None
+        try:
+            key = service.get_affinity_key(
+                **{k: v for k, v in query.items() if k != 'service'})
+        except Exception as e:
+            LOG.warning(f"Failed to get affinity key for {target_service}: "
+                        f"{e}")
+            return None
+        return f"{target_service}:{key}" if key else None
+
+    def _handle_query(self, target_service: str, query: dict,
+                      include_metadata: bool = False) -> dict:
+        """
+        Passes a query to a service, recording its latency
+        @param target_service: name of the service to query
+        @param query: dictionary with query parameters
+        @param include_metadata: if True, add cache and latency details
+        @return: response from the service
+        """
+        service = self.service_instance_mapping[target_service]
+        request_info = start_request_info()
+        start = time()
+        resp = service.handle_query(**query)
+        return self._record_query(target_service, resp, request_info,
+                                  time() - start, include_metadata)
+
+    async def _handle_query_async(self, target_service: str, query: dict,
+                                  include_metadata: bool = False) -> dict:
+        """
+        Passes a query to a service without blocking the event loop,
+        recording its latency
+        @param target_service: name of the service to query
+        @param query: dictionary with query parameters
+        @param include_metadata: if True, add cache and latency details
+        @return: response from the service
+        """
+        service = self.service_instance_mapping[target_service]
+        request_info = start_request_info()
+        start = time()
+        if hasattr(service, "handle_query_async"):
+            resp = await service.handle_query_async(**query)
+        else:
+            resp = await asyncio.get_event_loop().run_in_executor(
+                None, partial(copy_context().run, service.handle_query,
+                              **query))
+        return self._record_query(target_service, resp, request_info,
+                                  time() - start, include_metadata)
+
+    def _record_query(self, target_service: str, resp: dict,
+                      request_info: dict, latency: float,
+                      include_metadata: bool) -> dict:
+        """
+        Records the latency of a handled query
+        @param target_service: name of the queried service
+        @param resp: response from the service
+        @param request_info: cache and upstream details of the request
+        @param latency: seconds the query took
+        @param include_metadata: if True, add request details to `resp`
+        @return: response from the service, with `cache_ttl` if the proxy
+            caches it
+        """
+        service = self.service_instance_mapping[target_service]
+        if hasattr(service, "metrics"):
+            service.metrics.record_request(latency)
+        if request_info.get('cache_ttl') and isinstance(resp, dict):
+            # Lets clients cache the response for as long as the proxy does
+            resp['cache_ttl'] = request_info['cache_ttl']
+        if include_metadata:
+            resp['metadata'] = {**request_info,
+                                "service": target_service,
+                                "latency": round(latency, 6)}
+        return resp
+
+    def _reject_query(self, target_service: str) -> dict:
+        """
+        Builds the response for a query rejected because its service is busy
+        @param target_service: name of the requested service
+        @return: error response
+        """
+        LOG.warning(f"Rejecting request to busy service: {target_service}")
+        service = self.service_instance_mapping[target_service]
+        if hasattr(service, "metrics"):
+            service.metrics.record_rejected()
+        return {
+            "status_code": 503,
+            "content": f"Service busy: {target_service}",
+            "encoding": "utf-8"
+        }
+
+    def record_expired(self, target_service: str):
+        """
+        Counts a request dropped because its deadline passed
+        @param target_service: name of the requested service
+        """
+        service = self.service_instance_mapping.get(target_service)
+        if hasattr(service, "metrics"):
+            service.metrics.record_expired()
+
+    def _expire_query(self, target_service: str) -> dict:
+        """
+        Builds the response for a query whose deadline already passed
+        @param target_service: name of the requested service
+        @return: error response
+        """
+        LOG.info(f"Dropping expired request to: {target_service}")
+        self.record_expired(target_service)
+        return {
+            "status_code": 504,
+            "content": f"Request deadline exceeded: {target_service}",
+            "encoding": "utf-8"
+        }
+
+    def get_metrics(self) -> str:
+        """
+        Get cache and upstream metrics for all services
+        @return: metrics in Prometheus text format
+        """
+        return render_prometheus(
+            {name: service.metrics for name, service in
+             self.service_instance_mapping.loaded().items()
+             if hasattr(service, "metrics")})
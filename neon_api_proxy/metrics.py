@@ -0,0 +1,240 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from collections import Counter
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict
+from ovos_utils.log import LOG
+
+# Upper bounds (seconds) of latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+# Details about the request being handled in the current thread/task
+_request_info = ContextVar("request_info", default=None)
+
+
+def start_request_info() -> dict:
+    """
+    Start collecting details about a request in the current context
+    @return: dict that will be updated with request details
+    """
+    info = dict()
+    _request_info.set(info)
+    return info
+
+
+def update_request_info(**kwargs):
+    """
+    Add details to the request being handled in the current context, if any
+    """
+    info = _request_info.get()
+    if info is not None:
+        info.update(kwargs)
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values
+    """
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """
+        Record one observed value
+        @param value: value to record
+        """
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+        self.sum += value
+        self.count += 1
+
+
+class ServiceMetrics:
+    """
+    Cache and upstream counters and latencies for one service
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.cache_results = Counter({"hit": 0, "miss": 0, "stale": 0,
+                                      "coalesced": 0})
+        self.coalesced_requests = 0
+        self.rejected_requests = 0
+        self.expired_requests = 0
+        self.upstream_responses = Counter()
+        self.upstream_latency = Histogram()
+        self.request_latency = Histogram()
+
+    def record_cache_result(self, result: str):
+        """
+        Record the result of a cache lookup
+        @param result: one of "hit", "miss", "stale", or "coalesced"
+        """
+        with self._lock:
+            self.cache_results[result] += 1
+
+    def record_coalesced(self):
+        """
+        Record a request that shared another caller's upstream request
+        """
+        with self._lock:
+            self.coalesced_requests += 1
+
+    def record_rejected(self):
+        """
+        Record a request rejected because the service was at capacity
+        """
+        with self._lock:
+            self.rejected_requests += 1
+
+    def record_expired(self):
+        """
+        Record a request dropped because its deadline passed before it was
+        handled
+        """
+        with self._lock:
+            self.expired_requests += 1
+
+    def record_upstream(self, status: str, latency: float):
+        """
+        Record a request made to the upstream API
+        @param status: HTTP status code or "error" if the request failed
+        @param latency: seconds the upstream request took
+        """
+        with self._lock:
+            self.upstream_responses[str(status)] += 1
+            self.upstream_latency.observe(latency)
+
+    def record_request(self, latency: float):
+        """
+        Record a request handled by this service
+        @param latency: seconds to handle the request
+        """
+        with self._lock:
+            self.request_latency.observe(latency)
+
+
+def _format_histogram(name: str, labels: str, histogram: Histogram) -> list:
+    lines = list()
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+def render_prometheus(services: Dict[str, ServiceMetrics]) -> str:
+    """
+    Format service metrics in the Prometheus text exposition format
+    @param services: dict of service name to ServiceMetrics
+    @return: metrics text
+    """
+    prefix = "neon_api_proxy"
+    cache = [f"# HELP {prefix}_cache_requests_total Cache lookups by result",
+             f"# TYPE {prefix}_cache_requests_total counter"]
+    coalesced = [f"# HELP {prefix}_coalesced_requests_total Requests that "
+                 f"shared an in-flight upstream request",
+                 f"# TYPE {prefix}_coalesced_requests_total counter"]
+    rejected = [f"# HELP {prefix}_rejected_requests_total Requests rejected "
+                f"because the service was at capacity",
+                f"# TYPE {prefix}_rejected_requests_total counter"]
+    expired = [f"# HELP {prefix}_expired_requests_total Requests dropped "
+               f"because their deadline passed",
+               f"# TYPE {prefix}_expired_requests_total counter"]
+    upstream = [f"# HELP {prefix}_upstream_responses_total Upstream "
+                f"responses by status code",
+                f"# TYPE {prefix}_upstream_responses_total counter"]
+    upstream_latency = [f"# HELP {prefix}_upstream_latency_seconds Upstream "
+                        f"request latency",
+                        f"# TYPE {prefix}_upstream_latency_seconds histogram"]
+    request_latency = [f"# HELP {prefix}_request_latency_seconds Total "
+                       f"request handling latency",
+                       f"# TYPE {prefix}_request_latency_seconds histogram"]
+    for service, metrics in sorted(services.items()):
+        labels = f'service="{service}"'
+        with metrics._lock:
+            for result, count in sorted(metrics.cache_results.items()):
+                cache.append(f'{prefix}_cache_requests_total'
+                             f'{{{labels},result="{result}"}} {count}')
+            coalesced.append(f'{prefix}_coalesced_requests_total{{{labels}}} '
+                             f'{metrics.coalesced_requests}')
+            rejected.append(f'{prefix}_rejected_requests_total{{{labels}}} '
+                            f'{metrics.rejected_requests}')
+            expired.append(f'{prefix}_expired_requests_total{{{labels}}} '
+                           f'{metrics.expired_requests}')
+            for status, count in sorted(metrics.upstream_responses.items()):
+                upstream.append(f'{prefix}_upstream_responses_total'
+                                f'{{{labels},status="{status}"}} {count}')
+            upstream_latency += _format_histogram(
+                f"{prefix}_upstream_latency_seconds", labels,
+                metrics.upstream_latency)
+            request_latency += _format_histogram(
+                f"{prefix}_request_latency_seconds", labels,
+                metrics.request_latency)
+    return "\n".join(cache + coalesced + rejected + expired + upstream +
+                     upstream_latency + request_latency) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.get_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(get_metrics: Callable[[], str], port: int,
+                         host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve metrics at `/metrics` for Prometheus to scrape
+    @param get_metrics: method returning Prometheus-formatted metrics text
+    @param port: port to listen on (0 for any available port)
+    @param host: address to bind to
+    @return: running server
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.get_metrics = get_metrics
+    Thread(target=server.serve_forever, daemon=True).start()
+    LOG.info(f"Serving metrics at http://{host}:{server.server_port}/metrics")
+    return server
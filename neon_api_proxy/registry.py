@@ -0,0 +1,170 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from collections.abc import Mapping
+from importlib import import_module
+from threading import Lock
+from typing import Any, Iterable, Optional
+
+from ovos_utils.log import LOG
+
+# Entry point group plugins register service classes under
+SERVICE_ENTRY_POINT = "neon_api_proxy.services"
+
+
+def get_service_entry_points() -> dict:
+    """
+    Finds service classes registered by installed packages
+    @return: dict of service name to entry point
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # Python < 3.8
+        from importlib_metadata import entry_points
+    plugins = entry_points()
+    if hasattr(plugins, "select"):
+        plugins = plugins.select(group=SERVICE_ENTRY_POINT)
+    else:
+        plugins = plugins.get(SERVICE_ENTRY_POINT, [])
+    return {plugin.name: plugin for plugin in plugins}
+
+
+class ServiceRegistry(Mapping):
+    """
+    Maps service names to service instances. Services are imported and
+    instantiated on first use, so a process only pays for the services it
+    queries. Iterating the registry loads every enabled service.
+    """
+    def __init__(self, config: dict, service_classes: dict,
+                 enabled: Optional[Iterable[str]] = None):
+        """
+        @param config: dict of service name to service configuration
+        @param service_classes: dict of service name to class, or to an
+            import path of the class (`module:Class`). Services registered
+            under the `neon_api_proxy.services` entry point are added to these.
+        @param enabled: names of services to provide (defaults to all)
+        """
+        self.config = config
+        self.enabled = None if enabled is None else set(enabled)
+        self._service_classes = dict(service_classes)
+        self._plugins = None
+        self._services = dict()
+        self._failed = set()
+        self._lock = Lock()
+
+    @property
+    def names(self) -> list:
+        """
+        Names of enabled services, including any not yet loaded
+        """
+        if self.enabled is not None and \
+                self.enabled.issubset(self._service_classes):
+            # Plugins are only discovered when they may be needed
+            names = self._service_classes
+        else:
+            names = {**self._get_plugins(), **self._service_classes}
+        return [name for name in names if self.is_enabled(name)]
+
+    def is_enabled(self, name: str) -> bool:
+        """
+        Check if a deployment provides a service
+        @param name: service name
+        @return: True if the service may be loaded
+        """
+        return self.enabled is None or name in self.enabled
+
+    def loaded(self) -> dict:
+        """
+        Get the services that have been instantiated, without loading more
+        @return: dict of service name to instance
+        """
+        return dict(self._services)
+
+    def __getitem__(self, name: str) -> Any:
+        service = self._services.get(name)
+        if service is None:
+            service = self._load(name)
+        if service is None:
+            raise KeyError(name)
+        return service
+
+    def __iter__(self):
+        return iter([name for name in self.names if name in self])
+
+    def __len__(self) -> int:
+        return len(list(iter(self)))
+
+    def _get_plugins(self) -> dict:
+        if self._plugins is None:
+            self._plugins = get_service_entry_points()
+        return self._plugins
+
+    def _get_class(self, name: str) -> Optional[type]:
+        """
+        Imports the class of a service
+        @param name: service name
+        @return: service class, or None if no service has that name
+        """
+        service_class = self._service_classes.get(name)
+        if service_class is None:
+            plugin = self._get_plugins().get(name)
+            return plugin.load() if plugin else None
+        if isinstance(service_class, str):
+            module, attr = service_class.split(':')
+            service_class = getattr(import_module(module), attr)
+        return service_class
+
+    def _load(self, name: str) -> Optional[Any]:
+        """
+        Instantiates a service
+        @param name: service name
+        @return: service instance, or None if it is unavailable
+        """
+        if not isinstance(name, str) or not self.is_enabled(name) or \
+                name in self._failed:
+            return None
+        with self._lock:
+            if name in self._services:
+                return self._services[name]
+            service_config = self.config.get(name) or dict()
+            try:
+                service_class = self._get_class(name)
+                if service_class is None:
+                    return None
+                if service_config.get("api_key") is None and name not in \
+                        ('api_test_endpoint', "ip_api"):
+                    LOG.warning(f"No API key for {name} in "
+                                f"{list(self.config.keys())}")
+                self._services[name] = service_class(**service_config)
+                LOG.debug(f"Loaded service: {name}")
+                return self._services[name]
+            except Exception as e:
+                LOG.error(e)
+                self._failed.add(name)
+                return None
@@ -48,10 +48,12 @@ class AlphaVantageAPI(CachedAPI):
     API for querying Alpha Vantage.
     """
 
-    def __init__(self, api_key: str = None, cache_seconds: int = 300, **_):
-        super().__init__("alpha_vantage")
+    def __init__(self, api_key: str = None, cache_seconds: int = 300,
+                 symbol_cache_seconds: int = 86400, **kwargs):
+        super().__init__("alpha_vantage", **kwargs)
         self._api_key = api_key or find_neon_alpha_vantage_key()
         self.quote_timeout = timedelta(seconds=cache_seconds)
+        self.symbol_timeout = timedelta(seconds=symbol_cache_seconds)
 
     def _search_symbol(self, query: str) -> dict:
         if not query:
@@ -61,7 +63,8 @@ class AlphaVantageAPI(CachedAPI):
         query_params = {"keywords": query,
                         "apikey": self._api_key}
         query_str = urllib.parse.urlencode(query_params)
-        resp = self.get_with_cache_timeout(f"{QueryUrl.SYMBOL}&{query_str}")
+        resp = self.get_with_cache_timeout(f"{QueryUrl.SYMBOL}&{query_str}",
+                                           self.symbol_timeout)
         return {"status_code": resp.status_code,
                 "content": resp.content,
                 "encoding": resp.encoding}
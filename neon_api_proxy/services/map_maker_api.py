@@ -30,11 +30,13 @@ import urllib.parse
 
 from datetime import timedelta
 from os import getenv
+from threading import Lock
 from time import time, sleep
 from requests import Response
+from requests.exceptions import Timeout
 from ovos_utils.log import LOG
 
-from neon_api_proxy.cached_api import CachedAPI
+from neon_api_proxy.cached_api import CachedAPI, get_request_deadline
 
 
 class MapMakerAPI(CachedAPI):
@@ -42,13 +44,15 @@ class MapMakerAPI(CachedAPI):
     API for querying My Maps API (geocoder.maps.co).
     """
 
-    def __init__(self, api_key: str = None, cache_seconds: int = 604800, **_):  # Cache week
-        super().__init__("map_maker")
+    def __init__(self, api_key: str = None, cache_seconds: int = 604800,
+                 **kwargs):  # Cache week
+        super().__init__("map_maker", **kwargs)
         self._api_key = api_key or getenv("MAP_MAKER_KEY")
         if not self._api_key:
             raise RuntimeError(f"No API key provided for Map Maker")
         self._rate_limit_seconds = 1
         self._last_query = time()
+        self._rate_limit_lock = Lock()
         self.cache_timeout = timedelta(seconds=cache_seconds)
         self.geocode_url = "https://geocode.maps.co/search"
         self.reverse_url = "https://geocode.maps.co/reverse"
@@ -74,11 +78,7 @@ class MapMakerAPI(CachedAPI):
                     "encoding": None}
 
         if self._rate_limit_seconds:
-            sleep_time = round(self._rate_limit_seconds -
-                               (time() - self._last_query), 3)
-            if sleep_time > 0:
-                LOG.info(f"Waiting {sleep_time}s before next API query")
-                sleep(sleep_time)
+            self._wait_for_rate_limit()
 
         if lat and lon:
             # Lookup address for coordinates
@@ -91,11 +91,30 @@ class MapMakerAPI(CachedAPI):
         else:
             # Lookup coordinates for search term/address
             response = self._query_geocode(address)
-        self._last_query = time()
         return {"status_code": response.status_code,
                 "content": response.content,
                 "encoding": response.encoding}
 
+    def _wait_for_rate_limit(self):
+        """
+        Waits for the next query allowed by the rate limit. Each query
+        reserves its time before waiting, so concurrent queries are spaced out
+        instead of all waiting for the same time. A query that would not be
+        allowed before the deadline of the request fails without reserving a
+        time.
+        """
+        deadline = get_request_deadline()
+        with self._rate_limit_lock:
+            now = time()
+            query_time = max(now, self._last_query + self._rate_limit_seconds)
+            if deadline is not None and query_time >= deadline:
+                raise Timeout("Request deadline exceeded")
+            self._last_query = query_time
+        sleep_time = round(query_time - now, 3)
+        if sleep_time > 0:
+            LOG.info(f"Waiting {sleep_time}s before next API query")
+            sleep(sleep_time)
+
     def _query_geocode(self, address: str) -> Response:
         query_str = urllib.parse.urlencode({"q": address,
                                             "api_key": self._api_key})
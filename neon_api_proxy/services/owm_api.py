@@ -26,25 +26,46 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import json
 import urllib.parse
 from datetime import timedelta
 
+from typing import Optional, Tuple
 from requests import Response
 
 from neon_api_proxy.cached_api import CachedAPI
+from neon_api_proxy.services.owm_conditions import get_condition_descriptions
 from ovos_utils.log import LOG, log_deprecation
 from neon_utils.authentication_utils import find_neon_owm_key
 
 
+# Response fields that OWM reports in units dependent on the `units` param.
+# Pressure (hPa), precipitation (mm), and visibility (m) never change.
+TEMPERATURE_KEYS = ("temp", "feels_like", "dew_point", "temp_min", "temp_max")
+SPEED_KEYS = ("wind_speed", "wind_gust", "speed", "gust")
+
+
 class OpenWeatherAPI(CachedAPI):
     """
     API for querying Open Weather Map.
     """
+    # Responses are requested and cached in these units and language, then
+    # converted locally
+    canonical_units = "metric"
+    canonical_lang = "en"
 
-    def __init__(self, api_key: str = None, cache_seconds: int = 900, **_):
-        super().__init__("open_weather_map")
+    def __init__(self, api_key: str = None, cache_seconds: int = 900,
+                 coordinate_precision: Optional[int] = 2, **kwargs):
+        """
+        @param api_key: Open Weather Map API key
+        @param cache_seconds: time to cache weather responses
+        @param coordinate_precision: decimal places to round coordinates to
+            so nearby locations share cached responses (None to disable)
+        """
+        super().__init__("open_weather_map", **kwargs)
         self._api_key = api_key or find_neon_owm_key()
         self.cache_timeout = timedelta(seconds=cache_seconds)
+        self.coordinate_precision = coordinate_precision
 
     def handle_query(self, **kwargs) -> dict:
         """
@@ -53,40 +74,238 @@ class OpenWeatherAPI(CachedAPI):
           'lat' - str latitude
           'lng' - str longitude
           'units' - optional string "metric" or "imperial"
+          'lang' - optional language code for descriptions (default "en")
           'base_url' - base URL to target
         :return: dict containing `status_code`, `content`, `encoding`
             from URL response
         """
-        lat = kwargs.get("lat")
-        lng = kwargs.get("lng", kwargs.get("lon"))
-        api = kwargs.get('api') or "onecall"
-        lang = kwargs.get('lang') or "en"
-        units = "metric" if kwargs.get("units") == "metric" else "imperial"
+        lat, lng, api, lang, units = self._parse_query(kwargs)
+        if not all((lat, lng, units)):
+            return {"status_code": -1,
+                    "content": f"Missing required args in: {kwargs}",
+                    "encoding": None}
+        # Languages without bundled descriptions are requested upstream
+        descriptions = get_condition_descriptions(lang)
+        upstream_lang = self.canonical_lang if descriptions else lang
+        try:
+            resp = self._get_api_response(lat, lng, self.canonical_units,
+                                          api, upstream_lang)
+        except Exception as e:
+            return {"status_code": -1,
+                    "content": repr(e),
+                    "encoding": None}
+        return self._format_response(resp, units, lang, descriptions)
 
+    async def handle_query_async(self, **kwargs) -> dict:
+        """
+        Handles an incoming query without blocking the event loop
+        :param kwargs: query parameters as passed to `handle_query`
+        :return: dict containing `status_code`, `content`, `encoding`
+            from URL response
+        """
+        lat, lng, api, lang, units = self._parse_query(kwargs)
         if not all((lat, lng, units)):
             return {"status_code": -1,
                     "content": f"Missing required args in: {kwargs}",
                     "encoding": None}
+        descriptions = get_condition_descriptions(lang)
+        upstream_lang = self.canonical_lang if descriptions else lang
         try:
-            resp = self._get_api_response(lat, lng, units, api, lang)
+            resp = await self.get_with_cache_timeout_async(
+                self._build_api_url(lat, lng, self.canonical_units, api,
+                                    upstream_lang), self.cache_timeout)
         except Exception as e:
             return {"status_code": -1,
                     "content": repr(e),
                     "encoding": None}
+        return self._format_response(resp, units, lang, descriptions)
+
+    @staticmethod
+    def _parse_query(kwargs: dict) -> Tuple[str, str, str, str, str]:
+        """
+        Get request parameters from a query
+        :param kwargs: query parameters as passed to `handle_query`
+        :return: latitude, longitude, api, language, and units
+        """
+        lat = kwargs.get("lat")
+        lng = kwargs.get("lng", kwargs.get("lon"))
+        api = kwargs.get('api') or "onecall"
+        lang = kwargs.get('lang') or "en"
+        units = "metric" if kwargs.get("units") == "metric" else "imperial"
+        return lat, lng, api, lang, units
+
+    def _format_response(self, resp: Response, units: str, lang: str,
+                         descriptions: Optional[dict]) -> dict:
+        """
+        Builds the response to a query, converted to the requested units and
+        language
+        :param resp: Response or CachedResponse from the API
+        :param units: requested units
+        :param lang: requested language
+        :param descriptions: bundled condition descriptions for `lang`, if any
+        :return: dict containing `status_code`, `content`, `encoding`
+        """
+        upstream_lang = self.canonical_lang if descriptions else lang
         if not resp.ok:
             LOG.error(f"Bad response code: {resp.status_code}: "
                       f"content={resp.content}")
+            return {"status_code": resp.status_code,
+                    "content": resp.content,
+                    "encoding": resp.encoding}
+        content = resp.content
+        if units != self.canonical_units or upstream_lang != lang:
+            try:
+                data = self._convert_units(json.loads(content),
+                                           self.canonical_units, units)
+                if upstream_lang != lang:
+                    self._localize_descriptions(data, descriptions)
+                content = json.dumps(data, ensure_ascii=False,
+                                     separators=(',', ':')).encode('utf-8')
+            except Exception as e:
+                LOG.error(f"Failed to localize response: {e}")
+                return {"status_code": -1,
+                        "content": repr(e),
+                        "encoding": None}
         return {"status_code": resp.status_code,
-                "content": resp.content,
-                "encoding": resp.encoding}
+                "content": content,
+                "encoding": resp.encoding or "utf-8"}
+
+    @staticmethod
+    def _localize_descriptions(data: dict, descriptions: dict):
+        """
+        Replace `weather[].description` values in a onecall response
+        :param data: parsed JSON response data to update in place
+        :param descriptions: dict of condition code to localized description
+        """
+        entries = [data.get("current") or dict()] + \
+            list(data.get("hourly") or []) + list(data.get("daily") or [])
+        for entry in entries:
+            for condition in entry.get("weather") or []:
+                description = descriptions.get(condition.get("id"))
+                if description:
+                    condition["description"] = description
+
+    @staticmethod
+    def _convert_temperature(value: float, from_units: str,
+                             to_units: str) -> float:
+        """
+        Convert a temperature between OWM unit systems
+        :param value: temperature in `from_units`
+        :param from_units: "metric" (C), "imperial" (F), or "standard" (K)
+        :param to_units: "metric" (C), "imperial" (F), or "standard" (K)
+        :return: temperature in `to_units`
+        """
+        if from_units == "imperial":
+            value = (value - 32) * 5 / 9
+        elif from_units == "standard":
+            value = value - 273.15
+        if to_units == "imperial":
+            value = value * 9 / 5 + 32
+        elif to_units == "standard":
+            value = value + 273.15
+        return round(value, 2)
+
+    @staticmethod
+    def _convert_speed(value: float, from_units: str, to_units: str) -> float:
+        """
+        Convert a speed between OWM unit systems
+        :param value: speed in `from_units`
+        :param from_units: "metric" (m/s), "imperial" (mph), or "standard"
+        :param to_units: "metric" (m/s), "imperial" (mph), or "standard"
+        :return: speed in `to_units`
+        """
+        mph_per_mps = 1 / 0.44704
+        if from_units == "imperial":
+            value = value / mph_per_mps
+        if to_units == "imperial":
+            value = value * mph_per_mps
+        return round(value, 2)
+
+    def _convert_units(self, data, from_units: str, to_units: str):
+        """
+        Recursively convert unit-dependent values in an OWM response
+        :param data: parsed JSON response data
+        :param from_units: units `data` was requested in
+        :param to_units: units to return
+        :return: `data` with values converted to `to_units`
+        """
+        if from_units == to_units:
+            return data
+        if isinstance(data, list):
+            return [self._convert_units(i, from_units, to_units)
+                    for i in data]
+        if not isinstance(data, dict):
+            return data
+        converted = dict()
+        for key, value in data.items():
+            if key in TEMPERATURE_KEYS:
+                convert = self._convert_temperature
+            elif key in SPEED_KEYS:
+                convert = self._convert_speed
+            else:
+                converted[key] = self._convert_units(value, from_units,
+                                                     to_units)
+                continue
+            if isinstance(value, dict):
+                # Daily values, i.e. `{"day": 20.5, "night": 12.1, ...}`
+                converted[key] = {k: convert(v, from_units, to_units)
+                                  if isinstance(v, (int, float)) else v
+                                  for k, v in value.items()}
+            elif isinstance(value, (int, float)):
+                converted[key] = convert(value, from_units, to_units)
+            else:
+                converted[key] = value
+        return converted
+
+    def _quantize_coordinates(self, lat: str, lng: str) -> Tuple[str, str]:
+        """
+        Round coordinates to the configured precision
+        :param lat: str latitude
+        :param lng: str longitude
+        :return: tuple of str latitude, longitude snapped to a grid
+        """
+        if self.coordinate_precision is None or self.coordinate_precision < 0:
+            return lat, lng
+        precision = int(self.coordinate_precision)
+        # Adding 0.0 normalizes `-0.0` so it shares a key with `0.0`
+        return (f"{round(float(lat), precision) + 0.0:.{precision}f}",
+                f"{round(float(lng), precision) + 0.0:.{precision}f}")
+
+    def get_affinity_key(self, **kwargs) -> Optional[str]:
+        """
+        Get the cache key of the request a query resolves to
+        :param kwargs: query parameters as passed to `handle_query`
+        :return: cache key, or None for an invalid query
+        """
+        lat = kwargs.get("lat")
+        lng = kwargs.get("lng", kwargs.get("lon"))
+        lang = kwargs.get('lang') or "en"
+        if not (lat and lng):
+            return None
+        # Units are converted locally, so only language changes the request
+        upstream_lang = self.canonical_lang if \
+            get_condition_descriptions(lang) else lang
+        try:
+            return self.get_cache_key(self._build_api_url(
+                lat, lng, self.canonical_units, "onecall", upstream_lang))
+        except ValueError:
+            return None
 
     def _get_api_response(self, lat: str, lng: str, units: str,
                           api: str = "onecall", lang: str = "en") -> Response:
+        resp = self.get_with_cache_timeout(
+            self._build_api_url(lat, lng, units, api, lang),
+            self.cache_timeout)
+        return resp
+
+    def _build_api_url(self, lat: str, lng: str, units: str, api: str,
+                       lang: str) -> str:
         try:
             assert isinstance(float(lat), float), f"Invalid latitude: {lat}"
             assert isinstance(float(lng), float), f"Invalid longitude: {lng}"
         except AssertionError as e:
             raise ValueError(e)
+        lat, lng = self._quantize_coordinates(lat, lng)
         if api != "onecall":
             log_deprecation(f"{api} was requested but only `onecall` "
                             f"is supported", "1.0.0")
@@ -99,6 +318,4 @@ class OpenWeatherAPI(CachedAPI):
                         "lang": lang}
         query_str = urllib.parse.urlencode(query_params)
         base_url = "http://api.openweathermap.org/data/3.0"
-        resp = self.get_with_cache_timeout(f"{base_url}/{api}?{query_str}",
-                                           self.cache_timeout)
-        return resp
+        return f"{base_url}/{api}?{query_str}"
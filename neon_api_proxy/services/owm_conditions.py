@@ -0,0 +1,386 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Localized descriptions of Open Weather Map condition codes
+# (https://openweathermap.org/weather-conditions), used to translate
+# `weather[].description` so responses can be cached independent of language
+CONDITION_DESCRIPTIONS = {
+    "en": {
+        200: "thunderstorm with light rain",
+        201: "thunderstorm with rain",
+        202: "thunderstorm with heavy rain",
+        210: "light thunderstorm",
+        211: "thunderstorm",
+        212: "heavy thunderstorm",
+        221: "ragged thunderstorm",
+        230: "thunderstorm with light drizzle",
+        231: "thunderstorm with drizzle",
+        232: "thunderstorm with heavy drizzle",
+        300: "light intensity drizzle",
+        301: "drizzle",
+        302: "heavy intensity drizzle",
+        310: "light intensity drizzle rain",
+        311: "drizzle rain",
+        312: "heavy intensity drizzle rain",
+        313: "shower rain and drizzle",
+        314: "heavy shower rain and drizzle",
+        321: "shower drizzle",
+        500: "light rain",
+        501: "moderate rain",
+        502: "heavy intensity rain",
+        503: "very heavy rain",
+        504: "extreme rain",
+        511: "freezing rain",
+        520: "light intensity shower rain",
+        521: "shower rain",
+        522: "heavy intensity shower rain",
+        531: "ragged shower rain",
+        600: "light snow",
+        601: "snow",
+        602: "heavy snow",
+        611: "sleet",
+        612: "light shower sleet",
+        613: "shower sleet",
+        615: "light rain and snow",
+        616: "rain and snow",
+        620: "light shower snow",
+        621: "shower snow",
+        622: "heavy shower snow",
+        701: "mist",
+        711: "smoke",
+        721: "haze",
+        731: "sand/dust whirls",
+        741: "fog",
+        751: "sand",
+        761: "dust",
+        762: "volcanic ash",
+        771: "squalls",
+        781: "tornado",
+        800: "clear sky",
+        801: "few clouds",
+        802: "scattered clouds",
+        803: "broken clouds",
+        804: "overcast clouds",
+    },
+    "es": {
+        200: "tormenta con lluvia ligera",
+        201: "tormenta con lluvia",
+        202: "tormenta con lluvia intensa",
+        210: "tormenta ligera",
+        211: "tormenta",
+        212: "tormenta fuerte",
+        221: "tormenta irregular",
+        230: "tormenta con llovizna ligera",
+        231: "tormenta con llovizna",
+        232: "tormenta con llovizna intensa",
+        300: "llovizna ligera",
+        301: "llovizna",
+        302: "llovizna intensa",
+        310: "lluvia y llovizna ligera",
+        311: "lluvia y llovizna",
+        312: "lluvia y llovizna intensa",
+        313: "chubascos y llovizna",
+        314: "chubascos fuertes y llovizna",
+        321: "chubascos de llovizna",
+        500: "lluvia ligera",
+        501: "lluvia moderada",
+        502: "lluvia intensa",
+        503: "lluvia muy intensa",
+        504: "lluvia extrema",
+        511: "lluvia helada",
+        520: "chubascos ligeros",
+        521: "chubascos",
+        522: "chubascos intensos",
+        531: "chubascos irregulares",
+        600: "nevada ligera",
+        601: "nieve",
+        602: "nevada intensa",
+        611: "aguanieve",
+        612: "chubascos ligeros de aguanieve",
+        613: "chubascos de aguanieve",
+        615: "lluvia ligera y nieve",
+        616: "lluvia y nieve",
+        620: "chubascos ligeros de nieve",
+        621: "chubascos de nieve",
+        622: "chubascos intensos de nieve",
+        701: "neblina",
+        711: "humo",
+        721: "bruma",
+        731: "remolinos de arena o polvo",
+        741: "niebla",
+        751: "arena",
+        761: "polvo",
+        762: "ceniza volcánica",
+        771: "ráfagas",
+        781: "tornado",
+        800: "cielo claro",
+        801: "algunas nubes",
+        802: "nubes dispersas",
+        803: "nubes rotas",
+        804: "cielo cubierto",
+    },
+    "fr": {
+        200: "orage avec pluie légère",
+        201: "orage avec pluie",
+        202: "orage avec forte pluie",
+        210: "orage léger",
+        211: "orage",
+        212: "orage violent",
+        221: "orages irréguliers",
+        230: "orage avec bruine légère",
+        231: "orage avec bruine",
+        232: "orage avec forte bruine",
+        300: "bruine légère",
+        301: "bruine",
+        302: "forte bruine",
+        310: "pluie et bruine légères",
+        311: "pluie et bruine",
+        312: "fortes pluie et bruine",
+        313: "averses et bruine",
+        314: "fortes averses et bruine",
+        321: "averses de bruine",
+        500: "pluie légère",
+        501: "pluie modérée",
+        502: "forte pluie",
+        503: "très forte pluie",
+        504: "pluie extrême",
+        511: "pluie verglaçante",
+        520: "averses légères",
+        521: "averses",
+        522: "fortes averses",
+        531: "averses irrégulières",
+        600: "légères chutes de neige",
+        601: "neige",
+        602: "fortes chutes de neige",
+        611: "neige fondue",
+        612: "légères averses de neige fondue",
+        613: "averses de neige fondue",
+        615: "pluie légère et neige",
+        616: "pluie et neige",
+        620: "légères averses de neige",
+        621: "averses de neige",
+        622: "fortes averses de neige",
+        701: "brume",
+        711: "fumée",
+        721: "brume sèche",
+        731: "tourbillons de sable ou de poussière",
+        741: "brouillard",
+        751: "sable",
+        761: "poussière",
+        762: "cendres volcaniques",
+        771: "bourrasques",
+        781: "tornade",
+        800: "ciel dégagé",
+        801: "peu nuageux",
+        802: "partiellement nuageux",
+        803: "nuageux",
+        804: "couvert",
+    },
+    "de": {
+        200: "Gewitter mit leichtem Regen",
+        201: "Gewitter mit Regen",
+        202: "Gewitter mit starkem Regen",
+        210: "leichtes Gewitter",
+        211: "Gewitter",
+        212: "schweres Gewitter",
+        221: "vereinzelte Gewitter",
+        230: "Gewitter mit leichtem Nieselregen",
+        231: "Gewitter mit Nieselregen",
+        232: "Gewitter mit starkem Nieselregen",
+        300: "leichter Nieselregen",
+        301: "Nieselregen",
+        302: "starker Nieselregen",
+        310: "leichter Nieselregen mit Regen",
+        311: "Nieselregen mit Regen",
+        312: "starker Nieselregen mit Regen",
+        313: "Regenschauer und Nieselregen",
+        314: "starke Regenschauer und Nieselregen",
+        321: "Nieselschauer",
+        500: "leichter Regen",
+        501: "mäßiger Regen",
+        502: "starker Regen",
+        503: "sehr starker Regen",
+        504: "extremer Regen",
+        511: "gefrierender Regen",
+        520: "leichte Regenschauer",
+        521: "Regenschauer",
+        522: "starke Regenschauer",
+        531: "vereinzelte Regenschauer",
+        600: "leichter Schneefall",
+        601: "Schnee",
+        602: "starker Schneefall",
+        611: "Schneeregen",
+        612: "leichte Schneeregenschauer",
+        613: "Schneeregenschauer",
+        615: "leichter Regen und Schnee",
+        616: "Regen und Schnee",
+        620: "leichte Schneeschauer",
+        621: "Schneeschauer",
+        622: "starke Schneeschauer",
+        701: "trüb",
+        711: "Rauch",
+        721: "Dunst",
+        731: "Sand- oder Staubwirbel",
+        741: "Nebel",
+        751: "Sand",
+        761: "Staub",
+        762: "Vulkanasche",
+        771: "Sturmböen",
+        781: "Tornado",
+        800: "klarer Himmel",
+        801: "ein paar Wolken",
+        802: "mäßig bewölkt",
+        803: "überwiegend bewölkt",
+        804: "bedeckt",
+    },
+    "it": {
+        200: "temporale con pioggia leggera",
+        201: "temporale con pioggia",
+        202: "temporale con pioggia forte",
+        210: "temporale leggero",
+        211: "temporale",
+        212: "temporale forte",
+        221: "temporali sparsi",
+        230: "temporale con pioggerella leggera",
+        231: "temporale con pioggerella",
+        232: "temporale con pioggerella forte",
+        300: "pioggerella leggera",
+        301: "pioggerella",
+        302: "pioggerella forte",
+        310: "pioggia e pioggerella leggera",
+        311: "pioggia e pioggerella",
+        312: "pioggia e pioggerella forte",
+        313: "rovesci e pioggerella",
+        314: "forti rovesci e pioggerella",
+        321: "rovesci di pioggerella",
+        500: "pioggia leggera",
+        501: "pioggia moderata",
+        502: "pioggia forte",
+        503: "pioggia molto forte",
+        504: "pioggia estrema",
+        511: "pioggia gelata",
+        520: "rovesci leggeri",
+        521: "rovesci",
+        522: "rovesci forti",
+        531: "rovesci sparsi",
+        600: "neve leggera",
+        601: "neve",
+        602: "neve forte",
+        611: "nevischio",
+        612: "rovesci leggeri di nevischio",
+        613: "rovesci di nevischio",
+        615: "pioggia leggera e neve",
+        616: "pioggia e neve",
+        620: "rovesci leggeri di neve",
+        621: "rovesci di neve",
+        622: "rovesci forti di neve",
+        701: "foschia",
+        711: "fumo",
+        721: "caligine",
+        731: "mulinelli di sabbia o polvere",
+        741: "nebbia",
+        751: "sabbia",
+        761: "polvere",
+        762: "cenere vulcanica",
+        771: "burrasca",
+        781: "tornado",
+        800: "cielo sereno",
+        801: "poco nuvoloso",
+        802: "nubi sparse",
+        803: "nuvoloso",
+        804: "cielo coperto",
+    },
+    "pt": {
+        200: "trovoada com chuva fraca",
+        201: "trovoada com chuva",
+        202: "trovoada com chuva forte",
+        210: "trovoada fraca",
+        211: "trovoada",
+        212: "trovoada forte",
+        221: "trovoadas dispersas",
+        230: "trovoada com chuvisco fraco",
+        231: "trovoada com chuvisco",
+        232: "trovoada com chuvisco forte",
+        300: "chuvisco fraco",
+        301: "chuvisco",
+        302: "chuvisco forte",
+        310: "chuva e chuvisco fracos",
+        311: "chuva e chuvisco",
+        312: "chuva e chuvisco fortes",
+        313: "aguaceiros e chuvisco",
+        314: "aguaceiros fortes e chuvisco",
+        321: "aguaceiros de chuvisco",
+        500: "chuva fraca",
+        501: "chuva moderada",
+        502: "chuva forte",
+        503: "chuva muito forte",
+        504: "chuva extrema",
+        511: "chuva congelante",
+        520: "aguaceiros fracos",
+        521: "aguaceiros",
+        522: "aguaceiros fortes",
+        531: "aguaceiros dispersos",
+        600: "neve fraca",
+        601: "neve",
+        602: "neve forte",
+        611: "granizo",
+        612: "aguaceiros fracos de granizo",
+        613: "aguaceiros de granizo",
+        615: "chuva fraca e neve",
+        616: "chuva e neve",
+        620: "aguaceiros fracos de neve",
+        621: "aguaceiros de neve",
+        622: "aguaceiros fortes de neve",
+        701: "névoa",
+        711: "fumaça",
+        721: "neblina",
+        731: "redemoinhos de areia ou poeira",
+        741: "nevoeiro",
+        751: "areia",
+        761: "poeira",
+        762: "cinza vulcânica",
+        771: "rajadas de vento",
+        781: "tornado",
+        800: "céu limpo",
+        801: "algumas nuvens",
+        802: "nuvens dispersas",
+        803: "nublado",
+        804: "céu encoberto",
+    },
+}
+
+
+def get_condition_descriptions(lang: str) -> dict:
+    """
+    Get the table of condition descriptions for the requested language
+    :param lang: OWM language code, i.e. `es` or `pt_br`
+    :return: dict of condition code to description, empty if unsupported
+    """
+    lang = (lang or "").lower().replace("-", "_")
+    return CONDITION_DESCRIPTIONS.get(lang) or \
+        CONDITION_DESCRIPTIONS.get(lang.split("_")[0]) or dict()
@@ -30,8 +30,8 @@ from neon_api_proxy.cached_api import CachedAPI
 
 
 class TestAPI(CachedAPI):
-    def __init__(self, api_key: str = None, **_):
-        super().__init__("Test")
+    def __init__(self, api_key: str = None, **kwargs):
+        super().__init__("Test", **kwargs)
 
     def handle_query(self, **kwargs) -> dict:
         """
@@ -26,10 +26,14 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import re
+import unicodedata
 import urllib.parse
 from datetime import timedelta
 
 from enum import Enum
+from typing import Optional
+from requests import Response
 from ovos_utils.log import LOG
 from neon_utils.authentication_utils import find_neon_wolfram_key
 from neon_api_proxy.cached_api import CachedAPI
@@ -50,11 +54,14 @@ class WolframAPI(CachedAPI):
     """
     API for querying Wolfram|Alpha.
     """
+    # 501 = Wolfram couldn't understand the query
+    default_negative_cache_seconds = {
+        **CachedAPI.default_negative_cache_seconds, "501": 900}
 
-    def __init__(self, api_key: str = None, cache_seconds: int = 3600, **_):
-        super().__init__("wolfram")
+    def __init__(self, api_key: str = None, cache_seconds: int = 3600,
+                 **kwargs):
+        super().__init__("wolfram", **kwargs)
         self._api_key = api_key or find_neon_wolfram_key()
-        self.session.allowable_codes = (200, 501)
         self.cache_time = timedelta(seconds=cache_seconds)
 
     def _build_query_url(self, query_type: QueryUrl, query_arg: str) -> str:
@@ -76,6 +83,33 @@ class WolframAPI(CachedAPI):
             query_arg = f"{query_arg}&mode=Default"
         return f"{query_type}?appid={self._api_key}&{query_arg}"
 
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """
+        Canonicalize question text so equivalent questions share a cache entry
+        :param query: string query to ask Wolfram|Alpha
+        :return: case-folded query with normalized whitespace and punctuation
+        """
+        query = unicodedata.normalize("NFKC", query).casefold()
+        query = " ".join(query.split())
+        # Remove spacing around math operators, i.e. `2 + 2` -> `2+2`
+        query = re.sub(r"\s*([+*/^=<>])\s*", r"\1", query)
+        query = re.sub(r"(?<=\d)\s*-\s*(?=\d)", "-", query)
+        return query.strip(" ?!.,;:")
+
+    def normalize_cache_url(self, url: str) -> str:
+        """
+        Normalize the question text and parameter order of a request URL
+        :param url: request URL
+        :return: URL to generate a cache key from
+        """
+        parsed = urllib.parse.urlsplit(url)
+        params = urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+        params = sorted((k, self._normalize_query(v) if k in ("i", "input")
+                         else v) for k, v in params)
+        return urllib.parse.urlunsplit(
+            parsed._replace(query=urllib.parse.urlencode(params)))
+
     @staticmethod
     def _build_query_string(**kwargs) -> str:
         """
@@ -106,6 +140,34 @@ class WolframAPI(CachedAPI):
         query_str = urllib.parse.urlencode(query_params)
         return query_str
 
+    @staticmethod
+    def _get_query_type(api: Optional[str]) -> Optional[QueryUrl]:
+        """
+        Get the QueryUrl for a requested api
+        :param api: string api to query (defaults to short)
+        :return: QueryUrl, or None if the api is unknown
+        """
+        if not api:
+            return QueryUrl.SHORT
+        return {"simple": QueryUrl.SIMPLE,
+                "short": QueryUrl.SHORT,
+                "spoken": QueryUrl.SPOKEN,
+                "full": QueryUrl.FULL,
+                "recognize": QueryUrl.RECOGNIZE,
+                "conversation": QueryUrl.CONVERSATION}.get(api)
+
+    def get_affinity_key(self, **kwargs) -> Optional[str]:
+        """
+        Get the cache key of the request a query resolves to
+        :param kwargs: query parameters as passed to `handle_query`
+        :return: cache key, or None for an invalid query
+        """
+        query_type = self._get_query_type(kwargs.get("api"))
+        if not query_type or not kwargs.get("query"):
+            return None
+        return self.get_cache_key(self._build_query_url(
+            query_type, self._build_query_string(**kwargs)))
+
     def handle_query(self, **kwargs) -> dict:
         """
         Handles an incoming query and provides a response
@@ -117,51 +179,87 @@ class WolframAPI(CachedAPI):
           'latlong' - optional string lat/lng
           'lat'+'lng' - optional float or string lat/lng (separate keys)
           'ip' - optional string origin IP Address for geolocation
+          'accept_encoding' - optional list of compression algorithms the
+                requester can decompress
         :return: dict containing `status_code`, `content`, `encoding`
-            from URL response
+            from URL response, and `content_encoding` if content is compressed
         """
         api = kwargs.get("api")
-        if not api:
-            query_type = QueryUrl.SHORT
-        elif api == "simple":
-            query_type = QueryUrl.SIMPLE
-        elif api == "short":
-            query_type = QueryUrl.SHORT
-        elif api == "spoken":
-            query_type = QueryUrl.SPOKEN
-        elif api == "full":
-            query_type = QueryUrl.FULL
-        elif api == "recognize":
-            query_type = QueryUrl.RECOGNIZE
-        elif api == "conversation":
-            query_type = QueryUrl.CONVERSATION
-        else:
+        query_type = self._get_query_type(api)
+        if not query_type:
             return {"status_code": -1,
                     "content": f"Unknown api requested: {api}",
                     "encoding": None}
 
         try:
             query_str = self._build_query_string(**kwargs)
-            return self._query_api(self._build_query_url(query_type, query_str))
+            return self._query_api(self._build_query_url(query_type, query_str),
+                                   kwargs.get("accept_encoding"))
+        except Exception as e:
+            return {"status_code": -1,
+                    "content": repr(e),
+                    "encoding": None}
+
+    async def handle_query_async(self, **kwargs) -> dict:
+        """
+        Handles an incoming query without blocking the event loop
+        :param kwargs: query parameters as passed to `handle_query`
+        :return: dict containing `status_code`, `content`, `encoding`
+            from URL response, and `content_encoding` if content is compressed
+        """
+        api = kwargs.get("api")
+        query_type = self._get_query_type(api)
+        if not query_type:
+            return {"status_code": -1,
+                    "content": f"Unknown api requested: {api}",
+                    "encoding": None}
+
+        try:
+            query = self._build_query_url(
+                query_type, self._build_query_string(**kwargs))
+            LOG.debug(f"query={query}")
+            result = await self.get_with_cache_timeout_async(
+                query, timeout=self.cache_time)
+            return self._format_result(query, result,
+                                       kwargs.get("accept_encoding"))
         except Exception as e:
             return {"status_code": -1,
                     "content": repr(e),
                     "encoding": None}
 
-    def _query_api(self, query: str) -> dict:
+    def _query_api(self, query: str,
+                   accept_encoding: Optional[list] = None) -> dict:
         """
         Queries the Wolfram|Alpha API and returns a dict with:
             status, content, and encoding
         :param query: URL to query
+        :param accept_encoding: compression algorithms the requester accepts
         :return: dict response containing:
             `status_code`, `content`, and `encoding`
         """
         LOG.debug(f"query={query}")
         result = self.get_with_cache_timeout(query, timeout=self.cache_time)
+        return self._format_result(query, result, accept_encoding)
+
+    def _format_result(self, query: str, result: Response,
+                       accept_encoding: Optional[list] = None) -> dict:
+        """
+        Builds the response to a query from the Wolfram|Alpha API response
+        :param query: URL that was queried
+        :param result: Response or CachedResponse from the API
+        :param accept_encoding: compression algorithms the requester accepts
+        :return: dict response containing:
+            `status_code`, `content`, and `encoding`
+        """
         if not result.ok:
             # 501 = Wolfram couldn't understand
             # 403 = Invalid API Key Provided
             LOG.warning(f"API Query error ({result.status_code}): {query}")
-        return {"status_code": result.status_code,
-                "content": result.content,
-                "encoding": result.encoding}
+        content, content_encoding = \
+            self.get_response_content(result, accept_encoding)
+        response = {"status_code": result.status_code,
+                    "content": content,
+                    "encoding": result.encoding}
+        if content_encoding:
+            response["content_encoding"] = content_encoding
+        return response
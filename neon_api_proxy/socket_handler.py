@@ -29,19 +29,25 @@
 import socketserver
 
 from ovos_utils.log import LOG
-from neon_mq_connector.utils.network_utils import b64_to_dict, dict_to_b64
 from neon_utils.socket_utils import get_packet_data
 
+from neon_api_proxy.wire_format import MSGPACK_CONTENT_TYPE, is_msgpack, \
+    decode_message, encode_message
+
 
 class NeonAPITCPHandler(socketserver.BaseRequestHandler):
     def handle(self):
         received_message = get_packet_data(self.request)
-        received_message_decoded = b64_to_dict(received_message)
+        # Respond in the format of the request
+        content_type = MSGPACK_CONTENT_TYPE if is_msgpack(received_message) \
+            else None
+        received_message_decoded = decode_message(received_message,
+                                                  content_type)
         LOG.debug(f"Received request from '{self.client_address[0]}' : "
                   f"{received_message_decoded}")
         response = \
             self.server.controller.resolve_query(received_message_decoded)
         LOG.debug(f'Received response from controller: {response}')
-        encoded_response = dict_to_b64(response)
+        encoded_response = encode_message(response, content_type)
         LOG.debug(f'Encoded response from controller: {encoded_response}')
         self.request.sendall(encoded_response)
@@ -0,0 +1,88 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from typing import Optional
+from neon_mq_connector.utils.network_utils import b64_to_dict, dict_to_b64
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Content type of messages using the binary wire format
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+def binary_format_available() -> bool:
+    """
+    Check if the binary wire format may be used
+    @return: True if msgpack is installed
+    """
+    return msgpack is not None
+
+
+def is_msgpack(body: bytes) -> bool:
+    """
+    Check if a payload without a declared content type is a msgpack map.
+    Base64 payloads are ASCII, while msgpack maps start with a byte >= 0x80.
+    @param body: received payload
+    @return: True if the payload should be decoded as msgpack
+    """
+    return bool(body) and (0x80 <= body[0] <= 0x8f or body[0] in (0xde, 0xdf))
+
+
+def encode_message(data: dict, content_type: Optional[str] = None) -> bytes:
+    """
+    Serialize a message for MQ or TCP
+    @param data: message to serialize
+    @param content_type: `MSGPACK_CONTENT_TYPE` for the binary format,
+        else the default base64-encoded JSON format is used
+    @return: serialized message
+    """
+    if content_type == MSGPACK_CONTENT_TYPE:
+        if msgpack is None:
+            raise ImportError("msgpack is required for the binary wire "
+                              "format; install `neon-api-proxy[binary]`")
+        return msgpack.packb(data, use_bin_type=True, default=str)
+    return dict_to_b64(data)
+
+
+def decode_message(body: bytes, content_type: Optional[str] = None) -> dict:
+    """
+    Deserialize a message received over MQ or TCP
+    @param body: serialized message
+    @param content_type: `MSGPACK_CONTENT_TYPE` for the binary format,
+        else the default base64-encoded JSON format is used
+    @return: deserialized message
+    """
+    if content_type == MSGPACK_CONTENT_TYPE:
+        if msgpack is None:
+            raise ImportError("msgpack is required for the binary wire "
+                              "format; install `neon-api-proxy[binary]`")
+        return msgpack.unpackb(body, raw=False)
+    return b64_to_dict(body)
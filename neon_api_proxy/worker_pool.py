@@ -0,0 +1,95 @@
+# NEON AI (TM) SOFTWARE, Software Development Kit & Application Framework
+# All trademark and other rights reserved by their respective owners
+# Copyright 2008-2022 Neongecko.com Inc.
+# Contributors: Daniel McKnight, Guy Daniels, Elon Gasper, Richard Leeds,
+# Regina Bloomstine, Casimiro Ferreira, Andrii Pernatii, Kirill Hrymailo
+# BSD-3 License
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from this
+#    software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO,
+# THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS  BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS;  OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from itertools import count
+from queue import PriorityQueue
+from threading import Lock, Semaphore, Thread
+from typing import Callable
+from ovos_utils.log import LOG
+
+
+class PriorityWorkerPool:
+    """
+    Bounded pool of worker threads that runs queued tasks with the lowest
+    priority value first, and in submission order within a priority
+    """
+    def __init__(self, max_workers: int, thread_name_prefix: str = "worker"):
+        """
+        @param max_workers: max number of worker threads
+        @param thread_name_prefix: prefix of worker thread names
+        """
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._queue = PriorityQueue()
+        self._sequence = count()
+        self._threads = list()
+        self._threads_lock = Lock()
+        self._idle = Semaphore(0)
+
+    def submit(self, fn: Callable, *args, priority: int = 0):
+        """
+        Queue a task to be run by a worker
+        @param fn: method to call
+        @param args: positional arguments to pass to `fn`
+        @param priority: tasks with lower values are run first
+        """
+        self._queue.put((priority, next(self._sequence), fn, args))
+        self._add_worker()
+
+    def _add_worker(self):
+        if self._idle.acquire(blocking=False):
+            # An idle worker will handle the task
+            return
+        with self._threads_lock:
+            if len(self._threads) >= self.max_workers:
+                return
+            thread = Thread(target=self._run, daemon=True,
+                            name=f"{self.thread_name_prefix}_"
+                                 f"{len(self._threads)}")
+            self._threads.append(thread)
+        thread.start()
+
+    def _run(self):
+        while True:
+            _, _, fn, args = self._queue.get()
+            if fn is None:
+                return
+            try:
+                fn(*args)
+            except Exception as e:
+                LOG.exception(e)
+            self._idle.release()
+
+    def shutdown(self):
+        """
+        Stop workers after all queued tasks are run
+        """
+        with self._threads_lock:
+            for _ in self._threads:
+                self._queue.put((float('inf'), next(self._sequence), None,
+                                 ()))
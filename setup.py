@@ -72,6 +72,8 @@ setup(
     license='NeonAI License v1.0',
     packages=find_packages(),
     install_requires=get_requirements("requirements.txt"),
+    extras_require={"binary": get_requirements("binary.txt"),
+                    "async": get_requirements("async.txt")},
     zip_safe=True,
     classifiers=[
         'Intended Audience :: Developers',
@@ -80,6 +82,13 @@ setup(
     entry_points={
         'console_scripts': [
             'neon_api_proxy=neon_api_proxy.__main__:main'
+        ],
+        'neon_api_proxy.services': [
+            'wolfram_alpha=neon_api_proxy.services.wolfram_api:WolframAPI',
+            'alpha_vantage='
+            'neon_api_proxy.services.alpha_vantage_api:AlphaVantageAPI',
+            'open_weather_map=neon_api_proxy.services.owm_api:OpenWeatherAPI',
+            'map_maker=neon_api_proxy.services.map_maker_api:MapMakerAPI'
         ]
     }
 )
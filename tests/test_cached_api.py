@@ -26,13 +26,59 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import asyncio
+import gzip
 import os
 import sys
 import unittest
-from time import sleep
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import mkdtemp
+from shutil import rmtree
+from threading import Thread, get_ident
+from time import sleep, time
+from unittest.mock import patch
+
+import requests
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
-from neon_api_proxy.cached_api import CachedAPI
+from neon_api_proxy.cached_api import CachedAPI, set_request_deadline
+from neon_api_proxy.cache_backends import CompressedCachedResponse, \
+    ExpiringSQLiteDict
+from neon_api_proxy.metrics import render_prometheus, start_metrics_server, \
+    start_request_info
+
+
+class MockUpstreamHandler(BaseHTTPRequestHandler):
+    """
+    Local HTTP endpoint that counts requests so caching can be tested offline
+    """
+    request_count = 0
+    status_code = 200
+
+    def do_GET(self):
+        if "slow" in self.path:
+            sleep(0.5)
+        MockUpstreamHandler.request_count += 1
+        body = f"{self.path}:{MockUpstreamHandler.request_count}".encode()
+        if "large" in self.path:
+            body *= 1000
+        status_code = MockUpstreamHandler.status_code
+        if "/status_" in self.path:
+            status_code = int(self.path.split("/status_")[1][:3])
+        self.send_response(status_code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_mock_upstream() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockUpstreamHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
 
 
 class TestCachedAPI(unittest.TestCase):
@@ -76,5 +122,601 @@ class TestCachedAPI(unittest.TestCase):
         self.assertFalse(no_cache.from_cache)
 
 
+class TestPersistentCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_mock_upstream()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.cache_path = mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        rmtree(cls.cache_path)
+
+    def test_sqlite_cache_survives_restart(self):
+        url = f"{self.base_url}/sqlite"
+        api = CachedAPI("persistent", cache_backend="sqlite",
+                        cache_path=self.cache_path)
+        res = api.get_with_cache_timeout(url, 60)
+        self.assertFalse(res.from_cache)
+
+        restarted = CachedAPI("persistent", cache_backend="sqlite",
+                              cache_path=self.cache_path)
+        cached = restarted.get_with_cache_timeout(url, 60)
+        self.assertTrue(cached.from_cache)
+        self.assertEqual(res.content, cached.content)
+
+    def test_sqlite_cache_expires_after_restart(self):
+        url = f"{self.base_url}/sqlite_expired"
+        api = CachedAPI("persistent", cache_backend="sqlite",
+                        cache_path=self.cache_path)
+        res = api.get_with_cache_timeout(url, 1)
+        self.assertFalse(res.from_cache)
+        sleep(1)
+        restarted = CachedAPI("persistent", cache_backend="sqlite",
+                              cache_path=self.cache_path)
+        expired = restarted.get_with_cache_timeout(url, 1)
+        self.assertFalse(expired.from_cache)
+        self.assertNotEqual(res.content, expired.content)
+
+    def test_sqlite_purge_expired_responses(self):
+        api = CachedAPI("sqlite_purge", cache_backend="sqlite",
+                        cache_path=self.cache_path, cache_purge_seconds=0)
+        api.get_with_cache_timeout(f"{self.base_url}/sqlite_expires", 1)
+        api.get_with_cache_timeout(f"{self.base_url}/sqlite_persists", 60)
+        api.get_with_cache_timeout(f"{self.base_url}/sqlite_forever")
+        sleep(1)
+        # Expired responses are removed without reading stored responses
+        with patch.object(ExpiringSQLiteDict, "__getitem__",
+                          side_effect=AssertionError):
+            api.purge_expired_responses()
+        self.assertEqual(len(api.session.cache.responses), 2)
+
+    def test_filesystem_cache_survives_restart(self):
+        url = f"{self.base_url}/filesystem"
+        api = CachedAPI("files", cache_backend="filesystem",
+                        cache_path=self.cache_path)
+        res = api.get_with_cache_timeout(url, 60)
+        self.assertFalse(res.from_cache)
+        restarted = CachedAPI("files", cache_backend="filesystem",
+                              cache_path=self.cache_path)
+        self.assertTrue(restarted.get_with_cache_timeout(url, 60).from_cache)
+
+    def test_invalid_backend(self):
+        with self.assertRaises(ValueError):
+            CachedAPI("invalid", cache_backend="invalid")
+
+
+class TestBoundedMemoryCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_mock_upstream()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+
+    def test_max_entries_evicts_lru(self):
+        api = CachedAPI("bounded", cache_max_entries=2)
+        first = f"{self.base_url}/first"
+        second = f"{self.base_url}/second"
+        api.get_with_cache_timeout(first, 60)
+        api.get_with_cache_timeout(second, 60)
+        # Use `first` so `second` is the least recently used
+        self.assertTrue(api.get_with_cache_timeout(first, 60).from_cache)
+        api.get_with_cache_timeout(f"{self.base_url}/third", 60)
+        self.assertEqual(len(api.session.cache.responses), 2)
+        self.assertTrue(api.get_with_cache_timeout(first, 60).from_cache)
+        self.assertFalse(api.get_with_cache_timeout(second, 60).from_cache)
+
+    def test_max_bytes_evicts(self):
+        api = CachedAPI("bounded_bytes", cache_max_entries=None,
+                        cache_max_bytes=1)
+        api.get_with_cache_timeout(f"{self.base_url}/large", 60)
+        self.assertEqual(len(api.session.cache.responses), 0)
+        self.assertEqual(api.session.cache.responses.size_bytes, 0)
+
+    def test_purge_expired_responses(self):
+        api = CachedAPI("purge", cache_purge_seconds=0)
+        api.get_with_cache_timeout(f"{self.base_url}/expires", 1)
+        api.get_with_cache_timeout(f"{self.base_url}/persists", 60)
+        sleep(1)
+        api.purge_expired_responses()
+        self.assertEqual(len(api.session.cache.responses), 1)
+
+
+class TestStaleResponses(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_mock_upstream()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+
+    def tearDown(self) -> None:
+        MockUpstreamHandler.status_code = 200
+
+    def test_stale_while_revalidate(self):
+        api = CachedAPI("swr", stale_while_revalidate=30)
+        url = f"{self.base_url}/swr"
+        res = api.get_with_cache_timeout(url, 1)
+        sleep(1)
+        stale = api.get_with_cache_timeout(url, 1)
+        self.assertTrue(stale.from_cache)
+        self.assertTrue(stale.is_expired)
+        self.assertEqual(res.content, stale.content)
+        sleep(0.5)
+        refreshed = api.get_with_cache_timeout(url, 1)
+        self.assertTrue(refreshed.from_cache)
+        self.assertFalse(refreshed.is_expired)
+        self.assertNotEqual(res.content, refreshed.content)
+
+    def test_stale_if_error(self):
+        api = CachedAPI("sie", stale_if_error=30)
+        url = f"{self.base_url}/sie"
+        res = api.get_with_cache_timeout(url, 1)
+        sleep(1)
+        MockUpstreamHandler.status_code = 503
+        stale = api.get_with_cache_timeout(url, 1)
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(res.content, stale.content)
+
+    def test_stale_if_error_connection_failure(self):
+        api = CachedAPI("sie_connection", stale_if_error=30)
+        server = start_mock_upstream()
+        url = f"http://127.0.0.1:{server.server_port}/down"
+        res = api.get_with_cache_timeout(url, 1)
+        server.shutdown()
+        server.server_close()
+        sleep(1)
+        stale = api.get_with_cache_timeout(url, 1)
+        self.assertEqual(res.content, stale.content)
+        # Stale response is kept for subsequent requests
+        self.assertEqual(api.get_with_cache_timeout(url, 1).content,
+                         res.content)
+
+    def test_no_stale_outside_grace(self):
+        api = CachedAPI("no_stale", stale_if_error=1)
+        url = f"{self.base_url}/no_stale"
+        api.get_with_cache_timeout(url, 1)
+        sleep(2)
+        MockUpstreamHandler.status_code = 503
+        self.assertEqual(api.get_with_cache_timeout(url, 1).status_code, 503)
+
+
+class TestRequestCoalescing(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_mock_upstream()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+
+    def test_concurrent_requests_coalesced(self):
+        api = CachedAPI("coalesce")
+        url = f"{self.base_url}/slow_coalesced"
+        start_count = MockUpstreamHandler.request_count
+        responses = list()
+        threads = [Thread(target=lambda: responses.append(
+            api.get_with_cache_timeout(url, 60))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(MockUpstreamHandler.request_count, start_count + 1)
+        self.assertEqual(len(responses), 10)
+        self.assertEqual(len(set(r.content for r in responses)), 1)
+        self.assertEqual(api._in_flight, dict())
+        # Requests that waited on the in-flight request aren't misses
+        self.assertEqual((api.cache_hits, api.cache_misses), (9, 1))
+        self.assertGreater(api.metrics.cache_results["coalesced"], 0)
+
+    def test_different_requests_not_coalesced(self):
+        api = CachedAPI("no_coalesce")
+        start_count = MockUpstreamHandler.request_count
+        threads = [Thread(target=api.get_with_cache_timeout,
+                          args=(f"{self.base_url}/slow_{i}", 60))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(MockUpstreamHandler.request_count, start_count + 3)
+
+
+class TestCacheStats(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_mock_upstream()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+
+    def test_cache_hit_rate(self):
+        api = CachedAPI("stats")
+        self.assertEqual(api.cache_hit_rate, 0.0)
+        url = f"{self.base_url}/stats"
+        api.get_with_cache_timeout(url, 60)
+        self.assertEqual((api.cache_hits, api.cache_misses), (0, 1))
+        for _ in range(3):
+            api.get_with_cache_timeout(url, 60)
+        self.assertEqual((api.cache_hits, api.cache_misses), (3, 1))
+        self.assertEqual(api.cache_hit_rate, 0.75)
+
+
+class TestCompressedCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_mock_upstream()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+
+    def test_compressed_bodies(self):
+        api = CachedAPI("compressed", cache_compression="zlib")
+        url = f"{self.base_url}/large"
+        res = api.get_with_cache_timeout(url, 60)
+        key = api.get_cache_key(url)
+        stored = api.session.cache.responses[key]
+        self.assertIsInstance(stored, CompressedCachedResponse)
+        self.assertLess(len(stored.compressed_content), len(res.content))
+        self.assertLess(api.session.cache.responses.size_bytes,
+                        len(res.content))
+
+        cached = api.get_with_cache_timeout(url, 60)
+        self.assertTrue(cached.from_cache)
+        self.assertEqual(cached.content, res.content)
+        self.assertEqual(cached.text, res.text)
+        # Reading a hit does not decompress the stored entry
+        self.assertIsNone(stored._content)
+
+    def test_small_bodies_not_compressed(self):
+        api = CachedAPI("compressed_small", cache_compression="gzip")
+        url = f"{self.base_url}/small"
+        api.get_with_cache_timeout(url, 60)
+        stored = api.session.cache.responses[api.get_cache_key(url)]
+        self.assertNotIsInstance(stored, CompressedCachedResponse)
+
+    def test_unsupported_compression(self):
+        with self.assertRaises(ValueError):
+            CachedAPI("compressed_invalid", cache_compression="invalid")
+
+    def test_compressed_pass_through(self):
+        api = CachedAPI("compressed_pass_through", cache_compression="gzip")
+        url = f"{self.base_url}/large_pass_through"
+        res = api.get_with_cache_timeout(url, 60)
+        self.assertEqual(api.get_response_content(res, ["gzip"]),
+                         (res.content, None))
+        cached = api.get_with_cache_timeout(url, 60)
+        content, encoding = api.get_response_content(cached, "deflate, gzip")
+        self.assertEqual(encoding, "gzip")
+        self.assertEqual(gzip.decompress(content), res.content)
+        self.assertEqual(api.get_response_content(cached),
+                         (res.content, None))
+
+
+class TestCacheMetrics(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_mock_upstream()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+
+    def test_cache_and_upstream_metrics(self):
+        api = CachedAPI("metrics")
+        api.get_with_cache_timeout(f"{self.base_url}/metrics", 60)
+        api.get_with_cache_timeout(f"{self.base_url}/metrics", 60)
+        api.get_with_cache_timeout(f"{self.base_url}/status_404", 60)
+        self.assertEqual(dict(api.metrics.cache_results),
+                         {"hit": 1, "miss": 2, "stale": 0, "coalesced": 0})
+        self.assertEqual(dict(api.metrics.upstream_responses),
+                         {"200": 1, "404": 1})
+        self.assertEqual(api.metrics.upstream_latency.count, 2)
+
+        text = render_prometheus({"test": api.metrics})
+        self.assertIn('neon_api_proxy_cache_requests_total'
+                      '{service="test",result="hit"} 1', text)
+        self.assertIn('neon_api_proxy_upstream_responses_total'
+                      '{service="test",status="404"} 1', text)
+        self.assertIn('neon_api_proxy_upstream_latency_seconds_count'
+                      '{service="test"} 2', text)
+
+    def test_stale_and_error_metrics(self):
+        api = CachedAPI("metrics_stale", stale_if_error=60)
+        url = f"{self.base_url}/metrics_stale"
+        api.get_with_cache_timeout(url, 1)
+        sleep(1)
+        MockUpstreamHandler.status_code = 503
+        info = start_request_info()
+        try:
+            self.assertTrue(api.get_with_cache_timeout(url, 1).from_cache)
+        finally:
+            MockUpstreamHandler.status_code = 200
+        self.assertEqual(api.metrics.cache_results["stale"], 1)
+        # Stale responses have no time to live
+        self.assertEqual(info["cache"], "stale")
+        self.assertNotIn("cache_ttl", info)
+        self.assertEqual(api.metrics.upstream_responses["503"], 1)
+
+        with self.assertRaises(Exception):
+            api.get_with_cache_timeout("http://127.0.0.1:1/unreachable", 60)
+        self.assertEqual(api.metrics.upstream_responses["error"], 1)
+
+    def test_request_info(self):
+        api = CachedAPI("metrics_info")
+        url = f"{self.base_url}/metrics_info"
+        info = start_request_info()
+        api.get_with_cache_timeout(url, 60)
+        self.assertEqual(info["cache"], "miss")
+        self.assertEqual(info["upstream_status"], 200)
+        self.assertIsInstance(info["upstream_latency"], float)
+        self.assertTrue(59 < info["cache_ttl"] <= 60)
+        info = start_request_info()
+        api.get_with_cache_timeout(url, 60)
+        self.assertEqual(set(info), {"cache", "cache_ttl"})
+        self.assertEqual(info["cache"], "hit")
+        self.assertTrue(0 < info["cache_ttl"] <= 60)
+
+        # Error responses advertise their negative cache time
+        info = start_request_info()
+        api.get_with_cache_timeout(f"{self.base_url}/status_404", 3600)
+        self.assertTrue(59 < info["cache_ttl"] <= 60)
+
+    def test_metrics_server(self):
+        server = start_metrics_server(lambda: "metric 1\n", 0, "127.0.0.1")
+        try:
+            url = f"http://127.0.0.1:{server.server_port}"
+            resp = requests.get(f"{url}/metrics", timeout=5)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.text, "metric 1\n")
+            self.assertEqual(requests.get(url, timeout=5).status_code, 404)
+        finally:
+            server.shutdown()
+
+
+class TestRequestDeadlines(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_mock_upstream()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+
+    def tearDown(self) -> None:
+        set_request_deadline(None)
+
+    def test_expired_deadline_skips_request(self):
+        api = CachedAPI("deadline_expired")
+        start_count = MockUpstreamHandler.request_count
+        set_request_deadline(time() - 1)
+        with self.assertRaises(requests.exceptions.Timeout):
+            api.get_with_cache_timeout(f"{self.base_url}/deadline", 60)
+        self.assertEqual(MockUpstreamHandler.request_count, start_count)
+
+    def test_deadline_limits_upstream_timeout(self):
+        api = CachedAPI("deadline_timeout")
+        set_request_deadline(time() + 0.2)
+        start = time()
+        with self.assertRaises(requests.exceptions.Timeout):
+            api.get_with_cache_timeout(f"{self.base_url}/slow_deadline", 60)
+        self.assertLess(time() - start, 0.45)
+
+        set_request_deadline(None)
+        self.assertEqual(api.get_with_cache_timeout(
+            f"{self.base_url}/slow_deadline", 60).status_code, 200)
+
+    def test_expired_deadline_returns_stale(self):
+        api = CachedAPI("deadline_stale", stale_if_error=60)
+        url = f"{self.base_url}/deadline_stale"
+        api.get_with_cache_timeout(url, 1)
+        sleep(1)
+        set_request_deadline(time() - 1)
+        self.assertTrue(api.get_with_cache_timeout(url, 1).from_cache)
+
+
+class TestAsyncCachedAPI(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_mock_upstream()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+
+    @staticmethod
+    def _run(api: CachedAPI, coroutine):
+        async def _run():
+            try:
+                return await coroutine
+            finally:
+                await api.close_async()
+        return asyncio.run(_run())
+
+    def test_shared_cache(self):
+        api = CachedAPI("async_shared")
+        url = f"{self.base_url}/async_shared"
+        res = self._run(api, api.get_with_cache_timeout_async(url, 60))
+        self.assertFalse(res.from_cache)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.encoding, "utf-8")
+        cached = self._run(api, api.get_with_cache_timeout_async(url, 60))
+        self.assertTrue(cached.from_cache)
+        self.assertEqual(cached.content, res.content)
+        # Synchronous requests share the cache
+        self.assertEqual(api.get_with_cache_timeout(url, 60).content,
+                         res.content)
+        self.assertEqual(api.cache_misses, 1)
+        self.assertEqual(api.cache_hits, 2)
+
+        no_cache = self._run(api, api.get_with_cache_timeout_async(url, 0))
+        self.assertFalse(no_cache.from_cache)
+        self.assertNotEqual(no_cache.content, res.content)
+
+    def test_concurrent_requests_coalesced(self):
+        api = CachedAPI("async_coalesced")
+        url = f"{self.base_url}/slow_async"
+        start_count = MockUpstreamHandler.request_count
+
+        async def _request_all():
+            return await asyncio.gather(
+                *[api.get_with_cache_timeout_async(url, 60)
+                  for _ in range(5)])
+        responses = self._run(api, _request_all())
+        self.assertEqual(MockUpstreamHandler.request_count, start_count + 1)
+        self.assertEqual(len({r.content for r in responses}), 1)
+        self.assertEqual(api.metrics.coalesced_requests, 4)
+        self.assertEqual(api.metrics.cache_results["coalesced"], 4)
+        self.assertEqual(api.cache_misses, 1)
+
+    def test_cancelled_request_fails_waiters(self):
+        api = CachedAPI("async_cancelled")
+        url = f"{self.base_url}/slow_async_cancelled"
+
+        async def _cancel_leader():
+            leader = asyncio.ensure_future(
+                api.get_with_cache_timeout_async(url, 60))
+            await asyncio.sleep(0.1)
+            waiter = asyncio.ensure_future(
+                api.get_with_cache_timeout_async(url, 60))
+            await asyncio.sleep(0.1)
+            leader.cancel()
+            return await asyncio.gather(leader, waiter,
+                                        return_exceptions=True)
+        leader_result, waiter_result = self._run(api, _cancel_leader())
+        self.assertIsInstance(leader_result, asyncio.CancelledError)
+        self.assertIsInstance(waiter_result,
+                              requests.exceptions.RequestException)
+        self.assertEqual(api._async_in_flight, dict())
+        # Let the abandoned upstream request finish before other tests count
+        sleep(0.5)
+
+    def test_negative_cache(self):
+        api = CachedAPI("async_negative", negative_cache_seconds={"404": 1})
+        url = f"{self.base_url}/status_404_async"
+        res = self._run(api, api.get_with_cache_timeout_async(url, 60))
+        self.assertEqual(res.status_code, 404)
+        cached = self._run(api, api.get_with_cache_timeout_async(url, 60))
+        self.assertTrue(cached.from_cache)
+        sleep(1)
+        self.assertFalse(self._run(api, api.get_with_cache_timeout_async(
+            url, 60)).from_cache)
+
+    def test_deadline(self):
+        api = CachedAPI("async_deadline")
+
+        async def _request():
+            set_request_deadline(time() + 0.2)
+            return await api.get_with_cache_timeout_async(
+                f"{self.base_url}/slow_async_deadline", 60)
+        start = time()
+        with self.assertRaises(requests.exceptions.Timeout):
+            self._run(api, _request())
+        self.assertLess(time() - start, 0.45)
+        self.assertEqual(api.metrics.upstream_responses["error"], 1)
+
+    def test_persistent_cache_io_off_event_loop(self):
+        cache_path = mkdtemp()
+        api = CachedAPI("async_sqlite", cache_backend="sqlite",
+                        cache_path=cache_path)
+        cache = api.session.cache
+        io_threads = list()
+
+        def _record_thread(func):
+            def _wrapped(*args, **kwargs):
+                io_threads.append(get_ident())
+                return func(*args, **kwargs)
+            return _wrapped
+        cache.get_response = _record_thread(cache.get_response)
+        cache.save_response = _record_thread(cache.save_response)
+
+        async def _request():
+            loop_thread = get_ident()
+            res = await api.get_with_cache_timeout_async(
+                f"{self.base_url}/async_sqlite", 60)
+            return loop_thread, res
+        try:
+            loop_thread, res = self._run(api, _request())
+        finally:
+            rmtree(cache_path)
+        self.assertEqual(res.status_code, 200)
+        # One read to check the cache and one write to save the response
+        self.assertEqual(len(io_threads), 2)
+        self.assertNotIn(loop_thread, io_threads)
+
+    def test_handle_query_async(self):
+        class _TestAPI(CachedAPI):
+            def handle_query(self, **kwargs) -> dict:
+                return {"status_code": 200, "content": kwargs,
+                        "encoding": None}
+        api = _TestAPI("async_handle_query")
+        self.assertEqual(self._run(api, api.handle_query_async(key="value")),
+                         {"status_code": 200, "content": {"key": "value"},
+                          "encoding": None})
+
+
+class TestNegativeCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = start_mock_upstream()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+
+    def test_negative_cache_policy(self):
+        api = CachedAPI("negative_policy",
+                        negative_cache_seconds={429: 10, "5xx": 0})
+        self.assertEqual(api.get_negative_cache_seconds(200), 0)
+        self.assertEqual(api.get_negative_cache_seconds(429), 10)
+        self.assertEqual(api.get_negative_cache_seconds(404),
+                         CachedAPI.default_negative_cache_seconds["4xx"])
+        self.assertEqual(api.get_negative_cache_seconds(503), 0)
+        self.assertIn(404, api.session.allowable_codes)
+        self.assertNotIn(503, api.session.allowable_codes)
+
+    def test_negative_response_cached_with_short_ttl(self):
+        api = CachedAPI("negative", negative_cache_seconds={"429": 1})
+        url = f"{self.base_url}/status_429"
+        res = api.get_with_cache_timeout(url, 3600)
+        self.assertEqual(res.status_code, 429)
+        self.assertFalse(res.from_cache)
+        cached = api.get_with_cache_timeout(url, 3600)
+        self.assertTrue(cached.from_cache)
+        self.assertEqual(cached.status_code, 429)
+        sleep(1)
+        self.assertFalse(api.get_with_cache_timeout(url, 3600).from_cache)
+
+    def test_negative_cache_disabled(self):
+        api = CachedAPI("negative_disabled", negative_cache_seconds={"5xx": 0})
+        url = f"{self.base_url}/status_500"
+        api.get_with_cache_timeout(url, 3600)
+        self.assertFalse(api.get_with_cache_timeout(url, 3600).from_cache)
+
+    def test_negative_ttl_not_longer_than_request(self):
+        api = CachedAPI("negative_request_ttl",
+                        negative_cache_seconds={"404": 3600})
+        url = f"{self.base_url}/status_404"
+        api.get_with_cache_timeout(url, 1)
+        sleep(1)
+        self.assertFalse(api.get_with_cache_timeout(url, 1).from_cache)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -26,12 +26,18 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import asyncio
+import json
 import os
 import sys
 import unittest
 import pytest
 
-from mock.mock import Mock
+from queue import Queue
+from threading import Thread
+from time import sleep, time
+
+from mock.mock import AsyncMock, Mock, patch
 from ovos_utils.log import LOG
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -44,6 +50,12 @@ VALID_LNG = "-122.2079"
 # TODO: Update to test local vs remote calls
 
 
+def setUpModule():
+    # Requests are resolved in this process unless a test specifies otherwise
+    from neon_api_proxy.client import init_client
+    init_client(local=True)
+
+
 class RequestAPITests(unittest.TestCase):
     def test_request_neon_api_valid(self):
         from neon_api_proxy.client import request_api, NeonAPI
@@ -98,15 +110,44 @@ class NeonAPIClientTests(unittest.TestCase):
                          {"api_test_endpoint"})
 
     def test_client_lazy_load(self):
-        from neon_api_proxy.client import NeonAPI, request_api
+        from neon_api_proxy.client import NeonAPI, request_api, init_client
+        init_client(local=True)
         resp = request_api(NeonAPI.TEST_API, {"test": "test"})
         self.assertIsInstance(resp, dict)
         from neon_api_proxy.client import _CLIENT, NeonAPIProxyClient
         self.assertIsInstance(_CLIENT, NeonAPIProxyClient)
 
+    def test_remote_client(self):
+        import neon_api_proxy.client
+        from neon_api_proxy.client import NeonAPI, request_api, \
+            init_client, NeonAPIRemoteClient
+        from neon_api_proxy.config import has_local_api_keys
+        self.assertFalse(has_local_api_keys({"test_service": {}}))
+        self.assertTrue(has_local_api_keys({"test_service": {"api_key": "k"}}))
+
+        neon_api_proxy.client._CLIENT = None
+        with patch("neon_api_proxy.config.has_local_api_keys",
+                   return_value=False):
+            init_client()
+        client = neon_api_proxy.client._CLIENT
+        self.assertIs(type(client), NeonAPIRemoteClient)
+        self.assertFalse(hasattr(client, "service_instance_mapping"))
+        with patch.object(NeonAPIRemoteClient, "_request_mq_api",
+                          return_value={"status_code": 200}) as request:
+            resp = request_api(NeonAPI.TEST_API, {"test": "test"}, 5)
+        self.assertEqual(resp, {"status_code": 200})
+        request.assert_called_once_with(
+            {"test": "test", "service": "api_test_endpoint"}, 5)
+
+        # Local resolution is an explicit opt-in
+        init_client(local=True)
+        self.assertTrue(neon_api_proxy.client._CLIENT.local)
+        init_client()
+        self.assertTrue(neon_api_proxy.client._CLIENT.local)
+
     def test_call_local_api(self):
         from neon_api_proxy.client import NeonAPI, request_api, init_client
-        init_client()
+        init_client(local=True)
         from neon_api_proxy.client import _CLIENT
         mock = Mock(wraps=_CLIENT.service_instance_mapping["api_test_endpoint"].handle_query)
         _CLIENT.service_instance_mapping["api_test_endpoint"].handle_query = mock
@@ -117,6 +158,298 @@ class NeonAPIClientTests(unittest.TestCase):
         mock.assert_called_with(test="test", service=str(NeonAPI.TEST_API))
 
 
+class _FakeConnection:
+    """
+    Stands in for a BlockingConnection to the proxy, answering requests in
+    reverse order once `batch_size` of them are published (except queries
+    that are "unanswered")
+    """
+    batch_size = 1
+
+    def __init__(self, *_):
+        self.is_open = True
+        self.callbacks = Queue()
+        self.requests = list()
+        self.deleted = list()
+        self.consuming = False
+        self.on_response = None
+
+    def channel(self):
+        return self
+
+    def queue_declare(self, queue, arguments=None):
+        self.reply_queue = queue
+        self.queue_arguments = arguments
+
+    def queue_delete(self, queue):
+        self.deleted.append(queue)
+
+    def basic_consume(self, queue, on_response, auto_ack):
+        self.on_response = on_response
+
+    def add_callback_threadsafe(self, callback):
+        self.callbacks.put(callback)
+
+    def start_consuming(self):
+        self.consuming = True
+        while self.consuming:
+            self.callbacks.get()()
+
+    def stop_consuming(self):
+        self.consuming = False
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        from neon_mq_connector.utils.network_utils import b64_to_dict
+        self.requests.append(b64_to_dict(body))
+        if len(self.requests) % self.batch_size == 0:
+            for request in reversed(self.requests[-self.batch_size:]):
+                self._respond(request)
+
+    def _respond(self, request):
+        from neon_mq_connector.utils.network_utils import dict_to_b64
+        if request["query"] == "unanswered":
+            return
+        self.on_response(self, Mock(), Mock(content_type=None), dict_to_b64(
+            {"status_code": 200, "content": request["query"],
+             "message_id": request["message_id"]}))
+
+    def close(self):
+        self.is_open = False
+
+
+class NeonAPIMQClientTests(unittest.TestCase):
+    def test_concurrent_requests(self):
+        from neon_api_proxy.client.mq_client import NeonAPIMQClient
+        connections = list()
+
+        def _connect(params):
+            connections.append(_FakeConnection(params))
+            connections[-1].batch_size = 8
+            return connections[-1]
+
+        client = NeonAPIMQClient({"users": {"mq_handler": {
+            "user": "test", "password": "test"}}})
+        responses = dict()
+
+        def _request(i):
+            responses[i] = client.request({"query": i}, 10)
+
+        with patch("pika.BlockingConnection", side_effect=_connect):
+            threads = [Thread(target=_request, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+            client.shutdown()
+
+        self.assertEqual(len(connections), 1)
+        connection = connections[0]
+        self.assertEqual({i: r["content"] for i, r in responses.items()},
+                         {i: i for i in range(8)})
+        self.assertEqual({r["routing_key"] for r in connection.requests},
+                         {client.reply_queue})
+        self.assertEqual(len({r["message_id"] for r in connection.requests}),
+                         8)
+        self.assertEqual(connection.deleted, [client.reply_queue])
+        # Queues are compatible with reply queue declarations of any proxy
+        self.assertIsNone(connection.queue_arguments)
+        self.assertFalse(connection.is_open)
+        self.assertEqual(client._pending, dict())
+
+    def test_reconnect(self):
+        from neon_api_proxy.client.mq_client import NeonAPIMQClient
+        connections = list()
+
+        def _connect(params):
+            connections.append(_FakeConnection(params))
+            if len(connections) == 1:
+                # Requests sent before the connection is lost are resent
+                connections[0].basic_publish = Mock(
+                    side_effect=ConnectionError("Connection lost"))
+                connections[0].start_consuming = Mock(
+                    side_effect=ConnectionError("Connection lost"))
+            return connections[-1]
+
+        client = NeonAPIMQClient({"users": {"mq_handler": {
+            "user": "test", "password": "test"}}})
+        client.reconnect_seconds = 0
+        with patch("pika.BlockingConnection", side_effect=_connect):
+            response = client.request({"query": "test"}, 10)
+            client.shutdown()
+        self.assertEqual(response["content"], "test")
+        self.assertEqual(len(connections), 2)
+        self.assertIsNone(client.request({"query": "test"}, 0.1))
+        self.assertIsNone(connections[-1].queue_arguments)
+
+        # Reply queues may expire once all proxies don't declare them
+        client = NeonAPIMQClient({"users": {"mq_handler": {
+            "user": "test", "password": "test"}}}, reply_queue_expires="60000")
+        with patch("pika.BlockingConnection", side_effect=_connect):
+            self.assertEqual(client.request({"query": "test"}, 10)["content"],
+                             "test")
+            client.shutdown()
+        self.assertEqual(connections[-1].queue_arguments,
+                         {"x-expires": 60000})
+
+        # Requests fail without waiting for a timeout if MQ is unreachable
+        client = NeonAPIMQClient({"users": {"mq_handler": {
+            "user": "test", "password": "test"}}})
+        with patch("pika.BlockingConnection",
+                   side_effect=ConnectionError("Connection refused")):
+            start = time()
+            self.assertIsNone(client.request({"query": "test"}, 10))
+            self.assertLess(time() - start, 5)
+            client.shutdown()
+
+
+class AsyncClientTests(unittest.TestCase):
+    def test_request_api_async(self):
+        from neon_api_proxy.client import NeonAPI, request_api_async
+        resp = asyncio.run(request_api_async(NeonAPI.TEST_API,
+                                             {"test": "test"}))
+        self.assertEqual(resp["status_code"], 200)
+        with self.assertRaises(TypeError):
+            asyncio.run(request_api_async("alpha_vantage", {"test": "test"}))
+
+    def test_mq_request_async(self):
+        from neon_api_proxy.client.mq_client import NeonAPIMQClient
+        connection = _FakeConnection()
+        connection.batch_size = 8
+        client = NeonAPIMQClient({"users": {"mq_handler": {
+            "user": "test", "password": "test"}}})
+
+        async def _requests():
+            unanswered = asyncio.ensure_future(
+                client.request_async({"query": "unanswered"}, 10))
+            responses = await asyncio.gather(
+                *[client.request_async({"query": i}, 10) for i in range(7)])
+            await asyncio.sleep(0.1)
+            self.assertEqual(len(client._pending), 1)
+            unanswered.cancel()
+            timed_out = await client.request_async({"query": "late"}, 0.1)
+            return responses, timed_out
+
+        with patch("pika.BlockingConnection", return_value=connection):
+            responses, timed_out = asyncio.run(_requests())
+            client.shutdown()
+        self.assertEqual([r["content"] for r in responses], list(range(7)))
+        self.assertIsNone(timed_out)
+        self.assertEqual(client._pending, dict())
+
+    def test_async_helpers(self):
+        from neon_api_proxy.client import alpha_vantage, map_maker
+        quote = {"Global Quote": {"01. symbol": "GOOGL", "05. price": "1.0",
+                                  "08. previous close": "0.9"}}
+        with patch.object(alpha_vantage, "request_api_async",
+                          AsyncMock(return_value={
+                              "status_code": 200,
+                              "content": json.dumps(quote)})) as request:
+            data = asyncio.run(alpha_vantage.get_stock_quote_async("GOOGL"))
+        self.assertEqual(data, {"symbol": "GOOGL", "price": "1.0",
+                                "close": "0.9"})
+        request.assert_awaited_once()
+
+        with patch.object(map_maker, "request_api_async",
+                          AsyncMock(return_value={
+                              "status_code": 200,
+                              "content": '[{"lat": "1.5", "lon": "2"}]'})):
+            coords = asyncio.run(map_maker.get_coordinates_async("Renton"))
+        self.assertEqual(coords, (1.5, 2.0))
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def test_response_cache(self):
+        from neon_api_proxy.client.cache import ResponseCache
+        cache = ResponseCache(max_entries=2, max_bytes=100)
+        query = {"service": "test", "q": "a", "message_id": "1"}
+        response = {"status_code": 200, "content": "a", "cache_ttl": 60,
+                    "message_id": "1", "routing_key": "test"}
+        cache.put(query, response)
+        cached = cache.get({"q": "a", "service": "test", "message_id": "2"})
+        # Hits don't include fields of the cached request
+        self.assertEqual(set(cached), {"status_code", "content", "cache_ttl"})
+        # Hits have the remaining time to live
+        sleep(0.1)
+        self.assertLessEqual(cache.get(query)["cache_ttl"], 59.9)
+        self.assertGreater(cache.get(query)["cache_ttl"], 59)
+        cache.get(query)["content"] = "changed"
+        self.assertEqual(cache.get(query)["content"], "a")
+        self.assertIsNone(cache.get({"service": "test", "q": "b"}))
+
+        # Uncached and expired responses aren't kept
+        cache.put({"q": "b"}, {"status_code": 200, "content": "b"})
+        cache.put({"q": "c"}, {"status_code": 200, "cache_ttl": 0})
+        self.assertEqual(len(cache), 1)
+        cache.put({"q": "d"}, {"status_code": 200, "cache_ttl": 0.01})
+        sleep(0.02)
+        self.assertIsNone(cache.get({"q": "d"}))
+        self.assertEqual(len(cache), 1)
+
+        # Least recently used responses are evicted first
+        cache.put({"q": "e"}, {"content": "e", "cache_ttl": 60})
+        cache.get(query)
+        cache.put({"q": "f"}, {"content": "f", "cache_ttl": 60})
+        self.assertIsNone(cache.get({"q": "e"}))
+        self.assertIsNotNone(cache.get(query))
+        cache.put({"q": "g"}, {"content": "g" * 80, "cache_ttl": 60})
+        self.assertEqual(len(cache), 1)
+        self.assertLessEqual(cache.size, 100)
+        cache.put({"q": "h"}, {"content": "h" * 200, "cache_ttl": 60})
+        self.assertIsNone(cache.get({"q": "h"}))
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_client_cache(self):
+        from neon_api_proxy.client import NeonAPIRemoteClient
+        from neon_api_proxy.client.cache import ResponseCache
+        client = NeonAPIRemoteClient()
+        client.response_cache = ResponseCache()
+        response = {"status_code": 200, "content": "test", "cache_ttl": 60}
+        with patch.object(client, "_request_mq_api",
+                          return_value=response) as request:
+            self.assertEqual(client.resolve_query({"q": "test"}), response)
+            resp = client.resolve_query({"q": "test"})
+            self.assertEqual(resp["content"], "test")
+            self.assertAlmostEqual(resp["cache_ttl"], 60, delta=1)
+            request.assert_called_once()
+            client.resolve_query({"q": "test"}, bypass_cache=True)
+            self.assertEqual(request.call_count, 2)
+        with patch.object(client, "_request_mq_api_async",
+                          AsyncMock(return_value=response)) as request:
+            resp = asyncio.run(client.resolve_query_async({"q": "test"}))
+            self.assertEqual(resp["content"], "test")
+            request.assert_not_awaited()
+            asyncio.run(client.resolve_query_async({"q": "test"},
+                                                   bypass_cache=True))
+            request.assert_awaited_once()
+
+        client.response_cache = None
+        with patch.object(client, "_request_mq_api",
+                          return_value=response) as request:
+            client.resolve_query({"q": "test"})
+            request.assert_called_once()
+
+        # Caching is opt-in
+        import neon_api_proxy.client
+        from neon_api_proxy.client import init_client
+        neon_api_proxy.client._CLIENT = None
+        init_client(local=False)
+        self.assertIsNone(neon_api_proxy.client._CLIENT.response_cache)
+        init_client(cache=True)
+        response_cache = neon_api_proxy.client._CLIENT.response_cache
+        self.assertIsInstance(response_cache, ResponseCache)
+        init_client(local=True)
+        self.assertIs(neon_api_proxy.client._CLIENT.response_cache,
+                      response_cache)
+        init_client(cache=False)
+        self.assertIsNone(neon_api_proxy.client._CLIENT.response_cache)
+        neon_api_proxy.client._CLIENT = None
+        with patch.dict(os.environ, {"NEON_API_PROXY_CLIENT_CACHE": "true"}):
+            init_client(local=True)
+        self.assertIsNotNone(neon_api_proxy.client._CLIENT.response_cache)
+        init_client(cache=False)
+
+
 class WolframAlphaTests(unittest.TestCase):
     def test_get_geolocation_ip(self):
         from neon_api_proxy.client.wolfram_alpha import get_geolocation_params
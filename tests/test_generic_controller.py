@@ -26,13 +26,20 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import asyncio
 import os
 import sys
 import unittest
 import json
+from threading import Event, Thread
+from time import sleep, time
+from unittest.mock import Mock, patch
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from neon_api_proxy.controller import NeonAPIProxyController
+from neon_api_proxy.bulkhead import Bulkhead
+from neon_api_proxy.metrics import update_request_info
+from neon_api_proxy.services import test_api
 
 INVALID_SERVICE_QUERY = {
     "service": "invalid_service",
@@ -95,5 +102,266 @@ class TestGenericController(unittest.TestCase):
         self.assertEqual(resp['status_code'], 200)
 
 
+class TestControllerMetrics(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.controller = NeonAPIProxyController(
+            config={"api_test_endpoint": {}})
+
+    def test_response_metadata(self):
+        resp = self.controller.resolve_query({"service": "api_test_endpoint"})
+        self.assertNotIn("metadata", resp)
+        resp = self.controller.resolve_query({"service": "api_test_endpoint",
+                                              "include_metadata": True})
+        self.assertEqual(resp["metadata"]["service"], "api_test_endpoint")
+        self.assertIsInstance(resp["metadata"]["latency"], float)
+
+    def test_cache_ttl(self):
+        service = self.controller.service_instance_mapping["api_test_endpoint"]
+
+        def _handle_query(**_):
+            update_request_info(cache="hit", cache_ttl=30.0)
+            return {"status_code": 200, "content": "Success",
+                    "encoding": None}
+        with patch.object(service, "handle_query", _handle_query):
+            resp = self.controller.resolve_query(
+                {"service": "api_test_endpoint"})
+        self.assertEqual(resp["cache_ttl"], 30.0)
+        resp = self.controller.resolve_query({"service": "api_test_endpoint"})
+        self.assertNotIn("cache_ttl", resp)
+
+        # Unknown times to live are not sent
+        def _handle_query(**_):
+            update_request_info(cache="stale", cache_ttl=None)
+            return {"status_code": 200, "content": "Success",
+                    "encoding": None}
+        with patch.object(service, "handle_query", _handle_query):
+            resp = self.controller.resolve_query(
+                {"service": "api_test_endpoint"})
+        self.assertNotIn("cache_ttl", resp)
+
+    def test_get_metrics(self):
+        self.controller.resolve_query({"service": "api_test_endpoint"})
+        metrics = self.controller.get_metrics()
+        self.assertIn('neon_api_proxy_request_latency_seconds_count'
+                      '{service="api_test_endpoint"}', metrics)
+
+    def test_expired_deadline(self):
+        resp = self.controller.resolve_query({"service": "api_test_endpoint",
+                                              "deadline": time() - 1})
+        self.assertEqual(resp["status_code"], 504)
+        service = self.controller.service_instance_mapping["api_test_endpoint"]
+        self.assertEqual(service.metrics.expired_requests, 1)
+        self.assertIn('neon_api_proxy_expired_requests_total'
+                      '{service="api_test_endpoint"} 1',
+                      self.controller.get_metrics())
+        resp = self.controller.resolve_query({"service": "api_test_endpoint",
+                                              "deadline": time() + 10})
+        self.assertEqual(resp["status_code"], 200)
+
+    def test_affinity_key(self):
+        key = self.controller.get_affinity_key(
+            {"service": "api_test_endpoint", "a": 1, "b": 2})
+        self.assertTrue(key.startswith("api_test_endpoint:"))
+        self.assertEqual(key, self.controller.get_affinity_key(
+            {"b": 2, "a": 1, "service": "api_test_endpoint",
+             "message_id": "test", "deadline": time() + 10}))
+        self.assertNotEqual(key, self.controller.get_affinity_key(
+            {"service": "api_test_endpoint", "a": 2, "b": 2}))
+        self.assertIsNone(self.controller.get_affinity_key(
+            {"service": "invalid"}))
+
+    def test_resolve_query_async(self):
+        resp = asyncio.run(self.controller.resolve_query_async(
+            {"service": "api_test_endpoint", "message_id": "test",
+             "include_metadata": True, "deadline": time() + 10}))
+        self.assertEqual(resp["status_code"], 200)
+        self.assertEqual(resp["message_id"], "test")
+        self.assertEqual(resp["metadata"]["service"], "api_test_endpoint")
+        resp = asyncio.run(self.controller.resolve_query_async(
+            {"service": "api_test_endpoint", "deadline": time() - 1}))
+        self.assertEqual(resp["status_code"], 504)
+        resp = asyncio.run(self.controller.resolve_query_async(
+            INVALID_SERVICE_QUERY.copy()))
+        self.assertEqual(resp["status_code"], 401)
+
+
+class TestServiceRegistry(unittest.TestCase):
+    def test_lazy_load(self):
+        controller = NeonAPIProxyController(config={"api_test_endpoint": {}})
+        registry = controller.service_instance_mapping
+        self.assertEqual(registry.loaded(), {})
+        self.assertIn("wolfram_alpha", registry.names)
+        resp = controller.resolve_query({"service": "api_test_endpoint"})
+        self.assertEqual(resp["status_code"], 200)
+        self.assertEqual(list(registry.loaded()), ["api_test_endpoint"])
+        self.assertIs(registry["api_test_endpoint"],
+                      registry.loaded()["api_test_endpoint"])
+
+    def test_enabled_services(self):
+        controller = NeonAPIProxyController(
+            config={"api_test_endpoint": {"max_concurrent": 1},
+                    "wolfram_alpha": {"max_concurrent": 1}},
+            services=["api_test_endpoint"])
+        registry = controller.service_instance_mapping
+        self.assertEqual(registry.names, ["api_test_endpoint"])
+        self.assertEqual(list(controller.bulkheads), ["api_test_endpoint"])
+        resp = controller.resolve_query({"service": "wolfram_alpha"})
+        self.assertEqual(resp["status_code"], 401)
+        self.assertNotIn("wolfram_alpha", registry.loaded())
+
+        os.environ["NEON_API_PROXY_SERVICES"] = "api_test_endpoint, other"
+        try:
+            controller = NeonAPIProxyController(
+                config={"api_test_endpoint": {}})
+        finally:
+            os.environ.pop("NEON_API_PROXY_SERVICES")
+        self.assertEqual(controller.enabled_services,
+                         ["api_test_endpoint", "other"])
+
+    def test_plugin_service(self):
+        plugin = Mock()
+        plugin.name = "plugin_service"
+        plugin.load.return_value = test_api.TestAPI
+        with patch("neon_api_proxy.registry.get_service_entry_points",
+                   return_value={"plugin_service": plugin}):
+            controller = NeonAPIProxyController(
+                config={"api_test_endpoint": {}})
+            self.assertIn("plugin_service",
+                          controller.service_instance_mapping.names)
+            plugin.load.assert_not_called()
+            resp = controller.resolve_query({"service": "plugin_service"})
+        self.assertEqual(resp["status_code"], 200)
+        plugin.load.assert_called_once()
+
+    def test_failed_service(self):
+        with patch.dict(NeonAPIProxyController.service_class_mapping,
+                        failing_service=Mock(side_effect=ValueError("No key"))):
+            controller = NeonAPIProxyController(
+                config={"api_test_endpoint": {}}, services=[
+                    "api_test_endpoint", "failing_service"])
+        resp = controller.resolve_query({"service": "failing_service"})
+        self.assertEqual(resp["status_code"], 401)
+        self.assertEqual(list(controller.service_instance_mapping),
+                         ["api_test_endpoint"])
+
+
+class TestControllerBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.controller = NeonAPIProxyController(
+            config={"api_test_endpoint": {}})
+        cls.service = \
+            cls.controller.service_instance_mapping["api_test_endpoint"]
+
+    def test_resolve_batch(self):
+        query = {"service": "api_test_endpoint", "q": 1}
+        with patch.object(self.service, "handle_query",
+                          wraps=self.service.handle_query) as handle_query:
+            resp = self.controller.resolve_query(
+                {"message_id": "test", "include_metadata": True,
+                 "queries": [query, INVALID_SERVICE_QUERY.copy(), "bad",
+                             dict(query), {"queries": [query]}]})
+            handle_query.assert_called_once()
+        self.assertEqual(resp["status_code"], 200)
+        self.assertEqual(resp["message_id"], "test")
+        responses = resp["responses"]
+        self.assertEqual([r["status_code"] for r in responses],
+                         [200, 401, -1, 200, -1])
+        self.assertEqual(responses[0]["content"], "Success")
+        self.assertEqual(responses[0]["metadata"]["service"],
+                         "api_test_endpoint")
+        self.assertEqual(responses[0], responses[3])
+        self.assertIsNot(responses[0], responses[3])
+
+    def test_resolve_batch_async(self):
+        resp = asyncio.run(self.controller.resolve_query_async(
+            {"message_id": "test", "deadline": time() - 1,
+             "queries": [{"service": "api_test_endpoint"},
+                         {"service": "api_test_endpoint",
+                          "deadline": time() + 10}]}))
+        self.assertEqual(resp["message_id"], "test")
+        self.assertEqual([r["status_code"] for r in resp["responses"]],
+                         [504, 200])
+
+    def test_invalid_batch(self):
+        for queries in ([], "bad",
+                        [{"service": "api_test_endpoint", "q": i}
+                         for i in range(self.controller.max_batch_size + 1)]):
+            resp = self.controller.resolve_query({"message_id": "test",
+                                                  "queries": queries})
+            self.assertEqual(resp["status_code"], 400)
+            self.assertEqual(resp["message_id"], "test")
+            self.assertNotIn("responses", resp)
+
+
+class TestControllerBulkheads(unittest.TestCase):
+    def test_bulkhead(self):
+        bulkhead = Bulkhead(1, max_queued=0)
+        self.assertTrue(bulkhead.acquire())
+        self.assertFalse(bulkhead.acquire())
+        bulkhead.release()
+        self.assertTrue(bulkhead.acquire())
+
+        bulkhead = Bulkhead(1, max_queued=1, queue_timeout=0.1)
+        self.assertTrue(bulkhead.acquire())
+        self.assertFalse(bulkhead.acquire())
+        self.assertEqual(bulkhead.queued, 0)
+
+    def test_busy_service_rejected(self):
+        controller = NeonAPIProxyController(
+            config={"api_test_endpoint": {"max_concurrent": 1,
+                                          "max_queued": 1}})
+        service = controller.service_instance_mapping["api_test_endpoint"]
+        release = Event()
+        handle_query = service.handle_query
+
+        def _slow_query(**kwargs):
+            release.wait(5)
+            return handle_query(**kwargs)
+        service.handle_query = _slow_query
+
+        responses = list()
+        threads = [Thread(target=lambda: responses.append(
+            controller.resolve_query({"service": "api_test_endpoint"})))
+            for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for _ in range(50):
+            if controller.bulkheads["api_test_endpoint"].queued == 1:
+                break
+            sleep(0.1)
+
+        resp = controller.resolve_query({"service": "api_test_endpoint"})
+        self.assertEqual(resp["status_code"], 503)
+        self.assertEqual(service.metrics.rejected_requests, 1)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([r["status_code"] for r in responses], [200, 200])
+        self.assertEqual(controller.resolve_query(
+            {"service": "api_test_endpoint"})["status_code"], 200)
+
+    def test_busy_service_rejected_async(self):
+        controller = NeonAPIProxyController(
+            config={"api_test_endpoint": {"max_concurrent": 1,
+                                          "max_queued": 0}})
+        service = controller.service_instance_mapping["api_test_endpoint"]
+
+        async def _slow_query(**kwargs):
+            await asyncio.sleep(0.2)
+            return service.handle_query(**kwargs)
+        service.handle_query_async = _slow_query
+
+        async def _resolve_all():
+            return await asyncio.gather(
+                *[controller.resolve_query_async(
+                    {"service": "api_test_endpoint"}) for _ in range(3)])
+        responses = asyncio.run(_resolve_all())
+        self.assertEqual(sorted(r["status_code"] for r in responses),
+                         [200, 503, 503])
+
+
 if __name__ == '__main__':
     unittest.main()
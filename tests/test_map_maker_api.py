@@ -31,9 +31,14 @@ import os
 import sys
 import unittest
 
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from mock.mock import Mock, patch
 from requests import Response
+from requests.exceptions import Timeout
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_api_proxy.cached_api import set_request_deadline
 from neon_api_proxy.services.map_maker_api import MapMakerAPI
 
 VALID_LAT = "47.4797"
@@ -88,5 +93,43 @@ class TestMapMakerAPI(unittest.TestCase):
         self.assertNotEqual(invalid_coords['status_code'], 200)
 
 
+class TestMapMakerRateLimit(unittest.TestCase):
+    def test_concurrent_queries(self):
+        api = MapMakerAPI(api_key="test")
+        api._rate_limit_seconds = 0.2
+        api._last_query = 0
+        query_times = list()
+
+        def _query_geocode(_):
+            query_times.append(time())
+            return Mock(status_code=200, content=b"[]", encoding="utf-8")
+        with patch.object(api, "_query_geocode", _query_geocode):
+            with ThreadPoolExecutor(4) as executor:
+                responses = list(executor.map(
+                    lambda i: api.handle_query(address=str(i)), range(4)))
+        self.assertEqual([r["status_code"] for r in responses], [200] * 4)
+        query_times.sort()
+        for previous, query_time in zip(query_times, query_times[1:]):
+            self.assertGreaterEqual(query_time - previous, 0.19)
+
+    def test_deadline_exceeded_before_query(self):
+        api = MapMakerAPI(api_key="test")
+        api._rate_limit_seconds = 1
+        api._last_query = time()
+        last_query = api._last_query
+        set_request_deadline(time() + 0.2)
+        try:
+            start = time()
+            with patch.object(api, "_query_geocode") as query_geocode:
+                with self.assertRaises(Timeout):
+                    api.handle_query(address="deadline")
+            query_geocode.assert_not_called()
+            self.assertLess(time() - start, 0.1)
+            # The abandoned request does not use up the next query time
+            self.assertEqual(api._last_query, last_query)
+        finally:
+            set_request_deadline(None)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -26,13 +26,26 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import asyncio
 import os
 import sys
 import unittest
 from multiprocessing import Process
+from threading import Event, current_thread
+from time import sleep, time
+
+import msgpack
+import pika
+from mock.mock import AsyncMock, Mock, patch
+from neon_mq_connector.utils.network_utils import b64_to_dict, dict_to_b64
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from neon_api_proxy.__main__ import run_mq_handler
+from neon_api_proxy.api_connector import AFFINITY_EXCHANGE, \
+    NeonAPIMQConnector
+from neon_api_proxy.async_connector import NeonAPIAsyncConnector
+from neon_api_proxy.wire_format import MSGPACK_CONTENT_TYPE
+from neon_api_proxy.worker_pool import PriorityWorkerPool
 
 VALID_WOLFRAM_QUERY = {
     "service": "wolfram_alpha",
@@ -61,5 +74,545 @@ class TestMQHandler(unittest.TestCase):
         self.assertNotEqual(resp["status_code"], 401)
 
 
+class TestNeonAPIMQConnector(unittest.TestCase):
+    config = {"server": "localhost",
+              "users": {"neon_api_connector": {
+                  "user": "test", "password": "test",
+                  "properties": {"max_workers": 4}}}}
+
+    @staticmethod
+    def _get_channel(select_connection: bool = False) -> Mock:
+        channel = Mock(spec=pika.channel.Channel) if select_connection \
+            else Mock()
+        channel.callback_threads = list()
+
+        def _run_callback(callback):
+            channel.callback_threads.append(current_thread())
+            callback()
+        if select_connection:
+            channel.connection = Mock(spec=["ioloop"])
+            channel.connection.ioloop.add_callback_threadsafe = _run_callback
+        else:
+            channel.connection.add_callback_threadsafe = _run_callback
+        return channel
+
+    def _get_connector(self, proxy: Mock, **properties) -> NeonAPIMQConnector:
+        config = {**self.config, "users": {"neon_api_connector": {
+            "user": "test", "password": "test",
+            "properties": {"max_workers": 4, **properties}}}}
+        return NeonAPIMQConnector(config, "neon_api_connector", proxy)
+
+    @staticmethod
+    def _get_proxy() -> Mock:
+        proxy = Mock()
+        proxy.resolve_query.side_effect = lambda _: {
+            "status_code": 200, "content": b"", "encoding": None}
+        return proxy
+
+    @staticmethod
+    def _wait_for(check: callable):
+        for _ in range(50):
+            if check():
+                return
+            sleep(0.1)
+
+    def test_prefetch_matches_workers(self):
+        connector = self._get_connector(self._get_proxy())
+        self.assertEqual(connector.max_workers, 4)
+
+        # Prefetch is limited before the consumer starts
+        connector.async_consumers_enabled = False
+        connector.pre_run()
+        consumer = connector.consumers["neon_api_consumer"]
+        self.assertEqual(consumer.prefetch_count, 4)
+        connection = Mock()
+        with patch("pika.BlockingConnection", return_value=connection):
+            consumer._create_connection()
+        channel = connection.channel.return_value
+        calls = [call[0] for call in channel.method_calls]
+        self.assertLess(calls.index("basic_qos"), calls.index("basic_consume"))
+        channel.basic_qos.assert_called_once_with(prefetch_count=4)
+
+        # Select consumers run on the current event loop
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+        connector.async_consumers_enabled = True
+        connector.pre_run()
+        consumer = connector.consumers["neon_api_consumer_targeted"]
+        consumer.channel = Mock()
+        consumer.set_qos()
+        consumer.channel.basic_qos.assert_called_once_with(
+            prefetch_count=4, callback=consumer.start_consuming)
+        consumer.channel.basic_consume.assert_not_called()
+
+        # Restarted consumers keep the limit
+        self.assertEqual(connector.consumer_properties["neon_api_consumer"]
+                         ["properties"]["prefetch_count"], 4)
+
+    def test_concurrent_requests(self):
+        release = Event()
+        started = list()
+
+        def _resolve_query(request):
+            started.append(request["id"])
+            release.wait(5)
+            return {"status_code": 200, "content": b"response",
+                    "encoding": "utf-8"}
+        proxy = Mock()
+        proxy.resolve_query = _resolve_query
+        connector = self._get_connector(proxy)
+
+        for select_connection in (False, True):
+            started.clear()
+            release.clear()
+            channel = self._get_channel(select_connection)
+            for tag in range(3):
+                connector.handle_api_input(
+                    channel, Mock(delivery_tag=tag), None,
+                    dict_to_b64({"service": "test", "id": tag,
+                                 "routing_key": "test_output"}))
+            # Requests are resolved concurrently and handling does not block
+            for _ in range(50):
+                if len(started) == 3:
+                    break
+                sleep(0.1)
+            self.assertEqual(sorted(started), [0, 1, 2])
+            channel.basic_ack.assert_not_called()
+
+            release.set()
+            for _ in range(50):
+                if channel.basic_ack.call_count == 3:
+                    break
+                sleep(0.1)
+            self.assertEqual(channel.basic_ack.call_count, 3)
+            self.assertEqual(len(channel.callback_threads), 3)
+            published = channel.basic_publish.call_args.kwargs
+            self.assertEqual(published["routing_key"], "test_output")
+            self.assertEqual(b64_to_dict(published["body"])["content"],
+                             "response")
+
+    def test_reply_queue_declared_once(self):
+        connector = self._get_connector(self._get_proxy())
+        channel = self._get_channel()
+        for tag in range(3):
+            connector.handle_api_input(
+                channel, Mock(delivery_tag=tag), None,
+                dict_to_b64({"service": "test", "routing_key": "replies"}))
+            self._wait_for(lambda: channel.basic_ack.call_count == tag + 1)
+        self.assertEqual(channel.basic_publish.call_count, 3)
+        channel.queue_declare.assert_called_once_with(queue="replies")
+
+        # Queues are remembered per channel
+        channel = self._get_channel()
+        connector.handle_api_input(
+            channel, Mock(delivery_tag=0), None,
+            dict_to_b64({"service": "test", "routing_key": "replies"}))
+        self._wait_for(lambda: channel.basic_ack.called)
+        channel.queue_declare.assert_called_once_with(queue="replies")
+
+        # Client reply queues are declared by the client
+        connector.handle_api_input(
+            channel, Mock(delivery_tag=1), None,
+            dict_to_b64({"service": "test",
+                         "routing_key": "neon_api_reply_test"}))
+        self._wait_for(lambda: channel.basic_ack.call_count == 2)
+        channel.queue_declare.assert_called_once_with(queue="replies")
+        self.assertEqual(channel.basic_publish.call_args.kwargs["routing_key"],
+                         "neon_api_reply_test")
+
+    def test_publisher_confirms(self):
+        connector = self._get_connector(self._get_proxy(),
+                                        publisher_confirms=True)
+        channel = self._get_channel(select_connection=True)
+        for tag in range(3):
+            connector.handle_api_input(channel, Mock(delivery_tag=tag), None,
+                                       dict_to_b64({"service": "test"}))
+            self._wait_for(lambda: channel.basic_publish.call_count == tag + 1)
+        channel.confirm_delivery.assert_called_once()
+        channel.basic_ack.assert_not_called()
+
+        on_confirm = channel.confirm_delivery.call_args.args[0]
+        on_confirm(Mock(method=pika.spec.Basic.Ack(delivery_tag=2,
+                                                   multiple=True)))
+        self.assertEqual([c.args[0] for c in channel.basic_ack.call_args_list],
+                         [0, 1])
+        on_confirm(Mock(method=pika.spec.Basic.Nack(delivery_tag=3)))
+        channel.basic_nack.assert_called_once_with(2, requeue=True)
+
+    def test_publisher_confirms_blocking_channel(self):
+        connector = self._get_connector(self._get_proxy(),
+                                        publisher_confirms=True)
+        channel = self._get_channel()
+        connector.handle_api_input(channel, Mock(delivery_tag=0), None,
+                                   dict_to_b64({"service": "test"}))
+        self._wait_for(lambda: channel.basic_ack.called)
+        channel.confirm_delivery.assert_not_called()
+        channel.basic_ack.assert_called_once_with(0)
+
+    def test_expired_request_dropped(self):
+        proxy = self._get_proxy()
+        connector = self._get_connector(proxy)
+        channel = self._get_channel()
+        connector.handle_api_input(
+            channel, Mock(delivery_tag=0), None,
+            dict_to_b64({"service": "test", "deadline": time() - 1}))
+        self._wait_for(lambda: channel.basic_ack.called)
+        channel.basic_ack.assert_called_once_with(0)
+        channel.basic_publish.assert_not_called()
+        proxy.resolve_query.assert_not_called()
+        proxy.record_expired.assert_called_once_with("test")
+
+        connector.handle_api_input(
+            channel, Mock(delivery_tag=1), None,
+            dict_to_b64({"service": "test", "deadline": time() + 30}))
+        self._wait_for(lambda: channel.basic_publish.called)
+        expiration = channel.basic_publish.call_args.kwargs[
+            "properties"].expiration
+        self.assertTrue(25000 < int(expiration) <= 30000)
+
+    def test_failed_request_rejected(self):
+        proxy = self._get_proxy()
+        proxy.resolve_query.side_effect = RuntimeError("test")
+        connector = self._get_connector(proxy)
+        channel = self._get_channel()
+        connector.handle_api_input(channel, Mock(delivery_tag=0), None,
+                                   dict_to_b64({"service": "test"}))
+        self._wait_for(lambda: channel.basic_nack.called)
+        channel.basic_nack.assert_called_once_with(0, requeue=False)
+        # Rejected on the connection's thread
+        self.assertEqual(len(channel.callback_threads), 1)
+
+        # Undecodable requests are rejected when received
+        connector.handle_api_input(channel, Mock(delivery_tag=1), None,
+                                   "invalid")
+        channel.basic_nack.assert_called_with(1, requeue=False)
+
+        # Requests whose response can't be published are rejected
+        proxy.resolve_query.side_effect = None
+        proxy.resolve_query.return_value = {"status_code": 200,
+                                            "content": b"", "encoding": None}
+        channel.basic_publish.side_effect = RuntimeError("test")
+        connector.handle_api_input(channel, Mock(delivery_tag=2), None,
+                                   dict_to_b64({"service": "test"}))
+        self._wait_for(lambda: channel.basic_nack.call_count == 3)
+        channel.basic_nack.assert_called_with(2, requeue=False)
+        channel.basic_ack.assert_not_called()
+
+    def test_priority_lanes(self):
+        release = Event()
+        handled = list()
+
+        def _resolve_query(request):
+            if request["id"] == "blocker":
+                release.wait(5)
+            handled.append(request["id"])
+            return {"status_code": 200, "content": b"", "encoding": None}
+        proxy = Mock()
+        proxy.resolve_query = _resolve_query
+        connector = self._get_connector(proxy, max_workers=1)
+        self.assertEqual(connector.background_prefetch_count, 1)
+
+        channel = self._get_channel()
+        background_channel = self._get_channel()
+        connector.handle_api_input(channel, Mock(delivery_tag=0), None,
+                                   dict_to_b64({"id": "blocker"}))
+        self._wait_for(lambda: connector._executor._queue.empty())
+        connector.handle_background_input(
+            background_channel, Mock(delivery_tag=0), None,
+            dict_to_b64({"id": "background_queue"}))
+        connector.handle_api_input(
+            channel, Mock(delivery_tag=1), None,
+            dict_to_b64({"id": "background_field", "priority": "background"}))
+        connector.handle_api_input(channel, Mock(delivery_tag=2), None,
+                                   dict_to_b64({"id": "interactive"}))
+        release.set()
+        self._wait_for(lambda: len(handled) == 4)
+        self.assertEqual(handled, ["blocker", "interactive",
+                                   "background_queue", "background_field"])
+
+        # The background consumer is limited before it starts consuming
+        connector.async_consumers_enabled = False
+        connector.pre_run()
+        for name in ("neon_api_consumer", "neon_api_consumer_background"):
+            self.assertEqual(connector.consumers[name].prefetch_count, 1)
+        connection = Mock()
+        with patch("pika.BlockingConnection", return_value=connection):
+            connector.consumers["neon_api_consumer_background"]\
+                ._create_connection()
+        channel = connection.channel.return_value
+        calls = [call[0] for call in channel.method_calls]
+        self.assertLess(calls.index("basic_qos"), calls.index("basic_consume"))
+        channel.basic_qos.assert_called_once_with(prefetch_count=1)
+        self.assertEqual(channel.basic_consume.call_args.kwargs["queue"],
+                         "neon_api_input_background")
+
+    def test_binary_wire_format(self):
+        proxy = Mock()
+        proxy.resolve_query.side_effect = lambda _: {
+            "status_code": 200, "content": b"\x89PNG", "encoding": None}
+        connector = self._get_connector(proxy)
+
+        channel = self._get_channel()
+        connector.handle_api_input(
+            channel, Mock(delivery_tag=0),
+            pika.BasicProperties(content_type=MSGPACK_CONTENT_TYPE),
+            msgpack.packb({"service": "test", "routing_key": "replies"}))
+        self._wait_for(lambda: channel.basic_ack.called)
+        proxy.resolve_query.assert_called_once_with(
+            {"service": "test", "routing_key": "replies"})
+        published = channel.basic_publish.call_args.kwargs
+        self.assertEqual(published["routing_key"], "replies")
+        self.assertEqual(published["properties"].content_type,
+                         MSGPACK_CONTENT_TYPE)
+        self.assertEqual(msgpack.unpackb(published["body"])["content"],
+                         b"\x89PNG")
+
+        # Base64 requests may ask for binary responses
+        channel = self._get_channel()
+        connector.handle_api_input(
+            channel, Mock(delivery_tag=0),
+            pika.BasicProperties(headers={"accept": MSGPACK_CONTENT_TYPE}),
+            dict_to_b64({"service": "test"}))
+        self._wait_for(lambda: channel.basic_ack.called)
+        published = channel.basic_publish.call_args.kwargs
+        self.assertEqual(msgpack.unpackb(published["body"])["content"],
+                         b"\x89PNG")
+
+        # Base64 remains the default
+        channel = self._get_channel()
+        connector.handle_api_input(channel, Mock(delivery_tag=0),
+                                   pika.BasicProperties(),
+                                   dict_to_b64({"service": "test"}))
+        self._wait_for(lambda: channel.basic_ack.called)
+        published = channel.basic_publish.call_args.kwargs
+        self.assertIsNone(published["properties"].content_type)
+        self.assertEqual(b64_to_dict(published["body"])["status_code"], 200)
+
+    def test_batch_request(self):
+        proxy = Mock()
+        proxy.resolve_query.side_effect = lambda _: {
+            "status_code": 200, "message_id": "test", "responses": [
+                {"status_code": 200, "content": b"Success", "encoding": None},
+                {"status_code": -1, "content": "error", "encoding": None},
+                {"status_code": 401, "encoding": None}]}
+        connector = self._get_connector(proxy)
+        channel = self._get_channel()
+        connector.handle_api_input(
+            channel, Mock(delivery_tag=0), pika.BasicProperties(),
+            dict_to_b64({"message_id": "test",
+                         "queries": [{"service": "test"}]}))
+        self._wait_for(lambda: channel.basic_ack.called)
+        response = b64_to_dict(channel.basic_publish.call_args.kwargs["body"])
+        self.assertNotIn("content", response)
+        self.assertEqual(response["responses"], [
+            {"status_code": 200, "content": "Success", "encoding": None},
+            {"status_code": -1, "content": "error", "encoding": None},
+            {"status_code": 401, "encoding": None}])
+
+    def test_affinity_routing(self):
+        proxy = self._get_proxy()
+        proxy.get_affinity_key.return_value = "test:abc"
+        connector = self._get_connector(proxy, affinity_routing=True)
+        channel = self._get_channel()
+        body = dict_to_b64({"service": "test"})
+
+        # Requests are handled locally until this instance's queue is bound
+        connector.handle_api_input(channel, Mock(delivery_tag=0), None, body)
+        self._wait_for(lambda: channel.basic_ack.called)
+        proxy.resolve_query.assert_called_once()
+
+        connector._affinity_bound.set()
+        channel = self._get_channel()
+        properties = pika.BasicProperties(headers={"accept": "test"})
+        connector.handle_api_input(channel, Mock(delivery_tag=1), properties,
+                                   body)
+        channel.basic_publish.assert_called_once_with(
+            exchange=AFFINITY_EXCHANGE, routing_key="test:abc", body=body,
+            properties=properties)
+        channel.basic_ack.assert_called_once_with(1)
+        proxy.resolve_query.assert_called_once()
+
+        # Forwarded requests are handled by the instance they are routed to
+        channel = self._get_channel()
+        connector.handle_targeted_input(channel, Mock(delivery_tag=2), None,
+                                        body)
+        self._wait_for(lambda: channel.basic_ack.called)
+        self.assertEqual(proxy.resolve_query.call_count, 2)
+        self.assertNotEqual(channel.basic_publish.call_args.kwargs["exchange"],
+                            AFFINITY_EXCHANGE)
+
+        # Requests without a key are handled locally
+        proxy.get_affinity_key.return_value = None
+        channel = self._get_channel()
+        connector.handle_api_input(channel, Mock(delivery_tag=3), None, body)
+        self._wait_for(lambda: channel.basic_ack.called)
+        self.assertEqual(proxy.resolve_query.call_count, 3)
+
+    def test_affinity_queue_bound(self):
+        connector = self._get_connector(self._get_proxy(),
+                                        affinity_routing=True)
+        # The targeted queue can be declared again by a restarted consumer
+        connector.async_consumers_enabled = False
+        with patch.object(connector, "_declare_affinity_exchange",
+                          return_value=True):
+            connector.pre_run()
+        consumer = connector.consumers["neon_api_consumer_targeted"]
+        self.assertFalse(consumer.queue_exclusive)
+        connection = Mock()
+        with patch("pika.BlockingConnection", return_value=connection):
+            consumer._create_connection()
+        connection.channel.return_value.queue_declare.assert_called_once_with(
+            queue=connector.targeted_queue, auto_delete=False,
+            exclusive=False,
+            arguments={"x-expires": connector.targeted_queue_expires})
+        self.assertIsNone(connector.consumers["neon_api_consumer"]
+                          .queue_arguments)
+
+        for select_connection in (False, True):
+            connector._affinity_bound.clear()
+            channel = self._get_channel(select_connection)
+            if select_connection:
+                channel.queue_bind.side_effect = \
+                    lambda **kwargs: kwargs["callback"](Mock())
+            connector.consumers["neon_api_consumer_targeted"] = \
+                Mock(is_consuming=True, channel=channel)
+            connector._bind_affinity_queue(timeout=1)
+            self.assertTrue(connector._affinity_bound.is_set())
+            self.assertEqual(len(channel.callback_threads), 1)
+            kwargs = channel.queue_bind.call_args.kwargs
+            self.assertEqual(kwargs["queue"], connector.targeted_queue)
+            self.assertEqual(kwargs["exchange"], AFFINITY_EXCHANGE)
+            self.assertEqual(kwargs["routing_key"], "1")
+
+
+class TestNeonAPIAsyncConnector(unittest.TestCase):
+    def _get_connector(self, proxy: Mock, **properties) -> \
+            NeonAPIAsyncConnector:
+        config = {"server": "localhost", "users": {"neon_api_connector": {
+            "user": "test", "password": "test", "properties": properties}}}
+        return NeonAPIAsyncConnector(config, "neon_api_connector", proxy)
+
+    def test_concurrent_requests(self):
+        async def _resolve_query_async(request):
+            await asyncio.sleep(0.5)
+            return {"status_code": 200, "content": b"response",
+                    "encoding": "utf-8"}
+        proxy = Mock()
+        proxy.resolve_query_async = _resolve_query_async
+        connector = self._get_connector(proxy)
+        self.assertEqual(connector.prefetch_count, 256)
+        self.assertEqual(connector.background_prefetch_count, 64)
+        channel = Mock()
+
+        async def _handle_requests():
+            connector._loop = asyncio.get_event_loop()
+            for tag in range(100):
+                connector.handle_api_input(
+                    channel, Mock(delivery_tag=tag), None,
+                    dict_to_b64({"service": "test",
+                                 "routing_key": "replies"}))
+            connector.handle_api_input(
+                channel, Mock(delivery_tag=100), None,
+                dict_to_b64({"service": "test", "deadline": time() - 1}))
+            await asyncio.gather(*list(connector._tasks))
+
+        # Requests are resolved concurrently on a single thread
+        start = time()
+        asyncio.run(_handle_requests())
+        self.assertLess(time() - start, 10)
+        self.assertEqual(channel.basic_ack.call_count, 101)
+        self.assertEqual(channel.basic_publish.call_count, 100)
+        published = channel.basic_publish.call_args.kwargs
+        self.assertEqual(published["routing_key"], "replies")
+        self.assertEqual(b64_to_dict(published["body"])["content"],
+                         "response")
+        proxy.record_expired.assert_called_once_with("test")
+
+    def test_declare_consumers(self):
+        channels = list()
+
+        def _open_channel(on_open_callback):
+            channel = Mock(spec=pika.channel.Channel)
+            for method in (channel.exchange_declare, channel.queue_declare,
+                           channel.queue_bind):
+                method.side_effect = \
+                    lambda callback, **kwargs: callback(Mock())
+            channels.append(channel)
+            on_open_callback(channel)
+        connection = Mock()
+        connection.channel.side_effect = _open_channel
+        connector = self._get_connector(Mock(), affinity_routing=True)
+
+        async def _declare_consumers():
+            connector._loop = asyncio.get_event_loop()
+            connector._affinity_routing = True
+            await connector._declare_consumers(connection)
+        asyncio.run(_declare_consumers())
+
+        channels[0].exchange_declare.assert_called_once()
+        self.assertEqual(
+            channels[0].exchange_declare.call_args.kwargs["exchange_type"],
+            "x-consistent-hash")
+        self.assertEqual([c.basic_consume.call_args.kwargs["queue"]
+                          for c in channels[1:]],
+                         ["neon_api_input", connector.targeted_queue,
+                          "neon_api_input_background"])
+        self.assertEqual([c.basic_qos.call_args.kwargs["prefetch_count"]
+                          for c in channels[1:]], [256, 256, 64])
+        self.assertEqual(
+            channels[2].queue_declare.call_args.kwargs["arguments"],
+            {"x-expires": connector.targeted_queue_expires})
+        self.assertIsNone(
+            channels[1].queue_declare.call_args.kwargs["arguments"])
+        self.assertEqual(channels[2].queue_bind.call_args.kwargs["exchange"],
+                         AFFINITY_EXCHANGE)
+        channels[1].queue_bind.assert_not_called()
+        self.assertTrue(connector._affinity_bound.is_set())
+
+
+    def test_run_mq_handler(self):
+        connector = Mock(metrics_port=None)
+        connector.run_async = AsyncMock(side_effect=ConnectionError("test"))
+        with patch("neon_api_proxy.__main__.NeonAPIProxyController"), \
+                patch("neon_api_proxy.__main__.NeonAPIAsyncConnector",
+                      return_value=connector):
+            # Failures are raised in the calling thread
+            with self.assertRaises(ConnectionError):
+                run_mq_handler(use_asyncio=True)
+            connector.run_async = AsyncMock()
+            run_mq_handler(use_asyncio=True)
+        connector.run_async.assert_awaited_once()
+
+
+class TestPriorityWorkerPool(unittest.TestCase):
+    def test_priority_order(self):
+        pool = PriorityWorkerPool(1)
+        release = Event()
+        handled = list()
+        pool.submit(release.wait, 5)
+        for priority, name in ((1, "low_1"), (0, "high_1"), (1, "low_2"),
+                               (0, "high_2")):
+            pool.submit(handled.append, name, priority=priority)
+        release.set()
+        for _ in range(50):
+            if len(handled) == 4:
+                break
+            sleep(0.1)
+        self.assertEqual(handled, ["high_1", "high_2", "low_1", "low_2"])
+        self.assertEqual(len(pool._threads), 1)
+        pool.shutdown()
+
+    def test_max_workers(self):
+        pool = PriorityWorkerPool(3)
+        release = Event()
+        for _ in range(5):
+            pool.submit(release.wait, 5)
+        self.assertEqual(len(pool._threads), 3)
+        release.set()
+        pool.shutdown()
+
+
 if __name__ == '__main__':
     unittest.main()
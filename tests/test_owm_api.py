@@ -26,11 +26,13 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import asyncio
 import json
 import os
 import sys
 import unittest
 
+from mock.mock import AsyncMock, Mock
 from requests import Response
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -139,5 +141,185 @@ class TestOpenWeatherAPI(unittest.TestCase):
         self.assertNotEqual(resp["status_code"], 200)
 
 
+class TestOpenWeatherCoordinates(unittest.TestCase):
+    def _get_requested_url(self, api: OpenWeatherAPI, lat: str, lng: str):
+        api.get_with_cache_timeout = Mock()
+        api._get_api_response(lat, lng, "metric")
+        return api.get_with_cache_timeout.call_args[0][0]
+
+    def test_quantize_coordinates(self):
+        api = OpenWeatherAPI(api_key="test")
+        self.assertEqual(api._quantize_coordinates("47.6062", "-122.3321"),
+                         ("47.61", "-122.33"))
+        self.assertEqual(api._quantize_coordinates("47.60621", "-122.33209"),
+                         ("47.61", "-122.33"))
+        self.assertEqual(api._quantize_coordinates("-0.001", "0.001"),
+                         ("0.00", "0.00"))
+
+        api.coordinate_precision = 1
+        self.assertEqual(api._quantize_coordinates("47.6062", "-122.3321"),
+                         ("47.6", "-122.3"))
+
+        api.coordinate_precision = None
+        self.assertEqual(api._quantize_coordinates("47.6062", "-122.3321"),
+                         ("47.6062", "-122.3321"))
+
+    def test_nearby_locations_share_request(self):
+        api = OpenWeatherAPI(api_key="test")
+        url = self._get_requested_url(api, "47.6062", "-122.3321")
+        self.assertIn("lat=47.61&lon=-122.33", url)
+        self.assertEqual(url, self._get_requested_url(api, "47.60621",
+                                                      "-122.33209"))
+
+    def test_affinity_key(self):
+        api = OpenWeatherAPI(api_key="test")
+        key = api.get_affinity_key(lat="47.6062", lng="-122.3321")
+        self.assertEqual(key, api.get_cache_key(
+            self._get_requested_url(api, "47.6062", "-122.3321")))
+        # Units are converted locally, so they share a request
+        self.assertEqual(key, api.get_affinity_key(
+            lat="47.60621", lon="-122.33209", units="imperial"))
+        self.assertNotEqual(key, api.get_affinity_key(lat="47.7",
+                                                      lng="-122.3321"))
+        self.assertIsNone(api.get_affinity_key(lat="47.6062"))
+        self.assertIsNone(api.get_affinity_key(lat="north", lng="west"))
+
+
+METRIC_ONECALL = {
+    "lat": 47.68, "lon": -122.21, "timezone_offset": -25200,
+    "current": {"temp": 20.0, "feels_like": 19.5, "pressure": 1015,
+                "dew_point": 10.0, "visibility": 10000, "wind_speed": 5.0,
+                "wind_gust": 10.0, "rain": {"1h": 0.5},
+                "weather": [{"id": 500, "main": "Rain",
+                             "description": "light rain", "icon": "10d"}]},
+    "hourly": [{"temp": -40.0, "wind_speed": 0}],
+    "daily": [{"temp": {"day": 25.0, "min": 0.0, "max": 30.0},
+               "feels_like": {"day": 24.0}, "wind_speed": 1.0,
+               "rain": 2.5}]}
+
+
+def _mock_response(data: dict, status_code: int = 200) -> Response:
+    response = Response()
+    response.status_code = status_code
+    response._content = json.dumps(data).encode("utf-8")
+    response.encoding = "utf-8"
+    return response
+
+
+class TestOpenWeatherUnits(unittest.TestCase):
+    def setUp(self) -> None:
+        self.api = OpenWeatherAPI(api_key="test")
+        self.api.get_with_cache_timeout = Mock(
+            return_value=_mock_response(METRIC_ONECALL))
+
+    def test_single_upstream_units(self):
+        self.api.handle_query(lat="47.68", lng="-122.21", units="metric")
+        self.api.handle_query(lat="47.68", lng="-122.21", units="imperial")
+        urls = {c[0][0] for c in self.api.get_with_cache_timeout.call_args_list}
+        self.assertEqual(len(urls), 1)
+        self.assertIn("units=metric", urls.pop())
+
+    def test_metric_unchanged(self):
+        resp = self.api.handle_query(lat="47.68", lng="-122.21",
+                                     units="metric")
+        self.assertEqual(resp["status_code"], 200)
+        self.assertEqual(resp["encoding"], "utf-8")
+        self.assertEqual(resp["content"],
+                         json.dumps(METRIC_ONECALL).encode("utf-8"))
+
+    def test_imperial_conversion(self):
+        resp = self.api.handle_query(lat="47.68", lng="-122.21",
+                                     units="imperial")
+        self.assertEqual(resp["status_code"], 200)
+        data = json.loads(resp["content"])
+        self.assertEqual(data["current"]["temp"], 68.0)
+        self.assertEqual(data["current"]["feels_like"], 67.1)
+        self.assertEqual(data["current"]["dew_point"], 50.0)
+        self.assertEqual(data["current"]["wind_speed"], 11.18)
+        self.assertEqual(data["current"]["wind_gust"], 22.37)
+        self.assertEqual(data["hourly"][0]["temp"], -40.0)
+        self.assertEqual(data["daily"][0]["temp"],
+                         {"day": 77.0, "min": 32.0, "max": 86.0})
+        self.assertEqual(data["daily"][0]["feels_like"], {"day": 75.2})
+        # Unit-independent values are unchanged
+        self.assertEqual(data["current"]["pressure"], 1015)
+        self.assertEqual(data["current"]["visibility"], 10000)
+        self.assertEqual(data["current"]["rain"], {"1h": 0.5})
+        self.assertEqual(data["daily"][0]["rain"], 2.5)
+        self.assertEqual(data["current"]["weather"],
+                         METRIC_ONECALL["current"]["weather"])
+
+    def test_handle_query_async(self):
+        self.api.get_with_cache_timeout_async = AsyncMock(
+            return_value=_mock_response(METRIC_ONECALL))
+        resp = asyncio.run(self.api.handle_query_async(
+            lat="47.68", lng="-122.21", units="imperial"))
+        self.assertEqual(resp, self.api.handle_query(
+            lat="47.68", lng="-122.21", units="imperial"))
+        self.assertEqual(self.api.get_with_cache_timeout_async.call_args,
+                         self.api.get_with_cache_timeout.call_args)
+        resp = asyncio.run(self.api.handle_query_async(lat="47.68"))
+        self.assertEqual(resp["status_code"], -1)
+
+    def test_convert_round_trip(self):
+        for units in ("imperial", "standard"):
+            converted = self.api._convert_units(METRIC_ONECALL, "metric",
+                                                units)
+            self.assertEqual(self.api._convert_units(converted, units,
+                                                     "metric"),
+                             METRIC_ONECALL)
+
+    def test_error_response_unchanged(self):
+        error = {"cod": 400, "message": "wrong latitude"}
+        self.api.get_with_cache_timeout = Mock(
+            return_value=_mock_response(error, 400))
+        resp = self.api.handle_query(lat="47.68", lng="-122.21",
+                                     units="imperial")
+        self.assertEqual(resp["status_code"], 400)
+        self.assertEqual(json.loads(resp["content"]), error)
+
+
+class TestOpenWeatherLanguages(unittest.TestCase):
+    def setUp(self) -> None:
+        self.api = OpenWeatherAPI(api_key="test")
+        self.api.get_with_cache_timeout = Mock(
+            return_value=_mock_response(METRIC_ONECALL))
+
+    def test_supported_language_localized(self):
+        resp = self.api.handle_query(lat="47.68", lng="-122.21",
+                                     units="metric", lang="es")
+        self.assertEqual(resp["status_code"], 200)
+        data = json.loads(resp["content"])
+        self.assertEqual(data["current"]["weather"][0]["description"],
+                         "lluvia ligera")
+        self.assertEqual(data["current"]["weather"][0]["main"], "Rain")
+        self.assertEqual(data["current"]["temp"], 20.0)
+        self.assertIn("lang=en",
+                      self.api.get_with_cache_timeout.call_args[0][0])
+
+    def test_languages_share_request(self):
+        for lang in ("en", "es", "fr", "de", "it", "pt_br"):
+            self.api.handle_query(lat="47.68", lng="-122.21", lang=lang)
+        urls = {c[0][0] for c in self.api.get_with_cache_timeout.call_args_list}
+        self.assertEqual(len(urls), 1)
+
+    def test_unsupported_language_requested_upstream(self):
+        resp = self.api.handle_query(lat="47.68", lng="-122.21",
+                                     units="metric", lang="uk")
+        self.assertIn("lang=uk",
+                      self.api.get_with_cache_timeout.call_args[0][0])
+        self.assertEqual(json.loads(resp["content"]), METRIC_ONECALL)
+
+    def test_get_condition_descriptions(self):
+        from neon_api_proxy.services.owm_conditions import \
+            get_condition_descriptions, CONDITION_DESCRIPTIONS
+        self.assertEqual(get_condition_descriptions("es")[800], "cielo claro")
+        self.assertEqual(get_condition_descriptions("pt-BR"),
+                         CONDITION_DESCRIPTIONS["pt"])
+        self.assertEqual(get_condition_descriptions("uk"), dict())
+        for table in CONDITION_DESCRIPTIONS.values():
+            self.assertEqual(set(table), set(CONDITION_DESCRIPTIONS["en"]))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -27,12 +27,21 @@
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os
+import sys
 import unittest
 import socket
+import socketserver
 
+from threading import Thread
+import msgpack
+from mock.mock import Mock
 from neon_mq_connector.utils.network_utils import b64_to_dict, dict_to_b64
 from neon_utils.socket_utils import get_packet_data
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from neon_api_proxy.socket_handler import NeonAPITCPHandler
+from neon_api_proxy.wire_format import is_msgpack
+
 VALID_WOLFRAM_QUERY = {
     "service": "wolfram_alpha",
     "query": "how far away is Rome?",
@@ -61,5 +70,42 @@ class TestTCPSocket(unittest.TestCase):
             self.assertTrue(b'wolfram' in converted_data['content'])
 
 
+
+class TestTCPHandler(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0),
+                                                     NeonAPITCPHandler)
+        cls.server.controller = Mock()
+        cls.server.controller.resolve_query.side_effect = lambda _: {
+            "status_code": 200, "content": b"\x89PNG", "encoding": None}
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def _request(self, data: bytes) -> bytes:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.connect(self.server.server_address)
+            s.sendall(data)
+            return get_packet_data(s, sequentially=True)
+
+    def test_is_msgpack(self):
+        self.assertTrue(is_msgpack(msgpack.packb({"service": "test"})))
+        self.assertFalse(is_msgpack(dict_to_b64({"service": "test"})))
+        self.assertFalse(is_msgpack(b""))
+
+    def test_b64_request(self):
+        response = b64_to_dict(self._request(dict_to_b64({"service": "test"})))
+        self.assertEqual(response["status_code"], 200)
+
+    def test_msgpack_request(self):
+        response = msgpack.unpackb(self._request(
+            msgpack.packb({"service": "test"})))
+        self.assertEqual(response["content"], b"\x89PNG")
+
+
 if __name__ == '__main__':
     unittest.main()
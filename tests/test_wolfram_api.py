@@ -26,10 +26,14 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE,  EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import asyncio
 import os
 import sys
 import unittest
 
+from mock.mock import AsyncMock
+from requests import Response
+
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from neon_api_proxy.wolfram_api import WolframAPI, QueryUrl
 
@@ -214,5 +218,82 @@ class TestWolframAPI(unittest.TestCase):
             self.assertIsInstance(resp["content"], bytes)
 
 
+class TestWolframCacheKeys(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.api = WolframAPI(api_key="test")
+
+    def _get_key(self, **kwargs):
+        query_str = self.api._build_query_string(**kwargs)
+        return self.api.get_cache_key(
+            self.api._build_query_url(QueryUrl.SHORT, query_str))
+
+    def test_normalize_query(self):
+        for query in ("What is 2+2", "what is 2 + 2?", "  What is 2+2 ",
+                      "WHAT  IS 2 +2 ?!"):
+            self.assertEqual(self.api._normalize_query(query), "what is 2+2")
+        self.assertEqual(self.api._normalize_query("what is 10 - 3"),
+                         "what is 10-3")
+        self.assertEqual(self.api._normalize_query("New York-based"),
+                         "new york-based")
+
+    def test_equivalent_queries_share_cache_key(self):
+        key = self._get_key(query="What is 2+2", units="metric")
+        self.assertEqual(key, self._get_key(query="what is 2 + 2?",
+                                            units="metric"))
+        self.assertEqual(key, self._get_key(query="  What is 2+2 ",
+                                            units="metric"))
+        self.assertNotEqual(key, self._get_key(query="What is 2+3",
+                                               units="metric"))
+        self.assertNotEqual(key, self._get_key(query="What is 2+2",
+                                               units="imperial"))
+
+    def test_parameter_order_ignored(self):
+        url = f"{QueryUrl.SHORT}?appid=test&i=what+is+2%2B2&units=metric"
+        reordered = f"{QueryUrl.SHORT}?units=metric&i=What+is+2%2B2%3F&appid=test"
+        self.assertEqual(self.api.get_cache_key(url),
+                         self.api.get_cache_key(reordered))
+
+    def test_affinity_key(self):
+        key = self.api.get_affinity_key(query="What is 2+2", units="metric")
+        self.assertEqual(key, self._get_key(query="what is 2 + 2?",
+                                            units="metric"))
+        self.assertEqual(key, self.api.get_affinity_key(
+            query="what is 2 + 2?", units="metric", api="short",
+            message_id="test", routing_key="test"))
+        self.assertNotEqual(key, self.api.get_affinity_key(
+            query="What is 2+2", units="metric", api="spoken"))
+        self.assertIsNone(self.api.get_affinity_key(query="What is 2+2",
+                                                    api="invalid"))
+        self.assertIsNone(self.api.get_affinity_key(api="short"))
+
+    def test_handle_query_async(self):
+        response = Response()
+        response.status_code = 200
+        response._content = b"4"
+        response.encoding = "utf-8"
+        api = WolframAPI(api_key="test")
+        api.get_with_cache_timeout_async = AsyncMock(return_value=response)
+        resp = asyncio.run(api.handle_query_async(query="What is 2+2"))
+        self.assertEqual(resp, {"status_code": 200, "content": b"4",
+                                "encoding": "utf-8"})
+        api.get_with_cache_timeout_async.assert_called_once_with(
+            self.api._build_query_url(QueryUrl.SHORT,
+                                      "i=What+is+2%2B2&units=imperial"),
+            timeout=api.cache_time)
+        resp = asyncio.run(api.handle_query_async(query="What is 2+2",
+                                                  api="invalid"))
+        self.assertEqual(resp["status_code"], -1)
+
+    def test_negative_cache_policy(self):
+        self.assertIn(501, self.api.session.allowable_codes)
+        self.assertLess(self.api.get_negative_cache_seconds(501),
+                        self.api.cache_time.total_seconds())
+
+    def test_upstream_query_unchanged(self):
+        query_str = self.api._build_query_string(query="What is 2+2?")
+        self.assertEqual(query_str, "i=What+is+2%2B2%3F&units=imperial")
+
+
 if __name__ == '__main__':
     unittest.main()